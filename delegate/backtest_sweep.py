@@ -0,0 +1,400 @@
+"""
+多进程参数扫描
+
+把 BacktestPanel 的数组放进共享内存，子进程只拿到共享内存的名字和形状，直接映射成 np.ndarray，
+不需要把整份历史数据 pickle 给每个进程。每组参数跑一次 daily_backtest.backtest，
+结果逐行追加到 jsonl 文件里，中断后重新运行会跳过已经完成的参数组
+"""
+import os
+import json
+import random
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from delegate.daily_backtest import BacktestPanel, BarWindow, WindowMode, backtest, get_backtest_begin_date
+
+
+# ==============
+#  参数网格
+# ==============
+
+def expand_grid(grid: Dict[str, list]) -> List[dict]:
+    """ { 'risk_limit': [0.97, 0.95], ... } -> 所有组合，顺序固定 """
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def get_run_id(params: dict) -> str:
+    """ 同一组参数的 run_id 固定，用于断点续跑 """
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:12]
+
+
+def get_run_seed(base_seed: int, run_id: str) -> int:
+    # 和提交顺序、进程分配无关，只由 base_seed 和参数决定
+    return (base_seed + int(run_id, 16)) % (2 ** 32)
+
+
+def apply_params(conf: type, params: dict) -> type:
+    """ 在 SellConf 之类的配置类上覆盖参数，返回一个新的子类，不修改原来的配置 """
+    return type(conf.__name__, (conf,), dict(params))
+
+
+# ==============
+#  共享内存面板
+# ==============
+
+class SharedPanel:
+    """ 父进程持有共享内存，spec 可以 pickle 给子进程用 attach_panel 映射 """
+
+    def __init__(self, panel: BacktestPanel):
+        self.blocks: list[shared_memory.SharedMemory] = []
+        arrays = {'positions': panel.positions, 'offsets': panel.offsets, 'dates': panel.dates}
+        for column, arr in panel.values.items():
+            if arr.dtype == object:
+                print(f'[SharedPanel] skip non-numeric column {column}')
+                continue
+            arrays[f'values.{column}'] = arr
+
+        self.spec = {'codes': panel.codes, 'arrays': {}}
+        for name, arr in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            self.blocks.append(shm)
+            self.spec['arrays'][name] = (shm.name, arr.shape, arr.dtype.str)
+
+    def close(self) -> None:
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+
+def _attach_block(name: str) -> shared_memory.SharedMemory:
+    # 只有父进程负责 unlink，子进程附加的共享内存不能登记到自己的 resource_tracker
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)    # Python 3.13+
+    except TypeError:
+        pass
+    # 继承了父进程 tracker 的子进程（POSIX 下 fork/spawn 都会传 fd）登记只是重复，注销反而会删掉父进程的登记；
+    # 没有继承时附加会新起一个 tracker，子进程退出时它会把块当作泄漏 unlink 掉，所以要注销
+    inherited = getattr(resource_tracker._resource_tracker, '_fd', None) is not None
+    shm = shared_memory.SharedMemory(name=name)
+    if not inherited:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def attach_panel(spec: dict) -> tuple[BacktestPanel, list]:
+    """ 子进程中把共享内存映射成只读的 BacktestPanel，返回的 blocks 需要保持引用 """
+    blocks = []
+    arrays = {}
+    for name, (shm_name, shape, dtype) in spec['arrays'].items():
+        shm = _attach_block(shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+    values = {name[len('values.'):]: arr for name, arr in arrays.items() if name.startswith('values.')}
+    panel = BacktestPanel(arrays['dates'], spec['codes'], values, arrays['offsets'], arrays['positions'])
+    return panel, blocks
+
+
+# ==============
+#  结果统计
+# ==============
+
+def get_equity_stats(equity: np.ndarray) -> dict:
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) < 2 or equity[0] <= 0:
+        return {'total_return': 0.0, 'max_drawdown': 0.0, 'sharpe': 0.0}
+    daily = equity[1:] / equity[:-1] - 1
+    std = daily.std()
+    return {
+        'total_return': float(equity[-1] / equity[0] - 1),
+        'max_drawdown': float(np.max(1 - equity / np.maximum.accumulate(equity))),
+        'sharpe': float(daily.mean() / std * np.sqrt(250)) if std > 0 else 0.0,
+    }
+
+
+def get_trade_stats(trades: list[dict]) -> dict:
+    returns = np.array([trade['sell_price'] / trade['buy_price'] - 1 for trade in trades], dtype=np.float64)
+    return {
+        'trade_count': len(trades),
+        'win_rate': float(np.mean(returns > 0)) if len(returns) > 0 else 0.0,
+        'avg_return': float(returns.mean()) if len(returns) > 0 else 0.0,
+    }
+
+
+# ==============
+#  日线卖出模拟
+# ==============
+
+class SellConfStrategy:
+    """
+    用日线近似 HardSeller + FallSeller + ReturnSeller 的卖出逻辑，用来比较不同 SellConf 参数表
+
+    日线上没有盘中时间，*_time_range 不生效；止损止盈按当天 open 与触发价里更差/更好的价格成交，
+    回落类规则按收盘价判断和成交。buy_signal(window) 返回 True 时以收盘价买入
+    """
+
+    def __init__(
+        self,
+        conf: type,
+        buy_signal: Callable[[BarWindow], bool],
+        slot_count: int = 10,
+        slot_capacity: float = 10000.0,
+        seed: int = 0,
+    ):
+        self.conf = conf
+        self.buy_signal = buy_signal
+        self.slot_count = slot_count
+        self.slot_capacity = slot_capacity
+        self.rng = np.random.default_rng(seed)
+
+        self.risk_limit = getattr(conf, 'risk_limit', 0.0)
+        self.risk_tight = getattr(conf, 'risk_tight', 0.0)
+        self.earn_limit = getattr(conf, 'earn_limit', 9.999)
+        self.fall_from_top = getattr(conf, 'fall_from_top', [])
+        self.return_of_profit = getattr(conf, 'return_of_profit', [])
+
+        self.cash = slot_count * slot_capacity
+        self.holdings: Dict[str, dict] = {}
+        self.last_close: Dict[str, float] = {}
+        self.dates: list[int] = []
+        self.equity: list[float] = []
+        self.trades: list[dict] = []
+
+    def _sell(self, date: int, code: str, price: float, reason: str) -> None:
+        position = self.holdings.pop(code)
+        self.cash += position['volume'] * price
+        self.trades.append({
+            'code': code,
+            'buy_date': position['buy_date'],
+            'sell_date': int(date),
+            'buy_price': position['cost'],
+            'sell_price': float(price),
+            'reason': reason,
+        })
+
+    def _check_sell(self, date: int, code: str, window: BarWindow) -> None:
+        position = self.holdings[code]
+        held_day = position['held_day']
+        cost = position['cost']
+        max_price = position['max_price']
+        open_price = float(window.open[-1])
+        high = float(window.high[-1])
+        low = float(window.low[-1])
+        close = float(window.close[-1])
+
+        switch_lower = cost * (self.risk_limit + held_day * self.risk_tight)
+        if low <= switch_lower:
+            self._sell(date, code, min(open_price, switch_lower), 'hard_loss')
+            return
+        if high >= cost * self.earn_limit:
+            self._sell(date, code, max(open_price, cost * self.earn_limit), 'hard_earn')
+            return
+
+        for inc_min, inc_max, fall_threshold in self.fall_from_top:
+            if cost * inc_min <= max_price < cost * inc_max and close < max_price * (1 - fall_threshold):
+                self._sell(date, code, close, f'fall_{inc_min}')
+                return
+
+        for inc_min, inc_max, fall_percentage in self.return_of_profit:
+            if cost * inc_min <= max_price < cost * inc_max \
+                    and close < max_price - (max_price - cost) * fall_percentage:
+                self._sell(date, code, close, f'return_{inc_min}')
+                return
+
+        position['max_price'] = max(max_price, high)
+
+    def before_day(self, date: int) -> None:
+        for position in self.holdings.values():
+            position['held_day'] += 1
+
+    def handle_bars(self, date: int, code: str, window: BarWindow) -> None:
+        close = float(window.close[-1])
+        self.last_close[code] = close
+
+        if code in self.holdings:
+            if self.holdings[code]['held_day'] > 0:
+                self._check_sell(date, code, window)
+            return
+
+        if len(self.holdings) < self.slot_count and close > 0 and self.buy_signal(window):
+            volume = int(self.slot_capacity / close / 100) * 100
+            if volume > 0 and self.cash >= volume * close:
+                self.cash -= volume * close
+                self.holdings[code] = {
+                    'volume': volume,
+                    'cost': close,
+                    'max_price': close,
+                    'held_day': 0,
+                    'buy_date': int(date),
+                }
+
+    def after_day(self, date: int) -> None:
+        value = sum(position['volume'] * self.last_close[code] for code, position in self.holdings.items())
+        self.dates.append(int(date))
+        self.equity.append(self.cash + value)
+
+    def result(self) -> dict:
+        return {'dates': self.dates, 'equity': self.equity, 'trades': self.trades}
+
+
+class SellConfStrategyFactory:
+    """ 可以 pickle 给子进程的策略工厂：factory(params, seed) -> SellConfStrategy """
+
+    def __init__(self, conf: type, buy_signal: Callable[[BarWindow], bool], **kwargs):
+        self.conf = conf
+        self.buy_signal = buy_signal
+        self.kwargs = kwargs
+
+    def __call__(self, params: dict, seed: int) -> SellConfStrategy:
+        return SellConfStrategy(apply_params(self.conf, params), self.buy_signal, seed=seed, **self.kwargs)
+
+
+# ==============
+#  子进程
+# ==============
+
+_worker = {}
+
+
+def _init_worker(spec: dict, task: dict) -> None:
+    panel, blocks = attach_panel(spec)
+    _worker['panel'] = panel
+    _worker['blocks'] = blocks
+    _worker['task'] = task
+
+
+def _run_one(run_id: str, params: dict, seed: int) -> dict:
+    random.seed(seed)
+    np.random.seed(seed)
+
+    task = _worker['task']
+    strategy = task['factory'](params, seed)
+    backtest(
+        daily_data={},
+        stock_list=task['stock_list'],
+        start_date=task['start_date'],
+        end_date=task['end_date'],
+        bars_count=task['bars_count'],
+        handle_bars=strategy.handle_bars,
+        before_day=strategy.before_day,
+        after_day=strategy.after_day,
+        window_mode=WindowMode.ARRAY,
+        panel=_worker['panel'],
+    )
+    result = strategy.result()
+    return {
+        'run_id': run_id,
+        'params': params,
+        'seed': seed,
+        'stats': {**get_equity_stats(result['equity']), **get_trade_stats(result['trades'])},
+        'dates': [int(d) for d in result['dates']],
+        'equity': [float(v) for v in result['equity']],
+        'trades': result['trades'],
+    }
+
+
+# ==============
+#  扫描
+# ==============
+
+class ParameterSweep:
+    def __init__(
+        self,
+        daily_data: Dict[str, pd.DataFrame],
+        stock_list: List[str],
+        start_date: int,
+        end_date: int,
+        bars_count: int,
+        factory: Callable[[dict, int], object],    # 需要能 pickle，返回带 handle_bars/before_day/after_day/result 的对象
+        result_path: str,                           # jsonl，每行一组参数的结果
+        workers: int = None,
+        seed: int = 0,
+    ):
+        begin_date = get_backtest_begin_date(start_date, bars_count)
+        self.panel = BacktestPanel.build(daily_data, stock_list, begin_date, start_date, end_date)
+        self.task = {
+            'stock_list': stock_list,
+            'start_date': start_date,
+            'end_date': end_date,
+            'bars_count': bars_count,
+            'factory': factory,
+        }
+        self.result_path = result_path
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 2) - 1)
+        self.seed = seed
+
+    def load_results(self) -> Dict[str, dict]:
+        results = {}
+        if not os.path.exists(self.result_path):
+            return results
+        with open(self.result_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue    # 中断时写了一半的行
+                results[record['run_id']] = record
+        return results
+
+    def run(self, grid: Dict[str, list]) -> pd.DataFrame:
+        configs = {get_run_id(params): params for params in expand_grid(grid)}
+        results = self.load_results()
+        pending = [(run_id, params) for run_id, params in configs.items() if run_id not in results]
+        print(f'[Sweep] {len(configs)} configs, {len(configs) - len(pending)} resumed, {len(pending)} to run')
+
+        if len(pending) > 0:
+            shared = SharedPanel(self.panel)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=min(self.workers, len(pending)),
+                    initializer=_init_worker,
+                    initargs=(shared.spec, self.task),
+                ) as executor:
+                    futures = {
+                        executor.submit(_run_one, run_id, params, get_run_seed(self.seed, run_id)): run_id
+                        for run_id, params in pending
+                    }
+                    with open(self.result_path, 'a', encoding='utf-8') as f:
+                        for future in as_completed(futures):
+                            run_id = futures[future]
+                            try:
+                                record = future.result()
+                            except Exception as e:
+                                print(f'[Sweep] {run_id} {configs[run_id]} failed: {e}')
+                                continue
+                            f.write(json.dumps(record, default=str) + '\n')
+                            f.flush()
+                            results[run_id] = record
+                            print(f'[Sweep] {len(results)}/{len(configs)} {run_id} {record["stats"]}')
+            finally:
+                shared.close()
+
+        return self.get_result_table({run_id: results[run_id] for run_id in configs if run_id in results})
+
+    @staticmethod
+    def get_result_table(results: Dict[str, dict]) -> pd.DataFrame:
+        rows = []
+        for run_id, record in results.items():
+            row = {'run_id': run_id, 'seed': record['seed']}
+            row.update({f'param.{key}': json.dumps(value) for key, value in record['params'].items()})
+            row.update(record['stats'])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def get_equity_curves(self) -> pd.DataFrame:
+        """ 每列一组参数的净值曲线，index 为交易日 """
+        curves = {
+            run_id: pd.Series(record['equity'], index=record['dates'])
+            for run_id, record in self.load_results().items()
+        }
+        return pd.DataFrame(curves)
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
-from typing import Dict, List, Callable, Optional
+from typing import Dict, List, Callable, Optional, Union
 import numpy as np
 import pandas as pd
 
+from tools.utils_calendar import get_trading_calendar
+
 
 class Context:
     _instance = None
@@ -22,15 +24,170 @@ class Context:
         self.__dict__.clear()
 
 
+class WindowMode:
+    FRAME = 'frame'     # 兼容模式：每次回调传入窗口 DataFrame 的拷贝
+    ARRAY = 'array'     # 传入 BarWindow，各列都是面板数组的只读视图，不做拷贝
+
+
+class BarWindow:
+    """
+    单只股票截止当天的 K 线窗口，window.close / window['close'] 返回只读的 np.ndarray 视图
+    """
+    __slots__ = ('code', 'date', '_values', '_start', '_end', '_offset')
+
+    def __init__(self, code: str, date: int, values: Dict[str, np.ndarray], start: int, end: int, offset: int):
+        self.code = code
+        self.date = date
+        self._values = values
+        self._start = start     # 在拼接数组中的位置
+        self._end = end
+        self._offset = offset   # 该股票在拼接数组中的起点，用于还原原来的行号
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._values[column][self._start:self._end]
+
+    def __getattr__(self, column: str) -> np.ndarray:
+        try:
+            return self._values[column][self._start:self._end]
+        except KeyError:
+            raise AttributeError(column) from None
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._values.keys())
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ 拷贝成和原来 df.iloc[...].copy() 一样的 DataFrame，index 为窗口在该股票数据中的行号 """
+        index = pd.RangeIndex(self._start - self._offset, self._end - self._offset)
+        return pd.DataFrame({column: arr[self._start:self._end] for column, arr in self._values.items()}, index=index)
+
+
+class BacktestPanel:
+    """
+    回测用的 (日期 x 股票) 面板
+
+    各列把所有股票的数据按股票顺序拼成一个连续数组（每只股票内部按日期升序），
+    positions[d, c] 为第 c 只股票在第 d 个交易日的行号，当天没有数据（停牌）为 -1，
+    所以窗口永远是连续的一段，取窗口只是切片
+    """
+
+    def __init__(
+        self,
+        dates: np.ndarray,                  # 回测区间的交易日，升序
+        codes: list[str],
+        values: Dict[str, np.ndarray],      # { column: 拼接后的一维数组 }
+        offsets: np.ndarray,                # 每只股票在拼接数组中的起点，长度 len(codes) + 1
+        positions: np.ndarray,              # (len(dates), len(codes)) int32
+        frames: Optional[list[pd.DataFrame]] = None,    # 兼容模式用的原始 DataFrame，按 codes 顺序
+    ):
+        self.dates = dates
+        self.codes = codes
+        self.code_index = {code: i for i, code in enumerate(codes)}
+        self.values = values
+        self.offsets = offsets
+        self.positions = positions
+        self.frames = frames
+        for arr in self.values.values():
+            arr.setflags(write=False)
+
+    @classmethod
+    def build(
+        cls,
+        daily_data: Dict[str, pd.DataFrame],
+        stock_list: List[str],
+        begin_date: int,        # 数据起点，包含回测开始前用于凑满窗口的 K 线
+        start_date: int,
+        end_date: int,
+    ) -> 'BacktestPanel':
+        # 统一的交易日历：所有股票在回测区间出现过的日期
+        all_dates = [df['datetime'].values for df in daily_data.values()]
+        all_dates = np.concatenate(all_dates) if len(all_dates) > 0 else np.empty(0, dtype=np.int64)
+        all_dates = all_dates[(all_dates >= start_date) & (all_dates <= end_date)]
+        dates = np.unique(all_dates).astype(np.int64)
+
+        codes = []
+        frames = []
+        for code in dict.fromkeys(stock_list):
+            if code not in daily_data:
+                continue
+            df = daily_data[code]
+            datetimes = df['datetime'].values
+            df_sub = df.loc[(datetimes >= begin_date) & (datetimes <= end_date)]
+            if df_sub.empty:
+                continue
+            df_sub = df_sub.sort_values('datetime').reset_index(drop=True)
+            codes.append(code)
+            frames.append(df_sub)
+
+        columns = list(frames[0].columns) if len(frames) > 0 else []
+        lengths = np.array([len(df) for df in frames], dtype=np.int64)
+        offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        values = {}
+        for column in columns:
+            values[column] = np.concatenate([
+                df[column].values if column in df.columns else np.full(len(df), np.nan)
+                for df in frames
+            ])
+
+        positions = np.full((len(dates), len(codes)), -1, dtype=np.int32)
+        for c, df in enumerate(frames):
+            code_dates = df['datetime'].values
+            idx = np.searchsorted(dates, code_dates)
+            found = idx < len(dates)
+            found[found] = dates[idx[found]] == code_dates[found]
+            positions[idx[found], c] = np.arange(len(df), dtype=np.int32)[found]
+
+        return cls(dates, codes, values, offsets, positions, frames)
+
+    def window(self, date_idx: int, code_idx: int, bars_count: int) -> Optional[BarWindow]:
+        """ 截止第 date_idx 个交易日的 bars_count 根 K 线，不够或当天没有数据返回 None """
+        pos = self.positions[date_idx, code_idx]
+        if pos < bars_count - 1:
+            return None
+        offset = int(self.offsets[code_idx])
+        end = offset + int(pos) + 1
+        return BarWindow(self.codes[code_idx], int(self.dates[date_idx]), self.values, end - bars_count, end, offset)
+
+    def window_frame(self, date_idx: int, code_idx: int, bars_count: int) -> Optional[pd.DataFrame]:
+        """ 兼容模式：和原来一样返回窗口 DataFrame 的拷贝 """
+        if self.frames is None:
+            window = self.window(date_idx, code_idx, bars_count)
+            return None if window is None else window.to_dataframe()
+        pos = int(self.positions[date_idx, code_idx])
+        if pos < bars_count - 1:
+            return None
+        return self.frames[code_idx].iloc[pos - bars_count + 1:pos + 1].copy()
+
+
+def get_backtest_begin_date(start_date: int, bars_count: int) -> int:
+    # 窗口起点：和原来的自然日估算留同样的余量（按交易日数，不会比原来晚），
+    # 停牌的票往前多取的数据能补足 bars_count 根，否则开头几天的信号会变
+    calendar = get_trading_calendar()
+    try:
+        return calendar.prev(start_date, int(bars_count * 1.5) + 10)
+    except IndexError:
+        date_obj = datetime.strptime(str(start_date), '%Y%m%d')
+        # 7天 / 5工作日 + 10天 长假
+        new_date = date_obj - timedelta(days=int(bars_count * 1.5) + 10)
+        return int(new_date.strftime('%Y%m%d'))
+
+
 def backtest(
     daily_data: Dict[str, pd.DataFrame],
     stock_list: List[str],
     start_date: int,
     end_date: int,
     bars_count: int,
-    handle_bars: Callable[[int, str, pd.DataFrame], None],
+    handle_bars: Callable[[int, str, Union[pd.DataFrame, BarWindow]], None],
     before_day: Optional[Callable[[int], None]] = None,
-    after_day: Optional[Callable[[int], None]] = None
+    after_day: Optional[Callable[[int], None]] = None,
+    window_mode: str = WindowMode.FRAME,
+    panel: Optional[BacktestPanel] = None,
 ) -> None:
     """
     高效回测框架 - 按时间顺序逐天遍历，处理局部数据缺失
@@ -44,86 +201,34 @@ def backtest(
     hand_bars: 每只股票每根K线的回调函数
     before_day: 每日开始前的回调函数 (可选)
     after_day: 每日结束后的回调函数 (可选)
+    window_mode: WindowMode.FRAME 传入 DataFrame 拷贝（兼容），WindowMode.ARRAY 传入只读的 BarWindow
+    panel: 已经构建好的面板 (可选)，多次回测同一份数据时复用
     """
-    # 第一步：创建统一的交易日历
-    all_dates = set()
-    for df in daily_data.values():
-        mask = (df['datetime'] >= start_date) & (df['datetime'] <= end_date)
-        valid_dates = df.loc[mask, 'datetime'].unique()
-        all_dates.update(valid_dates)
+    # 第一步：把所有股票对齐到同一个 (日期 x 股票) 面板，只做一次
+    if panel is None:
+        begin_date = get_backtest_begin_date(start_date, bars_count)
+        panel = BacktestPanel.build(daily_data, stock_list, begin_date, start_date, end_date)
 
-    # 转换为排序后的日期数组（升序）
-    trade_dates = np.sort(np.array(list(all_dates)))
+    as_frame = window_mode == WindowMode.FRAME
+    code_indexes = np.array([panel.code_index.get(stock, -1) for stock in stock_list], dtype=np.int64)
+    known = code_indexes >= 0
 
-    # 第二步：为每只股票预构建索引映射
-    stock_data = {}
-    for stock in stock_list:
-        if stock not in daily_data:
-            continue
-
-        df = daily_data[stock]
-        # 筛选日期范围内的数据
-
-        date_obj = datetime.strptime(str(start_date), '%Y%m%d')
-        # 7天 / 5工作日 + 10天 长假
-        new_date = date_obj - timedelta(days=int(bars_count * 1.5) + 10)
-        begin_date = int(new_date.strftime('%Y%m%d'))
-        mask = (df['datetime'] >= begin_date) & (df['datetime'] <= end_date)
-        df_sub = df.loc[mask].copy()
-
-        if df_sub.empty:
-            continue
-
-        # 确保按日期升序排列
-        df_sub.sort_values('datetime', inplace=True)
-        df_sub.reset_index(drop=True, inplace=True)
-
-        # 创建日期到位置的映射
-        date_to_idx = {date: idx for idx, date in enumerate(df_sub['datetime'])}
-
-        # 存储处理后的数据
-        stock_data[stock] = {
-            'df': df_sub,
-            'date_to_idx': date_to_idx,
-            'min_idx': 0,
-            'max_idx': len(df_sub) - 1
-        }
-
-    # 第三步：按时间顺序遍历每个交易日
-    for current_date in trade_dates:
+    # 第二步：按时间顺序遍历每个交易日
+    for date_idx, current_date in enumerate(panel.dates):
         # 盘前处理
         if before_day:
             before_day(current_date)
 
-        # 处理当天的所有股票
-        for stock in stock_list:
-            if stock not in stock_data:
-                continue
-
-            data = stock_data[stock]
-            df = data['df']
-            date_to_idx = data['date_to_idx']
-
-            # 检查当前日期是否存在
-            if current_date not in date_to_idx:
-                continue
-
-            current_idx = date_to_idx[current_date]
-
-            # 关键修改：从当前日期倒推bar_count条数据（处理停牌导致的局部缺失）
-            # 计算窗口开始位置
-            window_start_idx = current_idx - bars_count + 1
-
-            # 如果窗口起始位置小于最小索引，则从最小索引开始
-            if window_start_idx < data['min_idx']:
-                window_start_idx = data['min_idx']
-
-            # 获取窗口数据
-            window = df.iloc[window_start_idx:current_idx + 1]
-
+        # 当天有数据且窗口凑得满 bars_count 的股票（停牌日没有行号，窗口自动跳过停牌）
+        positions = np.full(len(stock_list), -1, dtype=np.int64)
+        positions[known] = panel.positions[date_idx, code_indexes[known]]
+        for i in np.flatnonzero(positions >= bars_count - 1):
+            if as_frame:
+                window = panel.window_frame(date_idx, code_indexes[i], bars_count)
+            else:
+                window = panel.window(date_idx, code_indexes[i], bars_count)
             # 调用K线处理函数
-            if len(window) >= bars_count:
-                handle_bars(current_date, stock, window.copy())
+            handle_bars(current_date, stock_list[i], window)
 
         # 盘后处理
         if after_day:
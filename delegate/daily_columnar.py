@@ -0,0 +1,162 @@
+"""
+日线历史的列式磁盘缓存
+
+把所有 code 的日线按列拼成连续数组，每列一个 .npy 文件，另存 code -> (offset, length) 索引：
+    {root_path}/_columnar/current.json          指向当前版本
+    {root_path}/_columnar/{version}/{column}.npy
+    {root_path}/_columnar/{version}/_index.json
+
+打开时用 np.load(mmap_mode='r') 映射，多个策略进程共享同一份 page cache，
+按 code 取出的 DataFrame 直接引用映射内存，不做拷贝（只读）
+"""
+import os
+import json
+import time
+import shutil
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNAR_DIR = '_columnar'
+COLUMNAR_POINTER = 'current.json'
+COLUMNAR_INDEX = '_index.json'
+
+
+class DailyColumnar:
+    def __init__(self, root_path: str, columns: list[str]):
+        self.root_path = root_path
+        self.columnar_path = f'{root_path}/{COLUMNAR_DIR}'
+        self.columns = columns
+
+        self.version: Optional[str] = None
+        self.index: Dict[str, list] = {}            # { code: [offset, length] }
+        self.arrays: Dict[str, np.ndarray] = {}     # { column: np.memmap }
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def codes(self) -> list[str]:
+        return list(self.index.keys())
+
+    # 源 CSV 的数量和最后修改时间，用于判断列式缓存是否过期
+    def source_signature(self) -> list:
+        count = 0
+        max_mtime = 0.0
+        if not os.path.isdir(self.root_path):
+            return [count, max_mtime]
+        with os.scandir(self.root_path) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.csv') and not entry.name.startswith('_'):
+                    count += 1
+                    max_mtime = max(max_mtime, entry.stat().st_mtime)
+        return [count, max_mtime]
+
+    def _load_pointer(self) -> Optional[dict]:
+        try:
+            with open(f'{self.columnar_path}/{COLUMNAR_POINTER}', 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self) -> bool:
+        pointer = self._load_pointer()
+        if pointer is None or not os.path.isdir(f'{self.columnar_path}/{pointer["version"]}'):
+            return False
+        count, max_mtime = self.source_signature()
+        return pointer['source_count'] == count and pointer['source_mtime'] >= max_mtime
+
+    # ==============
+    #  写入
+    # ==============
+
+    def build(self, frames: Dict[str, pd.DataFrame]) -> None:
+        """ 用内存中的 { code: DataFrame } 生成一个新版本，完成后再切换指针 """
+        codes = [code for code in sorted(frames) if frames[code] is not None and len(frames[code]) > 0]
+        signature = self.source_signature()
+
+        version = f'{int(time.time() * 1000)}'
+        version_path = f'{self.columnar_path}/{version}'
+        os.makedirs(version_path, exist_ok=True)
+
+        index = {}
+        offset = 0
+        for code in codes:
+            length = len(frames[code])
+            index[code] = [offset, length]
+            offset += length
+
+        for column in self.columns:
+            parts = [frames[code][column].values for code in codes]
+            if column == 'datetime':
+                dtype = np.int64
+            elif len(parts) > 0 and all(np.issubdtype(p.dtype, np.integer) for p in parts):
+                dtype = np.int64
+            else:
+                dtype = np.float64
+            arr = np.lib.format.open_memmap(f'{version_path}/{column}.npy', mode='w+', dtype=dtype, shape=(offset,))
+            for code, part in zip(codes, parts):
+                start, length = index[code]
+                arr[start:start + length] = part
+            arr.flush()
+            del arr
+
+        with open(f'{version_path}/{COLUMNAR_INDEX}', 'w') as f:
+            json.dump(index, f)
+
+        # 指针文件原子替换，其他进程要么看到旧版本要么看到新版本
+        pointer_tmp = f'{self.columnar_path}/{COLUMNAR_POINTER}.tmp'
+        with open(pointer_tmp, 'w') as f:
+            json.dump({
+                'version': version,
+                'source_count': signature[0],
+                'source_mtime': signature[1],
+            }, f)
+        os.replace(pointer_tmp, f'{self.columnar_path}/{COLUMNAR_POINTER}')
+
+        self._remove_old_versions(keep={version, self.version})
+
+    def _remove_old_versions(self, keep: set) -> None:
+        # 旧版本可能还被其他进程映射着（Windows 下删不掉），删不掉就留到下次
+        for name in os.listdir(self.columnar_path):
+            path = f'{self.columnar_path}/{name}'
+            if name not in keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    # ==============
+    #  读取
+    # ==============
+
+    def open(self) -> bool:
+        pointer = self._load_pointer()
+        if pointer is None:
+            return False
+
+        version_path = f'{self.columnar_path}/{pointer["version"]}'
+        try:
+            with open(f'{version_path}/{COLUMNAR_INDEX}', 'r') as f:
+                index = json.load(f)
+            arrays = {column: np.load(f'{version_path}/{column}.npy', mmap_mode='r') for column in self.columns}
+        except (OSError, ValueError) as e:
+            print(f'[DailyColumnar] open {version_path} failed: {e}')
+            return False
+
+        self.version = pointer['version']
+        self.index = index
+        self.arrays = arrays
+        return True
+
+    def frame(self, code: str, days: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """ 取 code 最近 days 天的 DataFrame，各列都是映射内存的只读视图 """
+        if code not in self.index:
+            return None
+        offset, length = self.index[code]
+        start = offset if days is None else offset + max(0, length - days)
+        end = offset + length
+        return pd.DataFrame({column: self.arrays[column][start:end] for column in self.columns}, copy=False)
+
+    def frames(self, codes: Optional[Iterable[str]] = None, days: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+        if codes is None:
+            codes = self.index.keys()
+        return {code: self.frame(code, days) for code in codes if code in self.index}
@@ -1,11 +1,14 @@
 import os
 import datetime
-import time
+from typing import Optional
 
 import pandas as pd
 
+from delegate.daily_columnar import DailyColumnar
 from tools.utils_basic import symbol_to_code
 from tools.utils_cache import get_prev_trading_date
+from tools.utils_calendar import get_trading_calendar
+from tools.utils_download import DownloadEngine, get_source_bucket
 from tools.utils_remote import DataSource, ExitRight, get_daily_history, get_ts_daily_histories
 
 
@@ -23,11 +26,13 @@ class DailyHistoryCache:
         self.data_source = DailyHistory.default_data_source
         # init 之后一定set之后daily_history才不会是None
 
-    def set_data_source(self, data_source: DataSource):
+    def set_data_source(self, data_source: DataSource, kline_store=None):
         if self.daily_history is None or self.data_source != data_source:
             self.data_source = data_source
-            self.daily_history = DailyHistory(data_source=self.data_source)
+            self.daily_history = DailyHistory(data_source=self.data_source, kline_store=kline_store)
             self.daily_history.load_history_from_disk_to_memory()
+        elif kline_store is not None:
+            self.daily_history.kline_store = kline_store
 
 
 class DailyHistory:
@@ -43,20 +48,27 @@ class DailyHistory:
         root_path: str = default_root_path,
         data_source: DataSource = default_data_source,
         init_day_count: int = default_init_day_count,
+        kline_store=None,
     ):
         self.root_path = f'{root_path}_{data_source}'
         self.data_source = data_source
         self.init_day_count = init_day_count
+        self.kline_store = kline_store  # 日线存储（如 FileStore），全量下载时整只替换、增量更新时追加、除权时删除
 
         os.makedirs(root_path, exist_ok=True)
         self.cache_history: dict[str, pd.DataFrame] = {}
 
+        self.columnar = DailyColumnar(self.root_path, self.default_columns)  # 多进程共享的列式磁盘缓存
+        self.memory_codes: set[str] = set()     # 内存中有更新、和列式缓存不一致的 code
+        self.date_index: dict[str, set[int]] = {}           # { code: 已有的日期 }
+        self.pending_rows: dict[str, list[pd.DataFrame]] = {}   # { code: 待合并的新行 }
+
     def __getitem__(self, item: str) -> pd.DataFrame:
         if item not in self.cache_history:
             self.cache_history[item] = pd.DataFrame(columns=self.default_columns)
         return self.cache_history[item]
 
-    # 获取数据副本
+    # 获取数据子集，列式缓存命中时返回映射内存的只读视图，不做拷贝
     def get_subset_copy(self, codes: list[str], days: int) -> dict[str, pd.DataFrame]:
         if codes is None:
             codes = self.cache_history.keys()
@@ -66,7 +78,10 @@ class DailyHistory:
         for code in codes:
             if code in self.cache_history:
                 i += 1
-                ans[code] = self[code].tail(days).copy()
+                if code in self.columnar and code not in self.memory_codes:
+                    ans[code] = self.columnar.frame(code, days)
+                else:
+                    ans[code] = self[code].tail(days).copy()
         print(f'Find {i}/{len(codes)} codes returned.')
         return ans
 
@@ -104,33 +119,49 @@ class DailyHistory:
         start_date = get_prev_trading_date(now, forward_day + day_count)
         end_date = get_prev_trading_date(now, forward_day)
 
-        downloaded_count = 0
-        download_failure = []
-
-        group_size = 10
-        for i in range(0, len(code_list), group_size):
-            group_codes = [sub_code for sub_code in code_list[i:i + group_size]]
-
-            for code in group_codes:
-                df = get_daily_history(
-                    code=code,
-                    start_date=start_date,
-                    end_date=end_date,
-                    columns=self.default_columns,
-                    adjust=ExitRight.QFQ,
-                    data_source=self.data_source,
-                )
-                time.sleep(0.5)
-                if df is None or len(df) == 0:
-                    download_failure.append(code)
-                    continue
-                else:
-                    df.to_csv(f'{self.root_path}/{code}.csv', index=False)
-                    downloaded_count += 1
+        def fetch(code: str) -> Optional[pd.DataFrame]:
+            return get_daily_history(
+                code=code,
+                start_date=start_date,
+                end_date=end_date,
+                columns=self.default_columns,
+                adjust=ExitRight.QFQ,
+                data_source=self.data_source,
+            )
+
+        downloaded: dict[str, pd.DataFrame] = {}
+
+        def save(code: str, df: pd.DataFrame) -> None:
+            df.to_csv(f'{self.root_path}/{code}.csv', index=False)
+            if self.kline_store is not None:
+                downloaded[code] = df
 
-            print(f'[{downloaded_count}/{min(i + group_size, len(code_list))}]', group_codes)
+        # 每下载完一个就落盘并记进度，中断后重跑会跳过已完成的 code
+        report = DownloadEngine(self.data_source).run(
+            code_list, fetch, save,
+            journal_path=f'{self.root_path}/_download_progress.txt',
+            journal_key=f'{start_date}-{end_date}',
+        )
         # 有可能是当天新股没有数据，下载失败也正常
-        print(f'Download finished with {len(download_failure)} fails: {download_failure}')
+        print(f'Download finished with {len(report.failed)} fails: {report.failed}')
+
+        if self.kline_store is not None:
+            self._replace_store_klines(code_list, downloaded, set(report.failed))
+
+    def _replace_store_klines(
+        self,
+        code_list: list[str],
+        downloaded: dict[str, pd.DataFrame],
+        failed: set[str],
+    ) -> None:
+        # 上次中断时已完成、这次被跳过的 code 从 csv 读回，一起整只替换到存储层
+        for code in code_list:
+            file_path = f'{self.root_path}/{code}.csv'
+            if code not in downloaded and code not in failed and os.path.isfile(file_path):
+                downloaded[code] = pd.read_csv(file_path, usecols=self.default_columns)
+
+        if len(downloaded) > 0 and not self.kline_store.batch_replace_kline(downloaded):
+            print(f'Replace {len(downloaded)} codes in kline store failed!')
 
     def load_history_from_disk_to_memory(self, auto_update: bool = True) -> None:
         code_list = self.get_code_list()
@@ -150,6 +181,16 @@ class DailyHistory:
             print(f'Downloading missing {len(missing_codes)} codes...')
             self._download_codes(missing_codes, self.init_day_count)
 
+        self.date_index = {}
+        self.pending_rows = {}
+
+        # 列式缓存比所有 CSV 都新时直接映射，不再逐个 read_csv
+        if self.columnar.is_fresh() and self.columnar.open():
+            self.cache_history = self.columnar.frames()
+            self.memory_codes = set()
+            print(f'Mapped {len(self.cache_history)} codes from columnar cache')
+            return
+
         print(f'Loading {len(code_list)} codes...', end='')
         error_count = 0
         i = 0
@@ -165,6 +206,50 @@ class DailyHistory:
                 print(code, e)
                 error_count += 1
         print(f'\nLoading finished with {error_count}/{i} errors')
+        self.save_columnar()
+
+    # 从存储层（ClickHouse）批量读取日线直接填充内存，不经过 CSV 缓存
+    # store 需要实现 batch_get_kline，返回的 datetime 为 YYYYMMDD 整数
+    def load_history_from_store(
+        self,
+        store,
+        code_list: list[str] = None,
+        day_count: int = None,
+    ) -> int:
+        if code_list is None:
+            code_list = self.get_code_list()
+        if day_count is None:
+            day_count = self.init_day_count
+
+        now = datetime.datetime.now()
+        forward_day = 1  # 不算今天
+        start_date = get_prev_trading_date(now, forward_day + day_count, basic_format=False)
+        end_date = get_prev_trading_date(now, forward_day, basic_format=False)
+
+        print(f'Loading {len(code_list)} codes from store...', end='')
+        frames = store.batch_get_kline(code_list, start_date, end_date)
+
+        self.date_index = {}
+        self.pending_rows = {}
+        self.cache_history = {
+            code: df[self.default_columns]
+            for code, df in frames.items() if len(df) > 0
+        }
+        self.memory_codes = set(self.cache_history.keys())  # 和列式缓存无关，全部从内存读取
+        print(f'\nLoading finished with {len(self.cache_history)}/{len(code_list)} codes')
+        return len(self.cache_history)
+
+    # 重建列式缓存，并把内存中的数据替换为映射视图
+    def save_columnar(self) -> None:
+        try:
+            self.columnar.build(self.cache_history)
+        except Exception as e:
+            print('Build columnar cache failed! ', e)
+            return
+
+        if self.columnar.open():
+            self.cache_history = self.columnar.frames()
+            self.memory_codes = set()
 
     def download_all_to_disk(self, renew_code_list: bool = True) -> None:
         code_list = self.get_code_list(force_download=renew_code_list)
@@ -187,21 +272,46 @@ class DailyHistory:
         print(f'Downloading {len(gap_codes)} gap codes data of {self.init_day_count} days...')
         self._download_codes(gap_codes, self.init_day_count)
 
+    # 已有日期的索引，懒加载，缺失判断为 O(1)
+    def _get_date_index(self, code: str) -> set[int]:
+        if code not in self.date_index:
+            self.date_index[code] = set(int(d) for d in self[code]['datetime'].values)
+        return self.date_index[code]
+
+    # 新增的行先挂起，最后每个 code 只做一次 concat + sort
+    def _append_rows(self, code: str, df: pd.DataFrame) -> None:
+        date_index = self._get_date_index(code)
+        df = df[~df['datetime'].isin(date_index)].drop_duplicates(subset='datetime')
+        if len(df) == 0:
+            return
+        date_index.update(int(d) for d in df['datetime'].values)
+        self.pending_rows.setdefault(code, []).append(df)
+
+    def _merge_pending_rows(self) -> set[str]:
+        merged_codes = set()
+        for code, parts in self.pending_rows.items():
+            if self.cache_history.get(code) is not None and len(self.cache_history[code]) > 0:
+                parts = [self.cache_history[code]] + parts  # concat len = 0 的 df 会报 warning
+            df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            self.cache_history[code] = df.sort_values(by='datetime', ignore_index=True)
+            self.memory_codes.add(code)
+            merged_codes.add(code)
+        self.pending_rows = {}
+        return merged_codes
+
     # 下载具体某天的数据 TUSHARE
     def _update_codes_by_tushare(self, target_date: str, code_list: list[str]) -> set[str]:
         target_date_int = int(target_date)
         print(f'Updating {target_date} ', end='')
 
-        loss_list = []  # 找到缺失当天数据的codes
-        for code in code_list:
-            if not (self[code]['datetime'] == target_date_int).any():
-                loss_list.append(code)
+        # 找到缺失当天数据的codes
+        loss_list = [code for code in code_list if target_date_int not in self._get_date_index(code)]
 
         updated_codes = set()
-        updated_count = 0
         group_size = 990
+        bucket = get_source_bucket(DataSource.TUSHARE)
         for i in range(0, len(loss_list), group_size):
-            time.sleep(0.5)
+            bucket.acquire()
             group_codes = [sub_code for sub_code in loss_list[i:i + group_size]]
 
             dfs = get_ts_daily_histories(
@@ -214,78 +324,73 @@ class DailyHistory:
             # 填补缺失的日期
             for code in dfs:
                 df = dfs[code]
-                if len(df) == 1 and (not (self[code]['datetime'] == target_date_int).any()):
+                if len(df) == 1 and target_date_int not in self._get_date_index(code):
                     updated_codes.add(code)
-                    updated_count += 1
-                    if self.cache_history[code] is None or len(self.cache_history[code]) == 0:
-                        self.cache_history[code] = df  # concat len = 0 的 df 会报 warning
-                    else:
-                        self.cache_history[code] = pd.concat([self.cache_history[code], df], ignore_index=True)
+                    self._append_rows(code, df)
             print('.', end='')
-        print(f' {updated_count} codes updated!')
+        print(f' {len(updated_codes)} codes updated!')
         return updated_codes
 
     # 下载一段时间的数据，逐个下载
     def _update_codes_one_by_one(self, days: int, code_list: list[str]) -> set[str]:
         now = datetime.datetime.now()
-        start_date = get_prev_trading_date(now, days)
-        end_date = get_prev_trading_date(now, 1)
+        calendar = get_trading_calendar()
+        target_dates = [calendar.prev(now, forward_day) for forward_day in range(days, 0, -1)]
+        start_date = str(target_dates[0])
+        end_date = str(target_dates[-1])
         print(f'Updating {start_date} - {end_date}', end='')
 
+        # 本地已经齐全的 code 不用再下载
+        target_set = set(target_dates)
+        code_list = [code for code in code_list if not target_set.issubset(self._get_date_index(code))]
+
         updated_codes = set()
-        updated_count = 0
-        group_size = 100
-        for i in range(0, len(code_list), group_size):
-            print(f'\n[{min(i + group_size, len(code_list))}]', end='')
-            group_codes = [sub_code for sub_code in code_list[i:i + group_size]]
-            for code in group_codes:
-                df = get_daily_history(
-                    code=code,
-                    start_date=start_date,
-                    end_date=end_date,
-                    columns=self.default_columns,
-                    adjust=ExitRight.QFQ,
-                    data_source=self.data_source,
-                )
-                if df is not None and len(df) > 0:
-                    updated = False
-                    for forward_day in range(days, 0, -1):
-                        target_date_int = int(get_prev_trading_date(now, forward_day))
-                        target_date_df = df[df['datetime'] == target_date_int]
-                        if len(target_date_df) == 1 and (not (self[code]['datetime'] == target_date_int).any()):
-                            updated = True
-                            if self.cache_history[code] is None or len(self.cache_history[code]) == 0:
-                                self.cache_history[code] = target_date_df  # concat len = 0 的 df 会报 warning
-                            else:
-                                self.cache_history[code] = pd.concat(
-                                    [self.cache_history[code], target_date_df], ignore_index=True)
-                    if updated:
-                        updated_codes.add(code)
-                        updated_count += 1
-                    print('.', end='')
-                else:
-                    print('x', end='')
-        print(f' {updated_count} codes updated!')
-        return updated_codes
 
-    # # 平时手动操作补单日数据使用
-    def download_single_daily(self, target_date: str) -> None:
-        if len(self.cache_history) == 0:
-            self.load_history_from_disk_to_memory()
+        def fetch(code: str) -> Optional[pd.DataFrame]:
+            return get_daily_history(
+                code=code,
+                start_date=start_date,
+                end_date=end_date,
+                columns=self.default_columns,
+                adjust=ExitRight.QFQ,
+                data_source=self.data_source,
+            )
 
-        # self._download_gap_to_disk()  这里就先注释掉
+        def merge(code: str, df: pd.DataFrame) -> None:
+            missing = target_set - self._get_date_index(code)
+            new_rows = df[df['datetime'].isin(missing)]
+            if len(new_rows) > 0:
+                self._append_rows(code, new_rows)
+                updated_codes.add(code)
 
-        code_list = self.get_code_list()
-        updated_codes = self._update_codes_by_tushare(target_date, code_list)
-        print('Sort and Save all history data ', end='')
+        print(f', {len(code_list)} codes missing')
+        DownloadEngine(self.data_source).run(code_list, fetch, merge)
+        print(f'{len(updated_codes)} codes updated!')
+        return updated_codes
+
+    # 把合并好的数据写回 CSV，再重建列式缓存
+    def _save_updated_codes(self, updated_codes: set[str]) -> None:
+        print('Sorting and Saving all history data ', end='')
         i = 0
         for code in updated_codes:
             i += 1
             if i % 1000 == 0:
                 print('.', end='')
-            self.cache_history[code] = self[code].sort_values(by='datetime')
             self.cache_history[code].to_csv(f'{self.root_path}/{code}.csv', index=False)
         print(f'\nFinished with {i} files updated')
+        if i > 0:
+            self.save_columnar()
+
+    # # 平时手动操作补单日数据使用
+    def download_single_daily(self, target_date: str) -> None:
+        if len(self.cache_history) == 0:
+            self.load_history_from_disk_to_memory()
+
+        # self._download_gap_to_disk()  这里就先注释掉
+
+        code_list = self.get_code_list()
+        self._update_codes_by_tushare(target_date, code_list)
+        self._save_updated_codes(self._merge_pending_rows())
 
     # 更新近几日数据，不用全部下载，速度快也不容易被Ban IP
     def download_recent_daily(self, days: int) -> None:
@@ -298,25 +403,22 @@ class DailyHistory:
         # TUSHARE 支持一次下载多个票，AKSHARE & MOOTDX 只能全部扫描一遍
         if self.data_source == DataSource.TUSHARE:
             now = datetime.datetime.now()
-            all_updated_codes = set()
+            calendar = get_trading_calendar()
             for forward_day in range(days, 0, -1):
-                target_date = get_prev_trading_date(now, forward_day)
-                sub_updated_codes = self._update_codes_by_tushare(target_date, code_list)
-                all_updated_codes.update(sub_updated_codes)
+                target_date = str(calendar.prev(now, forward_day))
+                self._update_codes_by_tushare(target_date, code_list)
         else:
-            all_updated_codes = self._update_codes_one_by_one(days, code_list)
+            self._update_codes_one_by_one(days, code_list)
 
-        # 排序存储所有更新过的数据
-        print('Sorting and Saving all history data ', end='')
-        i = 0
-        for code in all_updated_codes:
-            i += 1
-            if i % 1000 == 0:
-                print('.', end='')
-            self.cache_history[code] = self[code].sort_values(by='datetime')
-            self.cache_history[code].to_csv(f'{self.root_path}/{code}.csv', index=False)
-        print(f'\nFinished with {i} files updated')
+        # 新增的行在合并前取出，一次批量追加到存储层
+        new_rows = {code: pd.concat(parts, ignore_index=True) for code, parts in self.pending_rows.items()}
+
+        # 每个更新过的 code 只合并排序一次，再存储
+        self._save_updated_codes(self._merge_pending_rows())
 
+        if self.kline_store is not None and len(new_rows) > 0:
+            if not self.kline_store.batch_append_kline(new_rows):
+                print(f'Append {len(new_rows)} codes to kline store failed!')
 
     # ==============
     #  除权更新逻辑
@@ -353,10 +455,15 @@ class DailyHistory:
     def remove_recent_exit_right_histories(self, days: int) -> None:
         codes = self.get_recent_exit_right_codes(days)
 
-        removed_count = 0
+        removed_codes = []
         for code in codes:
             print(code)
             if self.remove_single_history(code):
-                removed_count += 1
+                removed_codes.append(code)
+
+        # 存储层中的前复权数据同样失效，与 csv 一起删除
+        if self.kline_store is not None and len(removed_codes) > 0:
+            if not self.kline_store.delete_kline(removed_codes):
+                print(f'Delete {len(removed_codes)} codes from kline store failed!')
 
-        print(f'Removed {removed_count} histories with Exit Right announced')
+        print(f'Removed {len(removed_codes)} histories with Exit Right announced')
@@ -0,0 +1,137 @@
+"""
+实时行情的列式快照（struct of arrays）
+
+每个 code 固定一行，各字段一列 numpy 数组；每次推送按列批量写入，
+同时记录自上次 pop_dirty() 以来有变化的 code，策略只需扫描这些 code
+"""
+from typing import Dict, Iterable, Optional, Set
+
+import numpy as np
+
+
+SNAPSHOT_BOOK_LEVEL = 5
+SNAPSHOT_CHUNK_SIZE = 1024
+
+SNAPSHOT_FIELDS = {
+    'time': np.int64,           # 毫秒时间戳
+    'lastPrice': np.float64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'lastClose': np.float64,
+    'volume': np.int64,
+    'amount': np.float64,
+}
+
+SNAPSHOT_BOOK_FIELDS = {
+    'askPrice': np.float64,
+    'askVol': np.int64,
+    'bidPrice': np.float64,
+    'bidVol': np.int64,
+}
+
+
+def _book_row(values: Optional[list]) -> list:
+    # 盘口不足5档的补0，非数字的按0处理
+    if not values:
+        return [0] * SNAPSHOT_BOOK_LEVEL
+    row = [v if isinstance(v, (int, float)) else 0 for v in values[:SNAPSHOT_BOOK_LEVEL]]
+    row += [0] * (SNAPSHOT_BOOK_LEVEL - len(row))
+    return row
+
+
+class QuoteSnapshot:
+    def __init__(self, capacity: int = SNAPSHOT_CHUNK_SIZE):
+        self.index: Dict[str, int] = {}     # { code: row }
+        self.codes: list[str] = []          # row -> code
+        self.columns: Dict[str, np.ndarray] = {}
+        self._dirty: Set[str] = set()
+        self._alloc(max(1, capacity))
+
+    def _alloc(self, capacity: int) -> None:
+        old = self.columns
+        self.columns = {}
+        for field, dtype in SNAPSHOT_FIELDS.items():
+            self.columns[field] = np.zeros(capacity, dtype=dtype)
+        for field, dtype in SNAPSHOT_BOOK_FIELDS.items():
+            self.columns[field] = np.zeros((capacity, SNAPSHOT_BOOK_LEVEL), dtype=dtype)
+        for field, arr in old.items():
+            self.columns[field][:len(arr)] = arr
+
+    @property
+    def capacity(self) -> int:
+        return len(self.columns['time'])
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def _rows_of(self, codes: list[str]) -> np.ndarray:
+        for code in codes:
+            if code not in self.index:
+                self.index[code] = len(self.codes)
+                self.codes.append(code)
+
+        if len(self.codes) > self.capacity:
+            chunks = (len(self.codes) - self.capacity - 1) // SNAPSHOT_CHUNK_SIZE + 1
+            self._alloc(self.capacity + chunks * SNAPSHOT_CHUNK_SIZE)
+
+        return np.fromiter((self.index[code] for code in codes), dtype=np.int64, count=len(codes))
+
+    def update(self, quotes: Dict[str, Dict]) -> None:
+        """ 按列批量写入一次推送，调用方负责加锁 """
+        if not quotes:
+            return
+
+        codes = list(quotes.keys())
+        values = list(quotes.values())
+        rows = self._rows_of(codes)
+
+        for field, dtype in SNAPSHOT_FIELDS.items():
+            self.columns[field][rows] = np.fromiter(
+                (q.get(field, 0) or 0 for q in values), dtype=dtype, count=len(values))
+
+        for field, dtype in SNAPSHOT_BOOK_FIELDS.items():
+            try:
+                # 绝大多数推送都是完整的5档数字，直接整体转换
+                book = np.array([q[field] for q in values], dtype=dtype)
+                if book.ndim != 2 or book.shape[1] != SNAPSHOT_BOOK_LEVEL or np.isnan(book).any():
+                    raise ValueError
+            except (KeyError, TypeError, ValueError):
+                book = np.array([_book_row(q.get(field)) for q in values], dtype=dtype)
+            self.columns[field][rows] = book
+
+        self._dirty.update(codes)
+
+    def pop_dirty(self) -> Set[str]:
+        """ 取出自上次调用以来有更新的 code 集合并重置 """
+        dirty = self._dirty
+        self._dirty = set()
+        return dirty
+
+    def column(self, field: str, codes: Optional[Iterable[str]] = None) -> np.ndarray:
+        """ 取某一列；不指定 codes 时返回全部已知 code 的只读视图 """
+        arr = self.columns[field]
+        if codes is None:
+            view = arr[:len(self.codes)]
+            view.flags.writeable = False
+            return view
+        return arr[[self.index[code] for code in codes]]
+
+    def get(self, code: str) -> Optional[Dict]:
+        """ 还原为 QMT quote 格式的 dict """
+        row = self.index.get(code)
+        if row is None:
+            return None
+        quote = {field: self.columns[field][row].item() for field in SNAPSHOT_FIELDS}
+        quote.update({field: self.columns[field][row].tolist() for field in SNAPSHOT_BOOK_FIELDS})
+        return quote
+
+    def clear(self) -> None:
+        self.index.clear()
+        self.codes.clear()
+        self._dirty.clear()
+        self.columns = {}
+        self._alloc(SNAPSHOT_CHUNK_SIZE)
@@ -0,0 +1,172 @@
+"""
+策略异步执行
+
+行情回调线程只负责把快照放入有界的合并队列，由独立的策略线程取最新的快照执行，
+积压的中间快照直接丢弃（cache_quotes 本身就是累积合并的，丢弃不会丢失行情），
+避免慢策略阻塞下一次行情推送导致 callback_monitor 误报中断
+"""
+import time
+import threading
+import traceback
+from collections import deque
+from typing import Callable, Dict, Optional
+
+
+class StrategySnapshot:
+    __slots__ = ('curr_date', 'curr_time', 'curr_seconds', 'quotes', 'created_at')
+
+    def __init__(self, curr_date: str, curr_time: str, curr_seconds: str, quotes: Dict[str, Dict]):
+        self.curr_date = curr_date          # str(%Y-%m-%d)
+        self.curr_time = curr_time          # str(%H:%M)
+        self.curr_seconds = curr_seconds    # str(%S)
+        self.quotes = quotes
+        self.created_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class SnapshotQueue:
+    """ 有界合并队列：满了丢最旧的，取的时候只要最新的 """
+
+    def __init__(self, maxsize: int = 8):
+        self._items = deque(maxlen=max(1, maxsize))
+        self._cond = threading.Condition()
+
+    def put(self, item) -> int:
+        """ 放入快照，返回因队列已满被挤掉的数量 """
+        with self._cond:
+            dropped = 1 if len(self._items) == self._items.maxlen else 0
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get_latest(self, timeout: Optional[float] = None) -> tuple[Optional[object], int]:
+        """ 取出最新的快照，返回 (快照, 被跳过的旧快照数)，超时返回 (None, 0) """
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None, 0
+            item = self._items.pop()
+            skipped = len(self._items)
+            self._items.clear()
+            return item, skipped
+
+    def wake(self) -> None:
+        """ 唤醒等待中的 get_latest，停止时使用 """
+        with self._cond:
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+
+class StrategyWorker:
+    def __init__(self, handler: Callable[[StrategySnapshot], None], maxsize: int = 8, name: str = 'strategy'):
+        self.handler = handler
+        self.queue = SnapshotQueue(maxsize)
+        self.name = name
+
+        self._running = False
+        self._drain = True          # 停止时是否执行队列中剩余的最新快照
+        self._thread: Optional[threading.Thread] = None
+        self._lock_metrics = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self) -> None:
+        self._metrics = {
+            'submitted': 0,         # 放入队列的快照数
+            'executed': 0,          # 实际执行的快照数
+            'skipped': 0,           # 被更新快照合并跳过的数量
+            'dropped': 0,           # 队列满被挤掉的数量
+            'errors': 0,            # 执行出错次数
+            'max_depth': 0,         # 最大队列深度
+            'last_age': 0.0,        # 最近一次执行时快照的延迟（秒）
+            'max_age': 0.0,         # 最大快照延迟（秒）
+            'total_age': 0.0,
+            'last_cost': 0.0,       # 最近一次执行耗时（秒）
+            'max_cost': 0.0,        # 最大执行耗时（秒）
+        }
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}_worker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0, drain: bool = True) -> None:
+        """
+        停止策略线程并等待退出
+        drain=True 时先执行队列中剩余的最新快照（收盘时），否则丢弃并打印数量（退出进程时）
+        """
+        self._drain = drain
+        self._running = False
+        self.queue.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                print(f'[{self.name}] 策略线程 {timeout} 秒内没有退出')
+            else:
+                self._thread = None
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, snapshot: StrategySnapshot) -> None:
+        dropped = self.queue.put(snapshot)
+        depth = self.queue.qsize()
+        with self._lock_metrics:
+            self._metrics['submitted'] += 1
+            self._metrics['dropped'] += dropped
+            self._metrics['max_depth'] = max(self._metrics['max_depth'], depth)
+
+    def _run(self) -> None:
+        while self._running:
+            snapshot, skipped = self.queue.get_latest(timeout=0.5)
+            if snapshot is not None:
+                self._execute(snapshot, skipped)
+
+        # 停止后队列中剩下的快照
+        snapshot, skipped = self.queue.get_latest(timeout=0)
+        if snapshot is not None:
+            if self._drain:
+                print(f'[{self.name}] 停止前执行最新的快照，跳过 {skipped} 个旧快照')
+                self._execute(snapshot, skipped)
+            else:
+                print(f'[{self.name}] 停止时丢弃 {skipped + 1} 个未执行的快照')
+
+    def _execute(self, snapshot: StrategySnapshot, skipped: int) -> None:
+        age = snapshot.age()
+        t0 = time.monotonic()
+        error = False
+        try:
+            self.handler(snapshot)
+        except Exception as e:
+            error = True
+            print(f'[{self.name}] 策略执行出错: {e}')
+            traceback.print_exc()
+        cost = time.monotonic() - t0
+
+        with self._lock_metrics:
+            m = self._metrics
+            m['executed'] += 1
+            m['skipped'] += skipped
+            m['errors'] += int(error)
+            m['last_age'] = age
+            m['max_age'] = max(m['max_age'], age)
+            m['total_age'] += age
+            m['last_cost'] = cost
+            m['max_cost'] = max(m['max_cost'], cost)
+
+    def metrics(self, reset: bool = False) -> Dict[str, float]:
+        with self._lock_metrics:
+            ans = dict(self._metrics)
+            if reset:
+                self._reset_metrics()
+        total_age = ans.pop('total_age')
+        ans['avg_age'] = total_age / ans['executed'] if ans['executed'] > 0 else 0.0
+        ans['queue_depth'] = self.queue.qsize()
+        return ans
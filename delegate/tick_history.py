@@ -0,0 +1,256 @@
+"""
+盘中 tick 历史的列式内存缓存
+
+每个 code 一个 TickBuffer，按列预分配 numpy 数组，写满后按块扩容，
+避免每个 tick 生成嵌套 list 或 DataFrame.loc 逐行追加带来的内存和 GC 开销
+
+读取方式：
+    buffer.times / buffer.prices ...    零拷贝的只读视图（长度为当前 tick 数）
+    buffer[i]                           兼容旧版的单行 list 格式
+"""
+import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+TICK_BOOK_LEVEL = 5         # 盘口档位
+TICK_CHUNK_SIZE = 1024      # 每次扩容的行数（4小时3秒一个tick约4800行）
+
+TICK_DF_COLUMNS = ['time', 'price', 'high', 'low', 'volume', 'amount'] \
+    + [f'askPrice{i}' for i in range(1, TICK_BOOK_LEVEL + 1)] \
+    + [f'askVol{i}' for i in range(1, TICK_BOOK_LEVEL + 1)] \
+    + [f'bidPrice{i}' for i in range(1, TICK_BOOK_LEVEL + 1)] \
+    + [f'bidVol{i}' for i in range(1, TICK_BOOK_LEVEL + 1)]
+
+
+def seconds_to_time_str(seconds: int) -> str:
+    """ 当日秒数 -> %H:%M:%S """
+    seconds = int(seconds)
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def time_str_to_seconds(time_str: str) -> int:
+    """ %H:%M:%S 或 %H:%M -> 当日秒数 """
+    parts = [int(p) for p in time_str.split(':')]
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def quote_time_to_seconds(quote_time_ms: int) -> int:
+    """ QMT quote['time'] 毫秒时间戳 -> 当日秒数（本地时区） """
+    t = datetime.datetime.fromtimestamp(quote_time_ms / 1000)
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+# 列名、dtype、宽度（盘口为5档二维），用于列式导出与恢复
+TICK_COLUMNS = [
+    ('time', np.int32, 1),
+    ('price', np.float64, 1),
+    ('high', np.float64, 1),
+    ('low', np.float64, 1),
+    ('volume', np.int64, 1),
+    ('amount', np.float64, 1),
+    ('ask_price', np.float64, TICK_BOOK_LEVEL),
+    ('ask_vol', np.int64, TICK_BOOK_LEVEL),
+    ('bid_price', np.float64, TICK_BOOK_LEVEL),
+    ('bid_vol', np.int64, TICK_BOOK_LEVEL),
+]
+
+
+def _fill_book(target: np.ndarray, values: list) -> None:
+    # 盘口不足5档的补0，非数字的按0处理
+    for i in range(TICK_BOOK_LEVEL):
+        v = values[i] if i < len(values) else 0
+        target[i] = v if isinstance(v, (int, float)) else 0
+
+
+class TickBuffer:
+    __slots__ = (
+        '_size', '_time', '_price', '_high', '_low', '_volume', '_amount',
+        '_ask_price', '_ask_vol', '_bid_price', '_bid_vol',
+    )
+
+    def __init__(self, capacity: int = TICK_CHUNK_SIZE):
+        self._size = 0
+        for name, arr in zip(self.__slots__[1:], self._alloc(max(1, capacity))):
+            setattr(self, name, arr)
+
+    @staticmethod
+    def _alloc(capacity: int) -> list:
+        # 顺序与 __slots__[1:] 一致
+        return [
+            np.zeros(capacity, dtype=np.int32),                         # 成交时间（当日秒数）
+            np.zeros(capacity, dtype=np.float64),                       # 成交价格
+            np.zeros(capacity, dtype=np.float64),                       # 成交最高价
+            np.zeros(capacity, dtype=np.float64),                       # 成交最低价
+            np.zeros(capacity, dtype=np.int64),                         # 累计成交量（手）
+            np.zeros(capacity, dtype=np.float64),                       # 累计成交额（元）
+            np.zeros((capacity, TICK_BOOK_LEVEL), dtype=np.float64),    # 卖盘价
+            np.zeros((capacity, TICK_BOOK_LEVEL), dtype=np.int64),      # 卖盘量
+            np.zeros((capacity, TICK_BOOK_LEVEL), dtype=np.float64),    # 买盘价
+            np.zeros((capacity, TICK_BOOK_LEVEL), dtype=np.int64),      # 买盘量
+        ]
+
+    def _grow(self) -> None:
+        # 先在新数组里拷好已有的行再替换，其他线程不加锁读取时不会看到清零的数组
+        names = self.__slots__[1:]
+        arrays = self._alloc(self.capacity + TICK_CHUNK_SIZE)
+        for name, arr in zip(names, arrays):
+            arr[:self._size] = getattr(self, name)[:self._size]
+        for name, arr in zip(names, arrays):
+            setattr(self, name, arr)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._time)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, quote: dict) -> None:
+        if self._size >= self.capacity:
+            self._grow()
+
+        i = self._size
+        self._time[i] = quote_time_to_seconds(quote['time'])
+        self._price[i] = quote['lastPrice']
+        self._high[i] = quote['high']
+        self._low[i] = quote['low']
+        self._volume[i] = int(quote['volume'])
+        self._amount[i] = quote['amount']
+        _fill_book(self._ask_price[i], quote['askPrice'])
+        _fill_book(self._ask_vol[i], quote['askVol'])
+        _fill_book(self._bid_price[i], quote['bidPrice'])
+        _fill_book(self._bid_vol[i], quote['bidVol'])
+        self._size = i + 1
+
+    # -----------------------
+    # 只读视图（不拷贝）
+    # -----------------------
+    def _view(self, arr: np.ndarray) -> np.ndarray:
+        view = arr[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._view(self._time)
+
+    @property
+    def prices(self) -> np.ndarray:
+        return self._view(self._price)
+
+    @property
+    def highs(self) -> np.ndarray:
+        return self._view(self._high)
+
+    @property
+    def lows(self) -> np.ndarray:
+        return self._view(self._low)
+
+    @property
+    def volumes(self) -> np.ndarray:
+        return self._view(self._volume)
+
+    @property
+    def amounts(self) -> np.ndarray:
+        return self._view(self._amount)
+
+    @property
+    def ask_prices(self) -> np.ndarray:
+        return self._view(self._ask_price)
+
+    @property
+    def ask_vols(self) -> np.ndarray:
+        return self._view(self._ask_vol)
+
+    @property
+    def bid_prices(self) -> np.ndarray:
+        return self._view(self._bid_price)
+
+    @property
+    def bid_vols(self) -> np.ndarray:
+        return self._view(self._bid_vol)
+
+    # -----------------------
+    # 列式导出与恢复
+    # -----------------------
+    def columns(self, start: int = 0, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """ 取 [start, end) 行的各列视图，end 默认为当前 tick 数 """
+        end = self._size if end is None else min(end, self._size)
+        return {name: getattr(self, f'_{name}')[start:end] for name, _, _ in TICK_COLUMNS}
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> 'TickBuffer':
+        rows = len(columns['time'])
+        buffer = cls(capacity=rows)
+        for name, _, _ in TICK_COLUMNS:
+            getattr(buffer, f'_{name}')[:rows] = columns[name]
+        buffer._size = rows
+        return buffer
+
+    # -----------------------
+    # 兼容旧版 list 格式
+    # -----------------------
+    def __getitem__(self, i: int) -> list:
+        if i < 0:
+            i += self._size
+        if i < 0 or i >= self._size:
+            raise IndexError('tick index out of range')
+        return [
+            seconds_to_time_str(self._time[i]),             # 成交时间，格式：%H:%M:%S
+            round(float(self._price[i]), 3),                # 成交价格
+            round(float(self._high[i]), 3),                 # 成交最高价
+            round(float(self._low[i]), 3),                  # 成交最最低价
+            int(self._volume[i]),                           # 累计成交量（手）
+            round(float(self._amount[i]), 3),               # 累计成交额（元）
+            [round(p, 3) for p in self._ask_price[i].tolist()],    # 卖价
+            self._ask_vol[i].tolist(),                              # 卖量
+            [round(p, 3) for p in self._bid_price[i].tolist()],    # 买价
+            self._bid_vol[i].tolist(),                              # 买量
+        ]
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def to_list(self) -> list[list]:
+        return [self[i] for i in range(self._size)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        n = self._size
+        data = {
+            'time': [seconds_to_time_str(t) for t in self._time[:n]],
+            'price': self._price[:n],
+            'high': self._high[:n],
+            'low': self._low[:n],
+            'volume': self._volume[:n],
+            'amount': self._amount[:n],
+        }
+        for key, arr in [
+            ('askPrice', self._ask_price), ('askVol', self._ask_vol),
+            ('bidPrice', self._bid_price), ('bidVol', self._bid_vol),
+        ]:
+            for j in range(TICK_BOOK_LEVEL):
+                data[f'{key}{j + 1}'] = arr[:n, j]
+        return pd.DataFrame(data, columns=TICK_DF_COLUMNS)
+
+
+class TickHistory(dict):
+    """ { code: TickBuffer } """
+
+    def record(self, quotes: Dict[str, Dict]) -> None:
+        for code in quotes:
+            buffer: Optional[TickBuffer] = self.get(code)
+            if buffer is None:
+                buffer = TickBuffer()
+                self[code] = buffer
+            buffer.append(quotes[code])
+
+    def to_lists(self) -> Dict[str, list]:
+        return {code: buffer.to_list() for code, buffer in self.items()}
+
+    def to_dataframes(self) -> Dict[str, pd.DataFrame]:
+        return {code: buffer.to_dataframe() for code, buffer in self.items()}
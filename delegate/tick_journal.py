@@ -0,0 +1,231 @@
+"""
+盘中 tick 历史的分段二进制日志
+
+盘中定时把每个 code 新增的 tick 增量写入一个段文件（segment），收盘后合并为一个段：
+    root/{YYYYMMDD}/seg_00001.tj
+    root/{YYYYMMDD}/seg_00002.tj
+    ...
+
+段文件格式：
+    MAGIC(4) | VERSION(1) | block ... | footer(json) | footer_len(uint32) | MAGIC(4)
+
+    block   每个 code 一块，各列原始字节按 TICK_COLUMNS 顺序拼接后 zlib 压缩
+    footer  { "codes": { code: [offset, length, rows] }, "covers": 合并段包含的最大段编号 }
+
+读取时 mmap 段文件，只解析尾部索引，按 offset 定位解压单个 code 的数据块
+合并段写入后才删除旧段，中途崩溃时读取方按 covers 跳过已被合并的旧段，不会重复读取
+"""
+import os
+import json
+import mmap
+import glob
+import zlib
+import struct
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from delegate.tick_history import TICK_COLUMNS, TickBuffer
+
+
+JOURNAL_MAGIC = b'SQTJ'
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = '.tj'
+JOURNAL_TRAILER = struct.Struct('<I4s')     # footer_len, MAGIC
+JOURNAL_COMPRESS_LEVEL = 1                  # 盘中写入优先速度
+
+
+def _encode_block(columns: Dict[str, np.ndarray]) -> bytes:
+    raw = b''.join(np.ascontiguousarray(columns[name], dtype=dtype).tobytes() for name, dtype, _ in TICK_COLUMNS)
+    return zlib.compress(raw, JOURNAL_COMPRESS_LEVEL)
+
+
+def _decode_block(data: bytes, rows: int) -> Dict[str, np.ndarray]:
+    raw = zlib.decompress(data)
+    columns = {}
+    offset = 0
+    for name, dtype, width in TICK_COLUMNS:
+        count = rows * width
+        arr = np.frombuffer(raw, dtype=dtype, count=count, offset=offset)
+        columns[name] = arr.reshape(rows, width) if width > 1 else arr
+        offset += count * np.dtype(dtype).itemsize
+    return columns
+
+
+def segment_seq(path: str) -> int:
+    return int(os.path.basename(path)[4:-len(JOURNAL_SUFFIX)])
+
+
+def write_segment(path: str, blocks: Dict[str, Dict[str, np.ndarray]], covers: int = 0) -> None:
+    """ 写入一个段文件：{ code: 列数据 }，先写临时文件再原子替换；covers 为合并段包含的最大段编号 """
+    index = {}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(JOURNAL_MAGIC)
+        f.write(bytes([JOURNAL_VERSION]))
+        for code, columns in blocks.items():
+            rows = len(columns['time'])
+            if rows == 0:
+                continue
+            data = _encode_block(columns)
+            index[code] = [f.tell(), len(data), rows]
+            f.write(data)
+
+        footer = json.dumps({'codes': index, 'covers': covers}).encode('utf-8')
+        f.write(footer)
+        f.write(JOURNAL_TRAILER.pack(len(footer), JOURNAL_MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class TickSegment:
+    """ 只读的单个段文件，mmap 打开后只解析索引 """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._mm[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+                raise ValueError(f'bad tick journal header: {path}')
+            footer_len, magic = JOURNAL_TRAILER.unpack(self._mm[-JOURNAL_TRAILER.size:])
+            if magic != JOURNAL_MAGIC:
+                raise ValueError(f'bad tick journal trailer: {path}')
+            footer_end = len(self._mm) - JOURNAL_TRAILER.size
+            footer = json.loads(self._mm[footer_end - footer_len:footer_end].decode('utf-8'))
+            self.index: Dict[str, list] = footer['codes']
+            self.seq = segment_seq(path)
+            self.covers = footer.get('covers', 0)
+        except Exception:
+            self.close()
+            raise
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def read(self, code: str) -> Optional[Dict[str, np.ndarray]]:
+        if code not in self.index:
+            return None
+        offset, length, rows = self.index[code]
+        return _decode_block(self._mm[offset:offset + length], rows)
+
+    def close(self) -> None:
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TickJournalReader:
+    """ 按 code 读取某一天的 tick 日志 """
+
+    def __init__(self, root: str, date: str):
+        self.path = os.path.join(root, date)
+        self.segments: list[TickSegment] = []
+        for seg_path in sorted(glob.glob(os.path.join(self.path, f'seg_*{JOURNAL_SUFFIX}'))):
+            try:
+                self.segments.append(TickSegment(seg_path))
+            except Exception as e:
+                print(f'[TickJournal] skip broken segment {seg_path}: {e}')
+
+        # 合并后删除旧段前崩溃时，旧段已包含在合并段中，跳过
+        covers = max((segment.covers for segment in self.segments), default=0)
+        for segment in self.segments:
+            if segment.seq <= covers:
+                segment.close()
+        self.segments = [segment for segment in self.segments if segment.seq > covers]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def codes(self) -> list[str]:
+        ans = set()
+        for segment in self.segments:
+            ans.update(segment.index.keys())
+        return sorted(ans)
+
+    def read_columns(self, code: str) -> Optional[Dict[str, np.ndarray]]:
+        parts = [part for part in (segment.read(code) for segment in self.segments) if part is not None]
+        if len(parts) == 0:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name, _, _ in TICK_COLUMNS}
+
+    def read(self, code: str) -> Optional[TickBuffer]:
+        columns = self.read_columns(code)
+        return None if columns is None else TickBuffer.from_columns(columns)
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+class TickJournalWriter:
+    """ 把 TickHistory 的增量写成段文件，记录每个 code 已落盘的行数 """
+
+    def __init__(self, root: str, date: str):
+        self.root = root
+        self.date = date
+        self.path = os.path.join(root, date)
+        self.flushed: Dict[str, int] = {}       # { code: 已落盘行数 }
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+        # 盘中重启时内存里的 tick 从头开始记录，段编号接着已有的往后写
+        self._seq = 0
+        for seg_path in glob.glob(os.path.join(self.path, f'seg_*{JOURNAL_SUFFIX}')):
+            self._seq = max(self._seq, segment_seq(seg_path))
+
+    def _next_path(self) -> str:
+        self._seq += 1
+        return os.path.join(self.path, f'seg_{self._seq:05d}{JOURNAL_SUFFIX}')
+
+    def flush(self, ticks: Dict[str, TickBuffer]) -> int:
+        """ 写入自上次 flush 以来的新增 tick，返回写入的行数 """
+        with self.lock:
+            blocks = {}
+            ends = {}
+            for code, buffer in list(ticks.items()):
+                start = self.flushed.get(code, 0)
+                end = len(buffer)
+                if end > start:
+                    blocks[code] = buffer.columns(start, end)
+                    ends[code] = end
+
+            if len(blocks) == 0:
+                return 0
+
+            write_segment(self._next_path(), blocks)
+            self.flushed.update(ends)
+            return sum(len(block['time']) for block in blocks.values())
+
+    def compact(self) -> None:
+        """ 把当天的多个段合并为一个段，减少按 code 读取时打开的文件数 """
+        with self.lock:
+            reader = TickJournalReader(self.root, self.date)
+            try:
+                if len(reader.segments) > 1:
+                    covers = max(segment.seq for segment in reader.segments)
+                    blocks = {code: reader.read_columns(code) for code in reader.codes()}
+                else:
+                    covers = 0
+                    blocks = None
+                # 包括上次合并后删除前崩溃留下的旧段
+                covers = max([covers] + [segment.covers for segment in reader.segments])
+            finally:
+                reader.close()
+
+            if blocks is not None:
+                write_segment(self._next_path(), blocks, covers=covers)
+            for old_path in glob.glob(os.path.join(self.path, f'seg_*{JOURNAL_SUFFIX}')):
+                if segment_seq(old_path) <= covers:
+                    os.remove(old_path)
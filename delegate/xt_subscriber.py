@@ -1,12 +1,11 @@
 import time
 import datetime
-import json
 import pickle
 import random
 import threading
 import functools
 import traceback
-from typing import Dict, Callable, Optional
+from typing import Dict, Set, Callable, Optional
 
 import pandas as pd
 from xtquant import xtdata
@@ -14,11 +13,17 @@ from xtquant import xtdata
 from delegate.xt_delegate import XtDelegate
 from delegate.daily_history import DailyHistoryCache
 from delegate.daily_reporter import DailyReporter
+from delegate.quote_snapshot import QuoteSnapshot
+from delegate.strategy_worker import StrategySnapshot, StrategyWorker
+from delegate.tick_history import TickHistory
+from delegate.tick_journal import TickJournalWriter
 
 from tools.utils_cache import StockNames, check_is_open_day
 from tools.utils_cache import load_pickle, save_pickle, load_json, save_json
 from tools.utils_ding import BaseMessager
-from tools.utils_remote import DataSource, ExitRight, get_daily_history, qmt_quote_to_tick
+from tools.utils_remote import DataSource, ExitRight, get_daily_history
+from tools.utils_download import DownloadEngine
+from tools.utils_state import flush_state_files
 
 
 def check_open_day(func):
@@ -50,10 +55,13 @@ class XtSubscriber(BaseSubscriber):
         use_ap_scheduler: bool = False,     # 默认使用旧版 schedule
         ding_messager: BaseMessager = None,
         open_tick_memory_cache: bool = False,
-        tick_memory_data_frame: bool = False,
+        tick_memory_data_frame: bool = False,  # 盘后tick存档使用 DataFrame pickle 格式
+        tick_journal_interval: int = 5,         # 盘中tick增量落盘的间隔，单位（分钟）
         open_today_deal_report: bool = False,   # 每日交易记录报告
         open_today_hold_report: bool = False,   # 每日持仓记录报告
         today_report_show_bank: bool = False,   # 是否显示银行流水（国金QMT会卡死所以默认关闭）
+        async_execute: bool = False,            # 策略在独立线程执行，回调只负责投递行情快照
+        async_queue_size: int = 8,              # 异步执行时快照队列的长度
     ):
         self.account_id = '**' + str(account_id)[-4:]
         self.strategy_name = strategy_name
@@ -71,16 +79,26 @@ class XtSubscriber(BaseSubscriber):
         self.lock_quotes_update = threading.Lock()  # 聚合实时打点缓存的锁
 
         self.cache_quotes: Dict[str, Dict] = {}     # 记录实时的价格信息
+        self.quote_snapshot = QuoteSnapshot()       # 实时行情的列式快照
+        self.dirty_codes: Set[str] = set()          # 上次执行策略以来有行情变化的 code
         self.cache_limits: Dict[str, str] = {       # 限制执行次数的缓存集合
             'prev_seconds': '',                     # 限制每秒一次跑策略扫描的缓存
             'prev_minutes': '',                     # 限制每分钟屏幕心跳换行的缓存
         }
         self.cache_history: Dict[str, pd.DataFrame] = {}    # 记录历史日线行情的信息 { code: DataFrame }
 
+        self.strategy_worker: Optional[StrategyWorker] = None   # 异步执行策略的线程
+        if async_execute:
+            self.strategy_worker = StrategyWorker(self.execute_snapshot, async_queue_size, self.strategy_name)
+
         self.open_tick = open_tick_memory_cache
         self.is_ticks_df = tick_memory_data_frame
         self.quick_ticks: bool = False                          # 是否开启quick tick模式
-        self.today_ticks: Dict[str, list | pd.DataFrame] = {}   # 记录tick的历史信息
+        self.today_ticks: TickHistory = TickHistory()           # 记录tick的历史信息 { code: TickBuffer }
+        self.tick_journal_root = f'./_cache/debug/tick_journal/{self.strategy_name}'
+        self.tick_journal_interval = max(1, tick_journal_interval)
+        self.tick_journal: Optional[TickJournalWriter] = None   # tick历史的分段落盘
+        self.flushing_tick_journal = threading.Lock()
 
         self.open_today_deal_report = open_today_deal_report
         self.open_today_hold_report = open_today_hold_report
@@ -119,17 +137,20 @@ class XtSubscriber(BaseSubscriber):
         now = datetime.datetime.now()
         self.last_callback_time = now
 
-        curr_date = now.strftime('%Y-%m-%d')
-        curr_time = now.strftime('%H:%M')
+        curr_time = f'{now.hour:02d}:{now.minute:02d}'
+        curr_seconds = f'{now.second:02d}'
 
         # 每分钟输出一行开头
         if self.cache_limits['prev_minutes'] != curr_time:
             self.cache_limits['prev_minutes'] = curr_time
             print(f'\n[{curr_time}]', end='')
 
-        curr_seconds = now.strftime('%S')
+            if self.open_tick and now.minute % self.tick_journal_interval == 0:
+                threading.Thread(target=self.flush_tick_journal, daemon=True).start()  # 后台增量落盘
+
         with self.lock_quotes_update:
-            self.cache_quotes.update(quotes)  # 合并最新数据
+            self.cache_quotes.update(quotes)    # 合并最新数据
+            self.quote_snapshot.update(quotes)  # 列式快照，同时标记有变化的 code
 
         if self.open_tick and (not self.quick_ticks):
             self.record_tick_to_memory(quotes)  # 更全（默认：先记录再执行）
@@ -138,19 +159,57 @@ class XtSubscriber(BaseSubscriber):
         if self.cache_limits['prev_seconds'] != curr_seconds:
             self.cache_limits['prev_seconds'] = curr_seconds
 
-            if int(curr_seconds) % self.execute_interval == 0:
+            if now.second % self.execute_interval == 0:
                 print('.' if len(self.cache_quotes) > 0 else 'x', end='')  # 每秒钟开始的时候输出一个点
 
-                if self.execute_strategy(
-                    curr_date,      # str(%Y-%m-%d)
+                snapshot = StrategySnapshot(
+                    f'{now.year:04d}-{now.month:02d}-{now.day:02d}',    # str(%Y-%m-%d)
                     curr_time,      # str(%H:%M)
                     curr_seconds,   # str(%S)
                     self.cache_quotes,
-                ):
+                )
+                if self.strategy_worker is not None:
                     with self.lock_quotes_update:
-                        if self.open_tick and self.quick_ticks:
-                            self.record_tick_to_memory(self.cache_quotes)  # 更快（先执行再记录）
-                        self.cache_quotes.clear()  # execute_strategy() return True means need clear
+                        snapshot.quotes = dict(self.cache_quotes)   # 浅拷贝，策略线程执行期间回调可继续合并
+                    if not self.strategy_worker.is_alive():
+                        self.strategy_worker.start()
+                    self.strategy_worker.submit(snapshot)
+                else:
+                    self.execute_snapshot(snapshot)
+
+    def execute_snapshot(self, snapshot: StrategySnapshot) -> None:
+        with self.lock_quotes_update:
+            self.dirty_codes = self.quote_snapshot.pop_dirty()  # 本次执行只需关注这些 code
+
+        if self.execute_strategy(
+            snapshot.curr_date,
+            snapshot.curr_time,
+            snapshot.curr_seconds,
+            snapshot.quotes,
+        ):
+            with self.lock_quotes_update:
+                if self.open_tick and self.quick_ticks:
+                    self.record_tick_to_memory(snapshot.quotes)  # 更快（先执行再记录）
+
+                # execute_strategy() return True means need clear
+                if snapshot.quotes is self.cache_quotes:
+                    self.cache_quotes.clear()
+                else:
+                    # 异步执行时只清除执行期间没有再次更新的 code
+                    for code, quote in snapshot.quotes.items():
+                        if self.cache_quotes.get(code) is quote:
+                            del self.cache_quotes[code]
+
+    def stop_strategy_worker(self, drain: bool = True) -> None:
+        # 收盘时执行完最后一个快照再停止；退出进程时丢弃未执行的快照，避免退出过程中再下单
+        if self.strategy_worker is not None:
+            self.strategy_worker.stop(drain=drain)
+
+    def get_execute_metrics(self, reset: bool = False) -> Optional[Dict[str, float]]:
+        # 异步执行的延迟指标：队列深度、快照执行时的延迟、执行耗时等
+        if self.strategy_worker is None:
+            return None
+        return self.strategy_worker.metrics(reset=reset)
 
     def callback_run_no_quotes(self) -> None:
         if not check_is_open_day(datetime.datetime.now().strftime('%Y-%m-%d')):
@@ -206,6 +265,13 @@ class XtSubscriber(BaseSubscriber):
         if not check_is_open_day(now.strftime('%Y-%m-%d')):
             return
 
+        metrics = self.get_execute_metrics(reset=True)
+        if metrics is not None:
+            print(f'\n[策略执行] 队列:{metrics["queue_depth"]}/{metrics["max_depth"]} '
+                  f'执行:{metrics["executed"]} 合并:{metrics["skipped"]} 丢弃:{metrics["dropped"]} '
+                  f'延迟:{metrics["avg_age"]:.2f}s/{metrics["max_age"]:.2f}s '
+                  f'耗时:{metrics["last_cost"]:.2f}s/{metrics["max_cost"]:.2f}s', end='')
+
         if now - self.last_callback_time > datetime.timedelta(minutes=1):
             if self.messager is not None:
                 self.messager.send_text_as_md(
@@ -242,6 +308,9 @@ class XtSubscriber(BaseSubscriber):
                 self.messager.send_text_as_md(f'[{self.account_id}]{self.strategy_name}:'
                                               f'{"暂停" if pause else "关闭"}')
 
+        if not pause:
+            self.stop_strategy_worker()
+
     def resubscribe_tick(self, notice: bool = False):
         if not check_is_open_day(datetime.datetime.now().strftime('%Y-%m-%d')):
             return
@@ -267,61 +336,52 @@ class XtSubscriber(BaseSubscriber):
     # 盘中实时的tick历史
     # -----------------------
     def record_tick_to_memory(self, quotes):
-        # 记录 tick 历史
-        if self.is_ticks_df:
-            tick_df_cols = ['time', 'price', 'high', 'low', 'volume', 'amount'] \
-                + [f'askPrice{i}' for i in range(1, 6)] \
-                + [f'askVol{i}' for i in range(1, 6)] \
-                + [f'bidPrice{i}' for i in range(1, 6)] \
-                + [f'bidVol{i}' for i in range(1, 6)]
-            for code in quotes:
-                if code not in self.today_ticks:
-                    self.today_ticks[code] = pd.DataFrame(columns=tick_df_cols)
-                quote = quotes[code]
-                tick = qmt_quote_to_tick(quote)
-                df = self.today_ticks[code]
-                df.loc[len(df)] = tick.values()     # 加入最后一行
-        else:
-            for code in quotes:
-                if code not in self.today_ticks:
-                    self.today_ticks[code] = []
-
-                quote = quotes[code]
-                tick_time = datetime.datetime.fromtimestamp(quote['time'] / 1000).strftime('%H:%M:%S')
-                self.today_ticks[code].append([
-                    tick_time,                          # 成交时间，格式：%H:%M:%S
-                    round(quote['lastPrice'], 3),       # 成交价格
-                    round(quote['high'], 3),            # 成交最高价
-                    round(quote['low'], 3),             # 成交最最低价
-                    int(quote['volume']),               # 累计成交量（手）
-                    round(quote['amount'], 3),          # 累计成交额（元）
-                    [round(p, 3) if isinstance(p, (int, float)) else p for p in quote['askPrice']],  # 卖价
-                    [int(v) if isinstance(v, (int, float)) else v for v in quote['askVol']],         # 卖量
-                    [round(p, 3) if isinstance(p, (int, float)) else p for p in quote['bidPrice']],  # 买价
-                    [int(v) if isinstance(v, (int, float)) else v for v in quote['bidVol']],         # 买量
-                ])
+        # 记录 tick 历史（列式缓存，按块扩容）
+        self.today_ticks.record(quotes)
 
     def clean_ticks_history(self):
         if not check_is_open_day(datetime.datetime.now().strftime('%Y-%m-%d')):
             return
         self.today_ticks.clear()
-        self.today_ticks = {}
+        self.today_ticks = TickHistory()
+        self.tick_journal = None
+        with self.lock_quotes_update:
+            self.quote_snapshot.clear()
+            self.dirty_codes = set()
         print(f"已清除tick缓存")
 
+    def get_tick_journal(self) -> TickJournalWriter:
+        today = datetime.datetime.now().strftime('%Y%m%d')
+        if self.tick_journal is None or self.tick_journal.date != today:
+            self.tick_journal = TickJournalWriter(self.tick_journal_root, today)
+        return self.tick_journal
+
+    def flush_tick_journal(self) -> None:
+        # 上一次还没写完就跳过，下个间隔再写
+        if not self.flushing_tick_journal.acquire(blocking=False):
+            return
+        try:
+            self.get_tick_journal().flush(self.today_ticks)
+        except Exception as e:
+            print(f'tick日志落盘失败: {e}')
+        finally:
+            self.flushing_tick_journal.release()
+
     def save_tick_history(self):
         if not check_is_open_day(datetime.datetime.now().strftime('%Y-%m-%d')):
             return
 
+        with self.flushing_tick_journal:
+            journal = self.get_tick_journal()
+            journal.flush(self.today_ticks)
+            journal.compact()
+        print(f"当日tick数据已存储至 {journal.path} 目录")
+
         if self.is_ticks_df:
             pickle_file = f'./_cache/debug/tick_history_{self.strategy_name}.pkl'
             with open(pickle_file, 'wb') as f:
-                pickle.dump(self.today_ticks, f)
+                pickle.dump(self.today_ticks.to_dataframes(), f)
             print(f"当日tick数据已存储为 {pickle_file} 文件")
-        else:
-            json_file = f'./_cache/debug/tick_history_{self.strategy_name}.json'
-            with open(json_file, 'w') as file:
-                json.dump(self.today_ticks, file, indent=4)
-            print(f"当日tick数据已存储为 {json_file} 文件")
 
     # -----------------------
     # 盘前下载数据缓存
@@ -334,31 +394,27 @@ class XtSubscriber(BaseSubscriber):
         adjust: ExitRight,
         columns: list[str],
         data_source: DataSource,
+        target: Optional[Dict[str, pd.DataFrame]] = None,  # 下载到的字典，默认为 self.cache_history
     ):
         print(f'Prepared TIME RANGE: {start} - {end}')
         t0 = datetime.datetime.now()
         print(f'Downloading {len(target_codes)} stocks:')
 
-        group_size = 200
-        down_count = 0
-        for i in range(0, len(target_codes), group_size):
-            sub_codes = [sub_code for sub_code in target_codes[i:i + group_size]]
-            print(i, sub_codes)  # 已更新数量
-
-            # TUSHARE 批量下载限制总共8000天条数据，所以暂时弃用
-            # if data_source == DataSource.TUSHARE:
-            #     # 使用 TUSHARE 数据源批量下载
-            #     dfs = get_ts_daily_histories(sub_codes, start, end, columns)
-            #     self.cache_history.update(dfs)
-            #     time.sleep(0.1)
-
-            # 默认使用 AKSHARE 数据源
-            for code in sub_codes:
-                df = get_daily_history(code, start, end, columns=columns, adjust=adjust, data_source=data_source)
-                time.sleep(0.5)
-                if df is not None:
-                    self.cache_history[code] = df
-                    down_count += 1
+        # TUSHARE 批量下载限制总共8000天条数据，所以暂时弃用
+        # if data_source == DataSource.TUSHARE:
+        #     # 使用 TUSHARE 数据源批量下载
+        #     dfs = get_ts_daily_histories(sub_codes, start, end, columns)
+        #     self.cache_history.update(dfs)
+        #     time.sleep(0.1)
+
+        def fetch(code: str) -> Optional[pd.DataFrame]:
+            return get_daily_history(code, start, end, columns=columns, adjust=adjust, data_source=data_source)
+
+        def keep(code: str, df: pd.DataFrame) -> None:
+            (self.cache_history if target is None else target)[code] = df
+
+        report = DownloadEngine(data_source).run(target_codes, fetch, keep)
+        down_count = report.succeed
 
         print(f'Download completed with {down_count} stock histories succeed!')
         t1 = datetime.datetime.now()
@@ -373,6 +429,7 @@ class XtSubscriber(BaseSubscriber):
         adjust: ExitRight,
         columns: list[str],
         data_source: DataSource,
+        kline_store=None,   # TUSHARE/MOOTDX 时同步日线到这个 store（如 FileStore），None 则只用本地缓存
     ):
         if data_source == DataSource.AKSHARE:
             temp_indicators = load_pickle(cache_path)
@@ -397,7 +454,7 @@ class XtSubscriber(BaseSubscriber):
                                                   f'历史{len(self.cache_history)}支')
         elif data_source == DataSource.TUSHARE or data_source == DataSource.MOOTDX:
             hc = DailyHistoryCache()
-            hc.set_data_source(data_source=data_source)
+            hc.set_data_source(data_source=data_source, kline_store=kline_store)
             hc.daily_history.remove_recent_exit_right_histories(20)
             hc.daily_history.download_recent_daily(20)  # 一个月数据
 
@@ -506,6 +563,8 @@ class XtSubscriber(BaseSubscriber):
         except Exception as e:
             print('策略定时器出错：', e)
         finally:
+            self.stop_strategy_worker(drain=False)
+            flush_state_files()
             self.delegate.shutdown()
 
     def start_scheduler(self):
@@ -583,6 +642,8 @@ class XtSubscriber(BaseSubscriber):
             except Exception as e:
                 print('策略定时器出错：', e)
             finally:
+                self.stop_strategy_worker(drain=False)
+                flush_state_files()
                 self.delegate.shutdown()
                 try:
                     import sys
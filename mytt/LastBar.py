@@ -1,6 +1,9 @@
+import math
+import types
 import numpy as np
 import pandas as pd
-from typing import Union, Any
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Callable, Dict, Optional, Set, Union, Any
 
 
 # ============
@@ -127,3 +130,224 @@ def VALUEWHEN_(e: pd.Series, n: pd.Series):
             return n.iloc[-1 - t]
         t += 1
     return n.iloc[0]  # 找不到数据则为第0个数据
+
+
+# ============
+#  尾部窗口计算
+# ============
+
+# 通常只用到指标最后一两个值，只截取尾部必要的K线计算，不用每次跑完整的几百天历史
+# 窗口类指标（MA/HHV/REF...）截取N根就和全量相同；EMA/SMA 是无限记忆的递推，
+# 截断后初始值的残余权重为 (1-alpha)^bars，取到残余权重小于 WARMUP_TOLERANCE 为止
+
+WARMUP_TOLERANCE = 1e-6
+
+
+# EMA(S, N) 的预热K线数
+def EMA_BARS(N: int, tol: float = WARMUP_TOLERANCE) -> int:
+    alpha = 2 / (N + 1)
+    return 1 if alpha >= 1 else int(math.ceil(math.log(tol) / math.log(1 - alpha))) + 1
+
+
+# SMA(S, N, M) 的预热K线数
+def SMA_BARS(N: int, M: int = 1, tol: float = WARMUP_TOLERANCE) -> int:
+    alpha = M / N
+    return 1 if alpha >= 1 else int(math.ceil(math.log(tol) / math.log(1 - alpha))) + 1
+
+
+# 嵌套计算 f(g(x)) 需要的K线数，每一层各需要若干根，相邻两层共用一根
+def CHAIN_(*bars: int) -> int:
+    return sum(bars) - (len(bars) - 1)
+
+
+# 输出最后一个值需要的K线数，参数顺序与 MyTT 相同，不在表里或者需要全部历史（如 SUM(S, 0)）的为 None
+LOOKBACK = {
+    'REF': lambda N=1: N + 1,
+    'DIFF': lambda N=1: N + 1,
+    'STD': lambda N: N,
+    'SUM': lambda N: N if N > 0 else None,
+    'HHV': lambda N: N,
+    'LLV': lambda N: N,
+    'HHVBARS': lambda N: N,
+    'LLVBARS': lambda N: N,
+    'MA': lambda N: N,
+    'EMA': lambda N: EMA_BARS(N),
+    'SMA': lambda N, M=1: SMA_BARS(N, M),
+    'WMA': lambda N: N,
+    'AVEDEV': lambda N: N,
+    'SLOPE': lambda N: N,
+    'FORCAST': lambda N: N,
+    'COUNT': lambda N: N,
+    'EVERY': lambda N: N,
+    'EXIST': lambda N: N,
+    'MACD': lambda SHORT=12, LONG=26, M=9: CHAIN_(EMA_BARS(LONG), EMA_BARS(M)),
+    'KDJ': lambda N=9, M1=3, M2=3: CHAIN_(N, EMA_BARS(M1 * 2 - 1), EMA_BARS(M2 * 2 - 1)),
+    'RSI': lambda N=24: CHAIN_(2, SMA_BARS(N)),
+    'WR': lambda N=10: N,
+    'BIAS': lambda L1=6, L2=12, L3=24: max(L1, L2, L3),
+    'BOLL': lambda N=20, P=2: N,
+    'PSY': lambda N=12, M=6: CHAIN_(2, N, M),
+    'CCI': lambda N=14: N,
+    'ATR': lambda N=20: CHAIN_(2, N),
+    'BBI': lambda M1=3, M2=6, M3=12, M4=20: max(M1, M2, M3, M4),
+    'DMI': lambda M1=14, M2=6: CHAIN_(2, M1, M2, M2 + 1),
+    'TAQ': lambda N: N,
+    'KTN': lambda N=20, M=10: max(EMA_BARS(N), CHAIN_(2, M)),
+    'TRIX': lambda M1=12, M2=20: CHAIN_(EMA_BARS(M1), EMA_BARS(M1), EMA_BARS(M1), 2, M2),
+    'DPO': lambda M1=20, M2=10, M3=6: CHAIN_(M1, M2 + 1, M3),
+    'MTM': lambda N=12, M=6: CHAIN_(N + 1, M),
+    'ROC': lambda N=12, M=6: CHAIN_(N + 1, M),
+    'EXPMA': lambda N1=12, N2=50: max(EMA_BARS(N1), EMA_BARS(N2)),
+}
+
+
+def LOOKBACK_(func: Union[Callable, str], *params) -> Optional[int]:
+    name = func if isinstance(func, str) else func.__name__
+    if name not in LOOKBACK:
+        return None
+    return LOOKBACK[name](*params)
+
+
+def _TAIL(S, bars: Optional[int]):
+    if bars is None or bars >= len(S):
+        return S
+    return S.iloc[-bars:] if isinstance(S, pd.Series) else np.asarray(S)[-bars:]
+
+
+def _LAST(result, n: int):
+    if isinstance(result, tuple):
+        return tuple(np.asarray(r)[-n:] for r in result)
+    return np.asarray(result)[-n:]
+
+
+# 只用尾部必要的K线计算 func，返回最后 n 个值（多个返回值时为元组），序列参数在前、整型参数在后按位置传入
+def TAIL_(func: Callable, *args, n: int = 1, bars: Optional[int] = None):
+    if bars is None:
+        bars = LOOKBACK_(func, *[a for a in args if np.ndim(a) == 0])
+    if bars is not None:
+        bars += n - 1
+    return _LAST(func(*[_TAIL(a, bars) if np.ndim(a) > 0 else a for a in args]), n)
+
+
+def _TAIL_ERROR(tail, full) -> float:
+    if isinstance(full, tuple):
+        return max((_TAIL_ERROR(t, f) for t, f in zip(tail, full)), default=0.0)
+    tail = np.asarray(tail, dtype=np.float64)
+    full = np.asarray(full, dtype=np.float64)
+    if tail.shape != full.shape or not np.array_equal(np.isnan(tail), np.isnan(full)):
+        return np.inf
+    valid = ~np.isnan(full)
+    if not valid.any():
+        return 0.0
+    return float(np.max(np.abs(tail[valid] - full[valid]) / np.maximum(np.abs(full[valid]), 1.0)))
+
+
+# 尾部计算的精度守卫：每个函数每隔 check_every 次调用和全量计算对比一次，
+# 相对误差超过 tolerance 的函数打印提示，之后一律改为全量计算
+class TailGuard:
+    def __init__(self, tolerance: float = 1e-6, check_every: int = 100):
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.calls: Dict[str, int] = {}
+        self.max_errors: Dict[str, float] = {}
+        self.disabled: Set[str] = set()
+
+    def __call__(self, func: Callable, *args, n: int = 1, bars: Optional[int] = None):
+        name = func.__name__
+        if name in self.disabled:
+            return _LAST(func(*args), n)
+
+        count = self.calls.get(name, 0)
+        self.calls[name] = count + 1
+        tail = TAIL_(func, *args, n=n, bars=bars)
+        if count % self.check_every != 0:
+            return tail
+
+        full = _LAST(func(*args), n)
+        error = _TAIL_ERROR(tail, full)
+        self.max_errors[name] = max(error, self.max_errors.get(name, 0.0))
+        if error > self.tolerance:
+            print(f'[TailGuard] {name} tail error {error:.2e} > {self.tolerance:.0e}, fallback to full computation')
+            self.disabled.add(name)
+            return full
+        return tail
+
+
+# ============
+#  尾部模式算子
+# ============
+
+# 尾部只有一两百根K线时，MyTT 的耗时几乎都在构造 pandas 对象上，截短历史本身并不会变快，
+# 所以尾部模式把常用的0级函数换成纯 numpy 的实现；不支持的输入（二维面板、序列参数N、
+# 中间有 nan 的 EMA 等）仍然交给原函数。数值与 pandas 只有浮点舍入级别的差异，由 TailGuard / 抽样对比兜底
+
+
+def _ROLL(S, N, reduce):
+    out = np.full(len(S), np.nan)
+    if 0 < N <= len(S):
+        out[N - 1:] = reduce(sliding_window_view(S, N))
+    return out
+
+
+def _MA_REDUCE(W):  # 窗口内全部相同时直接取该值，与 pandas 对常数序列的处理一致
+    return np.where(W.max(axis=-1) == W.min(axis=-1), W[:, -1], W.mean(axis=-1))
+
+
+def _EWM_TAIL(S, alpha):  # ewm(adjust=False) 展开成卷积: Y[t] = alpha * SUM((1-alpha)^(t-k) * X[k]) + (1-alpha)^(t+1) * X[0]
+    valid = ~np.isnan(S)
+    first = int(valid.argmax()) if valid.any() else len(S)
+    X = S[first:]
+    if np.isnan(X).any():
+        return None  # 中间有 nan 时 pandas 的权重衰减规则不同，交给原函数
+    out = np.full(len(S), np.nan)
+    if len(X) > 0:
+        decay = (1 - alpha) ** np.arange(len(X))
+        out[first:] = np.convolve(X, alpha * decay)[:len(X)] + decay * (1 - alpha) * X[0]
+    return out
+
+
+def _REF_TAIL(S, N=1):
+    out = np.full(len(S), np.nan)
+    if N == 0:
+        return S.copy()
+    if 0 < N < len(S):
+        out[N:] = S[:-N]
+    return out
+
+
+TAIL_KERNELS = {
+    'REF': _REF_TAIL,
+    'MA': lambda S, N: _ROLL(S, N, _MA_REDUCE),
+    'SUM': lambda S, N: _ROLL(S, N, lambda W: W.sum(axis=-1)) if N > 0 else None,
+    'COUNT': lambda S, N: _ROLL(S, N, lambda W: W.sum(axis=-1)) if N > 0 else None,
+    'HHV': lambda S, N: _ROLL(S, N, lambda W: W.max(axis=-1)),
+    'LLV': lambda S, N: _ROLL(S, N, lambda W: W.min(axis=-1)),
+    'STD': lambda S, N: _ROLL(S, N, lambda W: W.std(axis=-1)),
+    'EMA': lambda S, N: _EWM_TAIL(S, 2 / (N + 1)),
+    'SMA': lambda S, N, M=1: _EWM_TAIL(S, M / N),
+}
+
+
+def _TAIL_KERNEL(kernel: Callable, fallback: Callable) -> Callable:
+    def wrapper(S, *args):
+        if np.ndim(S) == 1 and all(isinstance(a, (int, np.integer)) for a in args):
+            values = np.asarray(S)
+            # 布尔序列 REF 之后是带 nan 的 object，保持原函数的语义；pandas 会把 inf 当成 nan，也交给原函数
+            if not (values.dtype == bool and kernel is _REF_TAIL):
+                values = values.astype(np.float64)
+                result = None if np.isinf(values).any() else kernel(values, *[int(a) for a in args])
+                if result is not None:
+                    return result
+        return fallback(S, *args)
+    wrapper.__name__ = fallback.__name__
+    return wrapper
+
+
+# 返回 formula 的尾部模式版本：函数体不变，其中引用的 MyTT 0级函数换成 TAIL_KERNELS，
+# 只保证最后一根（结合 LOOKBACK 截取的尾部）的结果与原公式一致
+def TAIL_FORMULA(formula: Callable) -> Callable:
+    namespace = dict(formula.__globals__)
+    for name, kernel in TAIL_KERNELS.items():
+        if name in namespace:
+            namespace[name] = _TAIL_KERNEL(kernel, namespace[name])
+    return types.FunctionType(formula.__code__, namespace, formula.__name__, formula.__defaults__, formula.__closure__)
@@ -15,12 +15,40 @@
 
 # 以下所有函数如无特别说明，输入参数S均为numpy序列或者列表list，N为整型int
 # 应用层1级函数完美兼容通达信或同花顺，具体使用方法请参考通达信
+# 0级、1级函数同时支持二维数组(面板)：axis 0 为时间，axis 1 为股票，按列一次性计算所有股票
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from pandas.api.indexers import BaseIndexer
 
 
 # ------------------ 0级：核心工具函数 --------------------------------------------
+def _PD(S):  # 一维用Series，二维面板用DataFrame，pandas的rolling/ewm/shift都是按列计算
+    return pd.DataFrame(S) if np.ndim(S) == 2 else pd.Series(S)
+
+
+class _ColumnIndexer(BaseIndexer):  # 面板按列展开成一维后，每个窗口不跨越列的边界
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        column_start = (end - 1) - (end - 1) % self.rows
+        return np.maximum(column_start, end - self.window_size), end
+
+
+def _ROLLING(S, N, func, **kwargs):  # 面板展开成一维只调用一次pandas，窗口在每列开头重新累计，结果与逐列计算完全一致
+    if np.ndim(S) < 2:  return getattr(pd.Series(S).rolling(N), func)(**kwargs).values
+    S = np.asarray(S, dtype=float)
+    indexer = _ColumnIndexer(window_size=N, rows=S.shape[0])
+    R = getattr(pd.Series(S.ravel(order='F')).rolling(indexer, min_periods=N), func)(**kwargs)
+    return R.values.reshape(S.shape, order='F')
+
+
+def _BY_COLUMN(func, S, *args):  # 只支持一维的函数，面板按列逐个计算
+    S = np.asarray(S)
+    if S.ndim < 2:  return func(S, *args)
+    return np.stack([func(S[:, j], *args) for j in range(S.shape[1])], axis=1) if S.shape[1] > 0 else S.copy()
+
+
 def RD(N, D=3):   return np.round(N, D)  # 四舍五入取3位小数
 
 
@@ -49,80 +77,115 @@ def IF(S, A, B):   return np.where(S, A, B)  # 序列布尔判断 return=A  if S
 
 
 def REF(S, N=1):  # 对序列整体下移动N,返回序列(shift后会产生NAN)
-    return pd.Series(S).shift(N).values
+    return _PD(S).shift(N).values
 
 
 def DIFF(S, N=1):  # 前一个值减后一个值,前面会产生nan
-    return pd.Series(S).diff(N).values  # np.diff(S)直接删除nan，会少一行
+    return _PD(S).diff(N).values  # np.diff(S)直接删除nan，会少一行
 
 
 def STD(S, N):  # 求序列的N日标准差，返回序列
-    return pd.Series(S).rolling(N).std(ddof=0).values
+    return _ROLLING(S, N, 'std', ddof=0)
 
 
 def SUM(S, N):  # 对序列求N天累计和，返回序列    N=0对序列所有依次求和
-    return pd.Series(S).rolling(N).sum().values if N > 0 else pd.Series(S).cumsum().values
+    return _ROLLING(S, N, 'sum') if N > 0 else _PD(S).cumsum().values
 
 
 def CONST(S):  # 返回序列S最后的值组成常量序列
-    return np.full(len(S), S[-1])
+    S = np.asarray(S)
+    return np.broadcast_to(S[-1], S.shape).copy()
 
 
 def HHV(S,N):             #HHV(C, 5) 最近5天收盘最高价
-    return pd.Series(S).rolling(N).max().values
+    return _ROLLING(S, N, 'max')
 
 def LLV(S,N):             #LLV(C, 5) 最近5天收盘最低价
-    return pd.Series(S).rolling(N).min().values
+    return _ROLLING(S, N, 'min')
 
 
 def HHVBARS(S, N):  # 求N周期内S最高值到当前周期数, 返回序列
-    return pd.Series(S).rolling(N).apply(lambda x: np.argmax(x[::-1]), raw=True).values
+    return _PD(S).rolling(N).apply(lambda x: np.argmax(x[::-1]), raw=True).values
 
 
 def LLVBARS(S, N):  # 求N周期内S最低值到当前周期数, 返回序列
-    return pd.Series(S).rolling(N).apply(lambda x: np.argmin(x[::-1]), raw=True).values
+    return _PD(S).rolling(N).apply(lambda x: np.argmin(x[::-1]), raw=True).values
 
 
 def MA(S, N):  # 求序列的N日简单移动平均值，返回序列
-    return pd.Series(S).rolling(N).mean().values
+    return _ROLLING(S, N, 'mean')
 
 
 def EMA(S, N):  # 指数移动平均,为了精度 S>4*N  EMA至少需要120周期     alpha=2/(span+1)
-    return pd.Series(S).ewm(span=N, adjust=False).mean().values
+    return _PD(S).ewm(span=N, adjust=False).mean().values
 
 
 def SMA(S, N, M=1):  # 中国式的SMA,至少需要120周期才精确 (雪球180周期)    alpha=1/(1+com)
-    return pd.Series(S).ewm(alpha=M / N, adjust=False).mean().values  # com=N-M/M
+    return _PD(S).ewm(alpha=M / N, adjust=False).mean().values  # com=N-M/M
+
+
+def _ROLLING_DOT(S, W):  # 每个N周期窗口与权重W(从旧到新)的点积，窗口内有nan或不足N周期为nan
+    S = np.asarray(S, dtype=np.float64)
+    N = len(W)
+    res = np.full(S.shape, np.nan)
+    if len(S) >= N:
+        if S.ndim == 1:
+            res[N - 1:] = np.convolve(S, W[::-1], 'valid')
+        else:  # 面板逐列卷积，保证与单只股票的结果逐位相同
+            for j in range(S.shape[1]):  res[N - 1:, j] = np.convolve(S[:, j], W[::-1], 'valid')
+    return res
 
 
 def WMA(S, N):  # 通达信S序列的N日加权移动平均 Yn = (1*X1+2*X2+3*X3+...+n*Xn)/(1+2+3+...+Xn)
-    return pd.Series(S).rolling(N).apply(lambda x: x[::-1].cumsum().sum() * 2 / N / (N + 1), raw=True).values
+    return _ROLLING_DOT(S, np.arange(1, N + 1) * 2 / N / (N + 1))
+
+
+def _AFFINE_SCAN(A, B):  # Y[i] = A[i] * Y[i-1] + B[i], Y[0] = B[0]; 仿射变换可结合，log2(n)轮向量运算完成前缀扫描
+    A = np.array(A, dtype=np.float64);
+    B = np.array(B, dtype=np.float64)
+    if len(A) > 0:  A[0] = 0.0
+    shift = 1
+    while shift < len(B):
+        B[shift:] = A[shift:] * B[:-shift] + B[shift:]  # 先用旧的A合并B，再合并A
+        A[shift:] = A[shift:] * A[:-shift]
+        shift *= 2
+    return B
 
 
 def DMA(S, A):  # 求S的动态移动平均，A作平滑因子,必须 0<A<1  (此为核心函数，非指标）
-    if isinstance(A, (int, float)):  return pd.Series(S).ewm(alpha=A, adjust=False).mean().values
-    A = np.array(A);
+    if isinstance(A, (int, float)):  return _PD(S).ewm(alpha=A, adjust=False).mean().values
+    A = np.array(A, dtype=np.float64);
     A[np.isnan(A)] = 1.0;
-    Y = np.zeros(len(S));
-    Y[0] = S[0]
-    for i in range(1, len(S)): Y[i] = A[i] * S[i] + (1 - A[i]) * Y[i - 1]  # A支持序列 by jqz1226
-    return Y
+    S = np.asarray(S, dtype=np.float64);
+    B = A * S
+    if len(S) > 0:  B[0] = S[0]
+    return _AFFINE_SCAN(1 - A, B)  # A支持序列 by jqz1226
 
 
 def AVEDEV(S, N):  # 平均绝对偏差  (序列与其平均值的绝对差的平均值)
-    return pd.Series(S).rolling(N).apply(lambda x: (np.abs(x - x.mean())).mean()).values
+    S = np.asarray(S, dtype=np.float64)
+    res = np.full(S.shape, np.nan)
+    if len(S) >= N:
+        X = sliding_window_view(S.T.copy(), N, axis=-1)  # 最后一维是窗口且内存连续，面板与单只股票的求和顺序相同
+        res[N - 1:] = np.abs(X - X.mean(axis=-1, keepdims=True)).mean(axis=-1).T
+    return res
+
+
+def _SLOPE_WEIGHTS(N):  # 最小二乘斜率是窗口的线性组合: SLOPE = SUM((x-x̄)*y) / SUM((x-x̄)^2), x=0..N-1
+    X = np.arange(N) - (N - 1) / 2
+    return X / np.sum(X * X) if N > 1 else np.zeros(1)
 
 
 def SLOPE(S, N):  # 返S序列N周期回线性回归斜率
-    return pd.Series(S).rolling(N).apply(lambda x: np.polyfit(range(N), x, deg=1)[0], raw=True).values
+    return _ROLLING_DOT(S, _SLOPE_WEIGHTS(N))
 
 
 def FORCAST(S, N):  # 返回S序列N周期回线性回归后的预测值， jqz1226改进成序列出
-    return pd.Series(S).rolling(N).apply(lambda x: np.polyval(np.polyfit(range(N), x, deg=1), N - 1), raw=True).values
+    return _ROLLING_DOT(S, np.full(N, 1 / N) + _SLOPE_WEIGHTS(N) * (N - 1) / 2)  # 均值 + 斜率 * (N-1-x̄)
 
 
 def LAST(S, A, B):  # 从前A日到前B日一直满足S_BOOL条件, 要求A>B & A>0 & B>=0
-    return np.array(pd.Series(S).rolling(A + 1).apply(lambda x: np.all(x[::-1][B:]), raw=True), dtype=bool)
+    return np.array(_PD(S).rolling(A + 1).apply(lambda x: np.all(x[::-1][B:]), raw=True), dtype=bool)
 
 
 # ------------------   1级：应用层函数(通过0级核心函数实现）使用方法请参考通达信--------------------------------
@@ -139,29 +202,41 @@ def EXIST(S, N):  # EXIST(CLOSE>3010, N=5)  n日内是否存在一天大于3000
 
 
 def FILTER(S, N):  # FILTER函数，S满足条件后，将其后N周期内的数据置为0, FILTER(C==H,5)
-    for i in range(len(S)): S[i + 1:i + 1 + N] = 0 if S[i] else S[i + 1:i + 1 + N]
+    if np.ndim(S) == 2:
+        for j in range(S.shape[1]):  FILTER(S[:, j], N)  # 列是视图，原地修改
+        return S
+    T = np.flatnonzero(np.asarray(S).astype(bool))  # 只在信号之间跳转，不逐周期循环
+    ZERO = np.zeros(len(S) + 1, dtype=np.int64)
+    k = 0
+    while k < len(T):
+        i = T[k]
+        ZERO[i + 1] += 1;
+        ZERO[min(i + 1 + N, len(S))] -= 1
+        k = np.searchsorted(T, i + N, side='right')  # 下一个不在屏蔽期内的信号
+    S[np.cumsum(ZERO[:-1]) > 0] = 0
     return S  # 例：FILTER(C==H,5) 涨停后，后5天不再发出信号
 
 
 def BARSLAST(S):  # 上一次条件成立到当前的周期, BARSLAST(C/REF(C,1)>=1.1) 上一次涨停到今天的天数
-    M = np.concatenate(([0], np.where(S, 1, 0)))
-    for i in range(1, len(M)):  M[i] = 0 if M[i] else M[i - 1] + 1
-    return M[1:]
+    S = np.asarray(S).astype(bool)
+    I = np.arange(1, len(S) + 1).reshape((-1,) + (1,) * (S.ndim - 1))
+    return I - np.maximum.accumulate(np.where(S, I, 0), axis=0)
 
 
 def BARSLASTCOUNT(S):  # 统计连续满足S条件的周期数        by jqz1226
-    rt = np.zeros(len(S) + 1)  # BARSLASTCOUNT(CLOSE>OPEN)表示统计连续收阳的周期数
-    for i in range(len(S)): rt[i + 1] = rt[i] + 1 if S[i] else rt[i + 1]
-    return rt[1:]
+    S = np.asarray(S).astype(bool)  # BARSLASTCOUNT(CLOSE>OPEN)表示统计连续收阳的周期数
+    I = np.arange(1, len(S) + 1).reshape((-1,) + (1,) * (S.ndim - 1))
+    return (I - np.maximum.accumulate(np.where(S, 0, I), axis=0)).astype(np.float64)
 
 
 def BARSSINCEN(S, N):  # N周期内第一次S条件成立到现在的周期数,N为常量  by jqz1226
-    return pd.Series(S).rolling(N).apply(lambda x: N - 1 - np.argmax(x) if np.argmax(x) or x[0] else 0,
+    return _PD(S).rolling(N).apply(lambda x: N - 1 - np.argmax(x) if np.argmax(x) or x[0] else 0,
                                          raw=True).fillna(0).values.astype(int)
 
 
 def CROSS(S1, S2):                     # 判断向上金叉穿越 CROSS(MA(C,5),MA(C,10))  判断向下死叉穿越 CROSS(MA(C,10),MA(C,5))
-    return np.concatenate(([False], np.logical_not((S1>S2)[:-1]) & (S1>S2)[1:]))    # 不使用0级函数,移植方便  by jqz1226
+    UP = np.asarray(S1 > S2)
+    return np.concatenate((np.zeros((1,) + UP.shape[1:], dtype=bool), np.logical_not(UP[:-1]) & UP[1:]))    # 不使用0级函数,移植方便  by jqz1226
 
 
 def LONGCROSS(S1, S2, N):  # 两条线维持一定周期后交叉,S1在N周期内都小于S2,本周期从S1下方向上穿过S2时返回1,否则返回0
@@ -176,16 +251,32 @@ def BETWEEN(S, A, B):  # S处于A和B之间时为真。 包括 A<S<B 或 A>S>B
     return ((A < S) & (S < B)) | ((A > S) & (S > B))
 
 
+def _RANGE_STACK(X):  # 单调栈：前面连续小于X[i]的周期数，之前全部小于时为0(与原实现一致)，O(n)
+    rt = np.zeros(len(X), dtype=int)
+    stack = []
+    for i, x in enumerate(X):
+        while stack and X[stack[-1]] < x:  stack.pop()
+        if stack:  rt[i] = i - stack[-1] - 1
+        stack.append(i)
+    return rt
+
+
 def TOPRANGE(S):  # TOPRANGE(HIGH)表示当前最高价是近多少周期内最高价的最大值 by jqz1226
-    rt = np.zeros(len(S))
-    for i in range(1, len(S)):  rt[i] = np.argmin(np.flipud(S[:i] < S[i]))
-    return rt.astype('int')
+    if np.ndim(S) == 2:  return _BY_COLUMN(TOPRANGE, S)
+    S = np.asarray(S, dtype=np.float64);
+    NAN = np.isnan(S)
+    rt = _RANGE_STACK(np.where(NAN, np.inf, S).tolist())  # nan不小于任何值，视为阻断
+    rt[NAN] = 0
+    return rt
 
 
 def LOWRANGE(S):  # LOWRANGE(LOW)表示当前最低价是近多少周期内最低价的最小值 by jqz1226
-    rt = np.zeros(len(S))
-    for i in range(1, len(S)):  rt[i] = np.argmin(np.flipud(S[:i] > S[i]))
-    return rt.astype('int')
+    if np.ndim(S) == 2:  return _BY_COLUMN(LOWRANGE, S)
+    S = np.asarray(S, dtype=np.float64);
+    NAN = np.isnan(S)
+    rt = _RANGE_STACK(np.where(NAN, np.inf, -S).tolist())
+    rt[NAN] = 0
+    return rt
 
 
 # ------------------   2级：技术指标函数(全部通过0级，1级函数实现） ------------------------------
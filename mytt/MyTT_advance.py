@@ -6,23 +6,47 @@
 import math
 from typing import Optional
 from mytt.MyTT import *
+from mytt.MyTT import _ROLLING
 
 
 # ------------------------工具函数---------------------------------------------
 
+def _RANGE_QUERY(S, N, func):  # N为序列时的区间最值：稀疏表 O(nlogn) 预处理，每个周期 O(1) 查询
+    # type: (np.ndarray, np.ndarray, np.ufunc) -> np.ndarray
+    S = np.asarray(S, dtype=np.float64)
+    N = np.asarray(N, dtype=np.float64)
+    res = np.repeat(np.nan, len(S))
+    I = np.arange(len(S))
+    VALID = ~np.isnan(N) & (N > 0) & (N <= I + 1)
+    if not VALID.any():
+        return res
+
+    L = N[VALID].astype(np.int64)  # 区间长度
+    END = I[VALID] + 1  # 区间 [END-L, END)
+    K = np.floor(np.log2(L)).astype(np.int64)  # 两个长度为 2^K 的区间覆盖整个区间
+
+    TABLE = [S]  # TABLE[k][j] = func(S[j:j+2^k])
+    while (1 << len(TABLE)) <= L.max():
+        prev, half = TABLE[-1], 1 << (len(TABLE) - 1)
+        TABLE.append(func(prev[:-half], prev[half:]))
+
+    out = np.empty(len(L))
+    for k in np.unique(K):
+        M = K == k
+        out[M] = func(TABLE[k][END[M] - L[M]], TABLE[k][END[M] - (1 << k)])
+    res[VALID] = out
+    return res
+
+
 def HHV(S, N):  # HHV,支持N为序列版本
     # type: (np.ndarray, Optional[int,float, np.ndarray]) -> np.ndarray
     """
     HHV(C, 5)  # 最近5天收盘最高价
     """
     if isinstance(N, (int, float)):
-        return pd.Series(S).rolling(N).max().values
+        return _ROLLING(S, N, 'max')
     else:
-        res = np.repeat(np.nan, len(S))
-        for i in range(len(S)):
-            if (not np.isnan(N[i])) and 0 < N[i] <= i + 1:
-                res[i] = S[i + 1 - N[i]:i + 1].max()
-        return res
+        return _RANGE_QUERY(S, N, np.maximum)
 
 
 def LLV(S, N):  # LLV,支持N为序列版本
@@ -31,13 +55,9 @@ def LLV(S, N):  # LLV,支持N为序列版本
     LLV(C, 5)  # 最近5天收盘最低价
     """
     if isinstance(N, (int, float)):
-        return pd.Series(S).rolling(N).min().values
+        return _ROLLING(S, N, 'min')
     else:
-        res = np.repeat(np.nan, len(S))
-        for i in range(len(S)):
-            if (not np.isnan(N[i])) and 0 < N[i] <= i + 1:
-                res[i] = S[i + 1 - N[i]:i + 1].min()
-        return res
+        return _RANGE_QUERY(S, N, np.minimum)
 
 
 def DSMA(X, N):  # 偏差自适应移动平均线   type: (np.ndarray, int) -> np.ndarray
@@ -50,10 +70,15 @@ def DSMA(X, N):  # 偏差自适应移动平均线   type: (np.ndarray, int) -> n
     c2 = b1
     c3 = -a1 * a1
     c1 = 1 - c2 - c3
-    Zeros = np.pad(X[2:] - X[:-2], (2, 0), 'constant')
-    Filt = np.zeros(len(X))
-    for i in range(len(X)):
-        Filt[i] = c1 * (Zeros[i] + Zeros[i - 1]) / 2 + c2 * Filt[i - 1] + c3 * Filt[i - 2]
+    Zeros = np.pad(X[2:] - X[:-2], (2, 0), 'constant')[:len(X)]
+    # 二阶递推 Filt[i] = U[i] + c2*Filt[i-1] + c3*Filt[i-2] 等价于 U 与冲激响应 H 的卷积，
+    # 特征根为 a1*e^(±iθ)，H[k] = a1^k * sin((k+1)θ) / sinθ，a1^k 小于 1e-18 之后截断
+    theta = 1.414 * math.pi * 2 / N
+    U = c1 * (Zeros + np.roll(Zeros, 1)) / 2  # 与原循环一致，i=0 时 Zeros[i-1] 取的是最后一个元素
+    K = np.arange(min(len(X), int(math.ceil(-41.5 / math.log(a1))) + 2))
+    H = np.power(a1, K) * np.sin((K + 1) * theta) / math.sin(theta)
+    Filt = np.convolve(U, H)[:len(X)]
+    Filt[np.maximum.accumulate(np.isnan(U))] = np.nan  # 递推中出现nan之后一直是nan
 
     RMS = np.sqrt(SUM(np.square(Filt), N) / N)
     ScaledFilt = Filt / RMS
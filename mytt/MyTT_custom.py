@@ -58,32 +58,33 @@ def CROSS_PLUS(S1: pd.Series, S2: pd.Series):
 
 
 def COUNT_PLUS(S: pd.Series, N):
+    # 前缀和相减，每个周期 O(1)
+    S = np.asarray(S)
+    N = np.asarray(N, dtype=np.float64)[:len(S)]
+    I = np.arange(len(N))
     res = np.repeat(np.nan, len(S))
-    for i in range(len(S)):
-        if (not np.isnan(N[i])):
-            if 0 < N[i] <= i + 1:
-                res[i] = np.sum(S[max(0, i + 1 - N[i]):i + 1])
-            if N[i] == 0:
-                res[i] = 0
+    CSUM = np.concatenate(([0], np.cumsum(S)))
+    VALID = ~np.isnan(N) & (N > 0) & (N <= I + 1)
+    END = I[VALID] + 1
+    res[:len(N)][VALID] = CSUM[END] - CSUM[END - N[VALID].astype(np.int64)]
+    res[:len(N)][N == 0] = 0
     return res.astype(int)
 
 
 def REF_PLUS(S: pd.Series, N):
+    S = np.asarray(S)
     result = np.repeat(np.nan, len(S))
 
-    nCount = len(N)
-    for i in range(len(S)):
-        if i >= nCount:
-            continue
+    nCount = min(len(N), len(S))
+    if nCount == 0:
+        return result
 
-        value = N[i]
-
-        value = int(value)
-        if value >= 0 and value <= i:
-            result[i] = S[i - value]
-        elif i:
-            result[i] = result[i - 1]
-        else:
-            result[i] = S[i]
+    I = np.arange(nCount)
+    value = np.asarray(N[:nCount]).astype(np.int64)
+    VALID = (value >= 0) & (value <= I)
+    SRC = np.where(VALID, I - value, 0)  # 第一个周期不满足时取 S[0]
 
+    # 不满足条件的周期沿用上一个周期的结果
+    LAST = np.maximum.accumulate(np.where(VALID | (I == 0), I, 0))
+    result[:nCount] = S[SRC[LAST]]
     return result
@@ -0,0 +1,449 @@
+# 通达信公式编译器：把通达信语法的公式解析成有向无环图，相同的子表达式（如多处出现的 HHV(H,13)）只算一次
+# 支持 := 中间变量、: 输出变量、// 与 {} 注释、AND / OR / NOT、比较、四则运算，函数取自 MyTT / MyTT_advance
+# 可以对单只股票的序列计算，也可以对 utils_panel 拼出来的 (时间 x 股票) 面板一次性计算
+# 条件的结果统一为 1.0 / 0.0，nan 参与 AND / OR / NOT 时按 0 处理，与 Series 上 & 运算遇到 REF 产生的 nan 一致
+#
+# 用法：
+#   f = compile_formula(text)
+#   result = f.evaluate(df)                                     # { 输出名: ndarray }
+#   result = f.evaluate(df, series_id=code, cache=cache)        # 同一交易日内按 (code, 数据指纹, 表达式) 复用中间结果
+
+import re
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+import mytt.MyTT_advance as _mytt
+
+
+# 行情序列的别名 -> 规范名 -> 日线缓存里的列名
+SERIES_ALIASES = {
+    'C': 'CLOSE', 'CLOSE': 'CLOSE',
+    'O': 'OPEN', 'OPEN': 'OPEN',
+    'H': 'HIGH', 'HIGH': 'HIGH',
+    'L': 'LOW', 'LOW': 'LOW',
+    'V': 'VOL', 'VOL': 'VOL', 'VOLUME': 'VOL',
+    'AMO': 'AMOUNT', 'AMOUNT': 'AMOUNT',
+}
+SERIES_COLUMNS = {
+    'CLOSE': 'close',
+    'OPEN': 'open',
+    'HIGH': 'high',
+    'LOW': 'low',
+    'VOL': 'volume',
+    'AMOUNT': 'amount',
+}
+
+# 只画图不产生数值的语句，整句跳过
+DRAWING_FUNCTIONS = {
+    'DRAWICON', 'STICKLINE', 'DRAWTEXT', 'DRAWTEXT_FIX', 'DRAWNUMBER', 'DRAWLINE', 'DRAWKLINE',
+    'DRAWBAND', 'DRAWSL', 'POLYLINE', 'PLOYLINE', 'PARTLINE', 'VERTLINE', 'FILLRGN',
+}
+
+# 数据指纹包含的列：同一 code 当日的数据有变化（新增一行或最后一行被更新）时指纹不同
+FINGERPRINT_COLUMNS = ['datetime'] + list(SERIES_COLUMNS.values())
+
+_COMPARES = {'>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal,
+             '=': np.equal, '<>': np.not_equal, '!=': np.not_equal}
+_ARITHMETICS = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.true_divide}
+
+_TOKEN = re.compile(r'''
+    (?P<space>\s+)
+    |(?P<comment>//[^\n]*|\{[^}]*\})
+    |(?P<number>\d+\.\d*|\.\d+|\d+)
+    |(?P<name>[A-Za-z_一-鿿][A-Za-z0-9_一-鿿]*)
+    |(?P<string>'[^']*')
+    |(?P<op>:=|<>|!=|>=|<=|&&|\|\||[-+*/()<>=,;:])
+''', re.VERBOSE)
+
+
+class FormulaError(Exception):
+    pass
+
+
+class FormulaNode:
+    __slots__ = ('index', 'kind', 'value', 'args', 'expr', 'pure')
+
+    def __init__(self, index: int, kind: str, value, args: tuple, expr: str, pure: bool):
+        self.index = index      # 在图中的序号，子节点的序号一定更小
+        self.kind = kind        # series / var / const / call / op / not / neg
+        self.value = value      # 规范名 / 变量名 / 常数 / 函数名 / 运算符
+        self.args = args        # 子节点序号
+        self.expr = expr        # 规范化的表达式，作为缓存的键
+        self.pure = pure        # 只依赖行情序列（不依赖 evaluate 传入的变量），可以缓存
+
+
+def _tokenize(text: str) -> List[tuple]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise FormulaError(f'无法识别的字符 {text[pos:pos + 10]!r}')
+        pos = m.end()
+        kind = m.lastgroup
+        if kind in ('space', 'comment'):
+            continue
+        value = m.group()
+        if kind == 'name':
+            value = value.upper()
+        elif kind == 'op':
+            value = {'&&': 'AND', '||': 'OR'}.get(value, value)
+        tokens.append((kind, value))
+    return tokens
+
+
+class CompiledFormula:
+    def __init__(self, text: str, functions: Optional[Dict[str, Callable]] = None):
+        self.text = text
+        self.functions = functions or {}
+        self.nodes: List[FormulaNode] = []
+        self.outputs: Dict[str, int] = {}       # 输出名 -> 节点序号，按公式中的顺序
+        self.variables: Dict[str, int] = {}     # 所有赋值过的名字 -> 节点序号（含中间变量）
+        self._keys: Dict[tuple, int] = {}
+        self._tokens = _tokenize(text)
+        self._pos = 0
+        self._parse()
+        self._order = self._reachable()
+
+    # ==============
+    #  建图
+    # ==============
+
+    def _node(self, kind: str, value, args: tuple, expr: str) -> int:
+        key = (kind, value, type(value), args)  # 3 与 3.0 相等，但窗口参数必须是整数
+        if key not in self._keys:   # 结构相同的表达式只建一个节点
+            pure = kind != 'var' and all(self.nodes[i].pure for i in args)
+            self._keys[key] = len(self.nodes)
+            self.nodes.append(FormulaNode(len(self.nodes), kind, value, args, expr, pure))
+        return self._keys[key]
+
+    def _find_function(self, name: str) -> Optional[Callable]:
+        if name in self.functions:
+            return self.functions[name]
+        func = getattr(_mytt, name, None)
+        return func if callable(func) and name.isupper() else None
+
+    # ==============
+    #  语法分析
+    # ==============
+
+    def _peek(self, offset: int = 0) -> tuple:
+        i = self._pos + offset
+        return self._tokens[i] if i < len(self._tokens) else ('end', None)
+
+    def _take(self, value: str = None) -> tuple:
+        token = self._peek()
+        if value is not None and token[1] != value:
+            raise FormulaError(f'期望 {value!r}，实际为 {token[1]!r}')
+        self._pos += 1
+        return token
+
+    def _parse(self) -> None:
+        anonymous = 0
+        while self._peek()[0] != 'end':
+            if self._peek()[1] == ';':
+                self._take()
+                continue
+
+            kind, value = self._peek()
+            if kind == 'name' and value in DRAWING_FUNCTIONS and self._peek(1)[1] == '(':
+                while self._peek()[1] not in (';', None):
+                    self._take()
+                continue
+
+            if kind == 'name' and self._peek(1)[1] in (':=', ':'):
+                self._take()
+                assign = self._take()[1]
+                index = self._parse_or()
+                self.variables[value] = index
+                if assign == ':':
+                    self.outputs[value] = index
+            else:
+                index = self._parse_or()
+                anonymous += 1
+                self.outputs[f'OUT{anonymous}'] = index
+
+            # 逗号后面是 COLORRED / NODRAW 之类的画线属性，跳过
+            if self._peek()[1] == ',':
+                while self._peek()[1] not in (';', None):
+                    self._take()
+
+    def _parse_or(self) -> int:
+        left = self._parse_and()
+        while self._peek()[1] == 'OR':
+            self._take()
+            right = self._parse_and()
+            left = self._node('op', 'OR', (left, right), f'({self.nodes[left].expr} OR {self.nodes[right].expr})')
+        return left
+
+    def _parse_and(self) -> int:
+        left = self._parse_compare()
+        while self._peek()[1] == 'AND':
+            self._take()
+            right = self._parse_compare()
+            left = self._node('op', 'AND', (left, right), f'({self.nodes[left].expr} AND {self.nodes[right].expr})')
+        return left
+
+    def _parse_compare(self) -> int:
+        left = self._parse_sum()
+        while self._peek()[1] in _COMPARES:
+            op = self._take()[1]
+            op = '<>' if op == '!=' else op
+            right = self._parse_sum()
+            left = self._node('op', op, (left, right), f'({self.nodes[left].expr}{op}{self.nodes[right].expr})')
+        return left
+
+    def _parse_sum(self) -> int:
+        left = self._parse_product()
+        while self._peek()[1] in ('+', '-'):
+            op = self._take()[1]
+            right = self._parse_product()
+            left = self._node('op', op, (left, right), f'({self.nodes[left].expr}{op}{self.nodes[right].expr})')
+        return left
+
+    def _parse_product(self) -> int:
+        left = self._parse_unary()
+        while self._peek()[1] in ('*', '/'):
+            op = self._take()[1]
+            right = self._parse_unary()
+            left = self._node('op', op, (left, right), f'({self.nodes[left].expr}{op}{self.nodes[right].expr})')
+        return left
+
+    def _parse_unary(self) -> int:
+        token = self._peek()
+        if token[1] == '-':
+            self._take()
+            arg = self._parse_unary()
+            return self._node('neg', '-', (arg,), f'(-{self.nodes[arg].expr})')
+        if token[1] == '+':
+            self._take()
+            return self._parse_unary()
+        if token[1] == 'NOT':
+            self._take()
+            arg = self._parse_unary()
+            return self._node('not', 'NOT', (arg,), f'NOT({self.nodes[arg].expr})')
+        return self._parse_primary()
+
+    def _parse_primary(self) -> int:
+        kind, value = self._take()
+        if kind == 'number':
+            number = float(value) if '.' in value else int(value)
+            return self._node('const', number, (), repr(number))
+        if value == '(':
+            index = self._parse_or()
+            self._take(')')
+            return index
+        if kind != 'name':
+            raise FormulaError(f'意外的符号 {value!r}')
+
+        if self._peek()[1] == '(':  # 函数调用
+            self._take()
+            args = []
+            if self._peek()[1] != ')':
+                args.append(self._parse_or())
+                while self._peek()[1] == ',':
+                    self._take()
+                    args.append(self._parse_or())
+            self._take(')')
+            if self._find_function(value) is None:
+                raise FormulaError(f'不支持的函数 {value}')
+            return self._node('call', value, tuple(args), f'{value}({",".join(self.nodes[i].expr for i in args)})')
+
+        if value in self.variables:     # 已赋值的名字直接指向对应的节点，重新赋值后指向新的节点
+            return self.variables[value]
+        if value in SERIES_ALIASES:
+            name = SERIES_ALIASES[value]
+            return self._node('series', name, (), name)
+        return self._node('var', value, (), value)  # 其余的名字在 evaluate 时由 variables 传入
+
+    def _reachable(self) -> List[int]:
+        needed = set(self.outputs.values())
+        for node in reversed(self.nodes):
+            if node.index in needed:
+                needed.update(node.args)
+        return sorted(needed)
+
+    # ==============
+    #  计算
+    # ==============
+
+    @property
+    def series_names(self) -> List[str]:
+        return sorted(set(self.nodes[i].value for i in self._order if self.nodes[i].kind == 'series'))
+
+    @property
+    def variable_names(self) -> List[str]:
+        return sorted(set(self.nodes[i].value for i in self._order if self.nodes[i].kind == 'var'))
+
+    def evaluate(
+        self,
+        data: Union[pd.DataFrame, Dict[str, np.ndarray]],   # 日线 DataFrame，或 { 列名: ndarray[时间, 股票] } 的面板
+        variables: Optional[Dict[str, any]] = None,         # 公式里的其他名字，如 LIMITINGUPRATE，面板时可以是每只股票一个值
+        series_id: Optional[str] = None,                    # 行情序列的标识（如 code），传入后中间结果写入 cache
+        cache: Optional['ExpressionCache'] = None,
+        outputs: Optional[List[str]] = None,                # 默认返回所有 : 输出
+    ) -> Dict[str, np.ndarray]:
+        variables = variables or {}
+        if series_id is not None and cache is None:
+            cache = get_expression_cache()
+        if cache is not None:
+            cache.check_day()
+
+        fingerprint = _fingerprint(data) if cache is not None and series_id is not None else None
+
+        values: Dict[int, any] = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in self._order:
+                node = self.nodes[i]
+                key = (series_id, fingerprint, node.expr)
+                if cache is not None and series_id is not None and node.pure and node.kind != 'const':
+                    cached = cache.get(key)
+                    if cached is not None:
+                        values[i] = cached
+                        continue
+                    values[i] = self._compute(node, values, data, variables)
+                    cache.put(key, values[i])
+                else:
+                    values[i] = self._compute(node, values, data, variables)
+
+        names = self.outputs.keys() if outputs is None else outputs
+        return {name: values[self.variables.get(name, self.outputs.get(name))] for name in names}
+
+    def _compute(self, node: FormulaNode, values: Dict[int, any], data, variables: Dict[str, any]):
+        if node.kind == 'const':
+            return node.value
+        if node.kind == 'series':
+            return np.asarray(data[SERIES_COLUMNS[node.value]], dtype=np.float64)
+        if node.kind == 'var':
+            if node.value not in variables:
+                raise FormulaError(f'缺少变量 {node.value}')
+            value = variables[node.value]
+            return np.asarray(value, dtype=np.float64) if np.ndim(value) > 0 else value
+
+        args = [values[i] for i in node.args]
+        if node.kind == 'call':
+            result = self._find_function(node.value)(*args)
+            if isinstance(result, tuple):
+                raise FormulaError(f'{node.value} 返回多个序列，不能直接用在公式里')
+        elif node.kind == 'neg':
+            result = np.negative(args[0])
+        elif node.kind == 'not':
+            result = ~_truth(args[0])
+        elif node.value == 'AND':
+            result = _truth(args[0]) & _truth(args[1])
+        elif node.value == 'OR':
+            result = _truth(args[0]) | _truth(args[1])
+        elif node.value in _COMPARES:
+            result = _COMPARES[node.value](args[0], args[1])
+        else:
+            result = _ARITHMETICS[node.value](args[0], args[1])
+        return _normalize(result)
+
+
+def _fingerprint(data) -> tuple:
+    """ 行数 + 最后一行的日期和各行情列，不同公式对同一份数据得到同样的指纹，可以共享缓存 """
+    parts = []
+    for column in FINGERPRINT_COLUMNS:
+        if column in data:
+            arr = np.asarray(data[column])
+            parts.append(len(arr))
+            if len(arr) == 0:
+                parts.append(b'')
+            elif arr.dtype == object:
+                parts.append(repr(arr[-1].tolist() if np.ndim(arr[-1]) > 0 else arr[-1]))
+            else:
+                parts.append(arr[-1].tobytes())
+    return tuple(parts)
+
+
+def _truth(value):
+    return np.nan_to_num(value, nan=0.0) != 0
+
+
+def _normalize(value):
+    # 条件统一转成 1.0 / 0.0，REF 之类的函数之后不会得到带 nan 的 object 序列
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        value = value.values
+    if isinstance(value, np.ndarray):
+        return value if value.dtype == np.float64 else value.astype(np.float64)
+    return float(value) if isinstance(value, (bool, np.bool_)) else value
+
+
+# ==============
+#  当日的中间结果缓存
+# ==============
+
+class ExpressionCache:
+    """ { (series_id, 数据指纹, 表达式): 结果 }，不同公式之间共享，日期变化后清空，超过 max_bytes 时淘汰最久未用的 """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.day: Optional[str] = None
+        self.max_bytes = max_bytes
+        self.values: 'OrderedDict[tuple, any]' = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def check_day(self, day: str = None) -> None:
+        day = datetime.datetime.now().strftime('%Y-%m-%d') if day is None else day
+        if day != self.day:
+            with self.lock:
+                if day != self.day:
+                    self.values = OrderedDict()
+                    self.nbytes = 0
+                    self.day = day
+
+    def get(self, key: tuple) -> any:
+        with self.lock:
+            value = self.values.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.values.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: any) -> None:
+        size = getattr(value, 'nbytes', 8)
+        with self.lock:
+            old = self.values.pop(key, None)
+            if old is not None:
+                self.nbytes -= getattr(old, 'nbytes', 8)
+            self.values[key] = value
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self.values) > 1:
+                _, evicted = self.values.popitem(last=False)
+                self.nbytes -= getattr(evicted, 'nbytes', 8)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.values = OrderedDict()
+            self.nbytes = 0
+
+
+_expression_cache = ExpressionCache()
+_formulas: Dict[tuple, CompiledFormula] = {}
+_formulas_lock = threading.Lock()
+
+
+def get_expression_cache() -> ExpressionCache:
+    return _expression_cache
+
+
+def compile_formula(text: str, functions: Optional[Dict[str, Callable]] = None) -> CompiledFormula:
+    """ 同样的公式文本和函数只编译一次，函数按对象区分，同名的不同函数不会复用 """
+    key = (text, tuple(sorted((functions or {}).items(), key=lambda item: item[0])))
+    try:
+        hash(key)
+    except TypeError:   # 不可哈希的可调用对象，不缓存
+        return CompiledFormula(text, functions)
+    with _formulas_lock:
+        if key not in _formulas:
+            _formulas[key] = CompiledFormula(text, functions)
+        return _formulas[key]
@@ -0,0 +1,285 @@
+# MyTT 指标的流式（增量）版本，给盘中按 tick 反复计算用
+# 盘前用昨天为止的日线 seed() 播种一次，盘中把当天到目前为止的临时K线传给 peek()，
+# 得到包含当天的指标值且不改变状态，每次 O(1)；一天结束后可以 push() 把当天K线正式加入
+# 累加顺序逐步复刻 pandas 的 rolling().mean() / rolling().max() / ewm(adjust=False).mean()，
+# 结果与 MyTT 对"历史 + 当天"整段重新计算的最后一个值逐位相同
+
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from mytt.MyTT import RD
+
+
+# ------------------ 0级：与 pandas 逐位一致的基础状态 --------------------------------------------
+def _FLOAT(x):  # pandas 窗口函数计算前会把 inf 当成 nan
+    x = np.float64(x)
+    return np.float64(np.nan) if math.isinf(x) else x
+
+
+class _EWM:  # ewm(span=N 或 alpha=A, adjust=False).mean()，min_periods=1
+    def __init__(self, span=None, alpha=None):
+        com = (span - 1) / 2.0 if span is not None else (1 - alpha) / alpha
+        self.alpha = 1. / (1. + com)
+        self.old_wt_factor = 1. - self.alpha
+        self.state = None  # (weighted, old_wt, nobs)
+
+    def update(self, x, commit=False):
+        x = _FLOAT(x)
+        is_observation = x == x
+        if self.state is None:
+            weighted, old_wt, nobs = x, 1., int(is_observation)
+        else:
+            weighted, old_wt, nobs = self.state
+            nobs += is_observation
+            if weighted == weighted:
+                old_wt *= self.old_wt_factor
+                if is_observation:
+                    if weighted != x:  # 与 pandas 一样，常数序列不做运算避免误差
+                        weighted = old_wt * weighted + self.alpha * x
+                        weighted /= (old_wt + self.alpha)
+                    old_wt = 1.
+            elif is_observation:
+                weighted = x
+        if commit:  self.state = (weighted, old_wt, nobs)
+        return weighted if nobs >= 1 else np.float64(np.nan)
+
+
+class _MEAN:  # rolling(N).mean()，Kahan 求和，先移出窗口最旧的值再加入新值
+    def __init__(self, N):
+        self.N = N
+        self.window = deque(maxlen=N)  # 已提交的最近N个值
+        self.state = (0, np.float64(0), 0, np.float64(0), np.float64(0), 0, np.float64(np.nan))
+        # (nobs, sum_x, neg_ct, compensation_add, compensation_remove, num_consecutive_same_value, prev_value)
+
+    def update(self, x, commit=False):
+        x = _FLOAT(x)
+        nobs, sum_x, neg_ct, comp_add, comp_remove, same_count, prev_value = self.state
+        if len(self.window) == self.N:
+            val = self.window[0]
+            if val == val:
+                nobs -= 1
+                y = - val - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                if math.copysign(1, val) < 0:  neg_ct -= 1
+        if x == x:
+            nobs += 1
+            y = x - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if math.copysign(1, x) < 0:  neg_ct += 1
+            same_count = same_count + 1 if x == prev_value else 1
+            prev_value = x
+
+        if nobs >= self.N and nobs > 0:
+            result = sum_x / np.float64(nobs)
+            if same_count >= nobs:
+                result = prev_value
+            elif neg_ct == 0 and result < 0:
+                result = np.float64(0)
+            elif neg_ct == nobs and result > 0:
+                result = np.float64(0)
+        else:
+            result = np.float64(np.nan)
+
+        if commit:
+            self.state = (nobs, sum_x, neg_ct, comp_add, comp_remove, same_count, prev_value)
+            self.window.append(x)
+        return result
+
+
+class _EXTREME:  # rolling(N).max() / min()，窗口内有 nan 或不足N个为 nan
+    def __init__(self, N, func):
+        self.N = N
+        self.func = func
+        self.window = deque(maxlen=N - 1)  # 已提交的最近N-1个值
+        self.extreme = np.float64(np.nan)  # 这N-1个值的最值，有 nan 时为 nan
+
+    def update(self, x, commit=False):
+        x = _FLOAT(x)
+        if self.N == 1:  return x
+        full = len(self.window) == self.N - 1
+        result = self.func(self.extreme, x) if full else np.float64(np.nan)  # np.maximum / np.minimum 遇到 nan 返回 nan
+        if commit:
+            self.window.append(x)
+            if len(self.window) == self.N - 1:
+                self.extreme = self.func.reduce(np.array(self.window, dtype=np.float64))
+        return result
+
+
+class _REF:  # REF(S, N)
+    def __init__(self, N=1):
+        self.window = deque([np.float64(np.nan)] * N, maxlen=N)
+
+    def update(self, x, commit=False):
+        result = self.window[0]
+        if commit:  self.window.append(np.float64(x))
+        return result
+
+
+# ------------------ 1级：流式指标，update/peek/push 的参数顺序与 MyTT 相同 --------------------------------------------
+class StreamIndicator(ABC):
+    last = np.float64(np.nan)  # 最后一根已提交K线的指标值
+
+    @abstractmethod
+    def update(self, *bar, commit=False):  # commit=False 时不改变状态
+        ...
+
+    def peek(self, *bar):  # 当天的临时K线，不改变状态
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.update(*bar, commit=False)
+
+    def push(self, *bar):  # 正式加入一根K线
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.last = self.update(*bar, commit=True)
+        return self.last
+
+    def step(self, *bar, commit=False):  # 组合指标内部调用子指标
+        return self.push(*bar) if commit else self.peek(*bar)
+
+    def seed(self, *series):  # 用历史序列逐根播种，返回自身
+        for bar in zip(*(np.asarray(s, dtype=np.float64) for s in series)):
+            self.push(*bar)
+        return self
+
+
+class StreamREF(StreamIndicator):
+    def __init__(self, N=1):
+        self.ref = _REF(N)
+
+    def update(self, S, commit=False):
+        return self.ref.update(S, commit)
+
+
+class StreamMA(StreamIndicator):
+    def __init__(self, N):
+        self.ma = _MEAN(N)
+
+    def update(self, CLOSE, commit=False):
+        return self.ma.update(CLOSE, commit)
+
+
+class StreamEMA(StreamIndicator):
+    def __init__(self, N):
+        self.ema = _EWM(span=N)
+
+    def update(self, CLOSE, commit=False):
+        return self.ema.update(CLOSE, commit)
+
+
+class StreamSMA(StreamIndicator):
+    def __init__(self, N, M=1):
+        self.sma = _EWM(alpha=M / N)
+
+    def update(self, CLOSE, commit=False):
+        return self.sma.update(CLOSE, commit)
+
+
+class StreamHHV(StreamIndicator):
+    def __init__(self, N):
+        self.hhv = _EXTREME(N, np.maximum)
+
+    def update(self, S, commit=False):
+        return self.hhv.update(S, commit)
+
+
+class StreamLLV(StreamIndicator):
+    def __init__(self, N):
+        self.llv = _EXTREME(N, np.minimum)
+
+    def update(self, S, commit=False):
+        return self.llv.update(S, commit)
+
+
+class StreamMACD(StreamIndicator):  # 返回 (DIF, DEA, MACD)
+    last = (np.float64(np.nan),) * 3
+
+    def __init__(self, SHORT=12, LONG=26, M=9):
+        self.ema_short, self.ema_long, self.dea = _EWM(span=SHORT), _EWM(span=LONG), _EWM(span=M)
+
+    def update(self, CLOSE, commit=False):
+        DIF = self.ema_short.update(CLOSE, commit) - self.ema_long.update(CLOSE, commit)
+        DEA = self.dea.update(DIF, commit)
+        MACD = (DIF - DEA) * 2
+        return RD(DIF), RD(DEA), RD(MACD)
+
+
+class StreamKDJ(StreamIndicator):  # 返回 (K, D, J)
+    last = (np.float64(np.nan),) * 3
+
+    def __init__(self, N=9, M1=3, M2=3):
+        self.hhv, self.llv = _EXTREME(N, np.maximum), _EXTREME(N, np.minimum)
+        self.k, self.d = _EWM(span=M1 * 2 - 1), _EWM(span=M2 * 2 - 1)
+
+    def update(self, CLOSE, HIGH, LOW, commit=False):
+        LLN = self.llv.update(LOW, commit)
+        RSV = (_FLOAT(CLOSE) - LLN) / (self.hhv.update(HIGH, commit) - LLN) * 100
+        K = self.k.update(RSV, commit)
+        D = self.d.update(K, commit)
+        return K, D, K * 3 - D * 2
+
+
+class StreamRSI(StreamIndicator):
+    def __init__(self, N=24):
+        self.ref = _REF(1)
+        self.up, self.all = _EWM(alpha=1 / N), _EWM(alpha=1 / N)
+
+    def update(self, CLOSE, commit=False):
+        DIF = _FLOAT(CLOSE) - self.ref.update(CLOSE, commit)
+        return RD(self.up.update(np.maximum(DIF, 0), commit) / self.all.update(np.abs(DIF), commit) * 100)
+
+
+class StreamWR(StreamIndicator):
+    def __init__(self, N=10):
+        self.hhv, self.llv = _EXTREME(N, np.maximum), _EXTREME(N, np.minimum)
+
+    def update(self, CLOSE, HIGH, LOW, commit=False):
+        HHN = self.hhv.update(HIGH, commit)
+        return RD((HHN - _FLOAT(CLOSE)) / (HHN - self.llv.update(LOW, commit)) * 100)
+
+
+class StreamCCI(StreamIndicator):  # AVEDEV 围绕窗口均值，没有可累加的形式，每次按固定N个值计算，与历史长度无关
+    def __init__(self, N=14):
+        self.N = N
+        self.ma = _MEAN(N)
+        self.window = deque(maxlen=N - 1)
+
+    def update(self, CLOSE, HIGH, LOW, commit=False):
+        TP = (_FLOAT(HIGH) + _FLOAT(LOW) + _FLOAT(CLOSE)) / 3
+        MA = self.ma.update(TP, commit)
+        if len(self.window) == self.N - 1:
+            X = np.array([*self.window, TP], dtype=np.float64)
+            AVEDEV = np.abs(X - X.mean()).mean()
+        else:
+            AVEDEV = np.float64(np.nan)
+        if commit:  self.window.append(TP)
+        return (TP - MA) / (0.015 * AVEDEV)
+
+
+# ------------------ 按股票缓存：日线缓存换了（新的一天重新加载）就重新播种 --------------------------------------------
+class StreamCache:
+    def __init__(self, factory: Callable[[pd.DataFrame], any]):
+        self.factory = factory  # history -> 已播种的流式指标
+        self.streams: Dict[str, tuple] = {}  # { code: ((id(history), len(history)), stream) }
+
+    def get(self, code: str, history: pd.DataFrame) -> any:
+        key = (id(history), len(history))
+        item = self.streams.get(code)
+        if item is None or item[0] != key:
+            item = (key, self.factory(history))
+            self.streams[code] = item
+        return item[1]
+
+    def load(self, snapshot: Dict[str, Dict[str, any]], name: str, cache_history: Dict[str, pd.DataFrame]) -> None:
+        # 直接使用盘后快照里已播种的指标，日线缓存不变就不再重新播种
+        for code, entry in snapshot.items():
+            if name in entry and code in cache_history and cache_history[code] is not None:
+                history = cache_history[code]
+                self.streams[code] = ((id(history), len(history)), entry[name])
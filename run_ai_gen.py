@@ -6,7 +6,8 @@ from credentials import *
 from tools.utils_basic import logging_init, is_symbol
 from tools.utils_cache import *
 from tools.utils_ding import DingMessager
-from tools.utils_remote import concat_ak_quote_dict, DataSource
+from tools.utils_remote import DataSource
+from tools.utils_snapshot import build_indicator_snapshot, save_indicator_snapshot, load_indicator_snapshot
 
 from delegate.xt_subscriber import XtSubscriber, update_position_held
 
@@ -14,7 +15,8 @@ from trader.buyer import BaseBuyer as Buyer
 from trader.pools import StocksPoolWhitePrefixesMA as Pool
 from trader.seller_groups import DeepseekGroupSeller as Seller
 
-from selector.selector_deepseek import select
+from mytt.MyTT_stream import StreamCache
+from selector.selector_deepseek import seed_stream, select_stream
 
 # 数据存储模块
 from storage import create_data_store
@@ -35,8 +37,10 @@ PATH_MAXP = PATH_BASE + '/max_price.json'       # 记录建仓后历史最高
 PATH_MINP = PATH_BASE + '/min_price.json'       # 记录建仓后历史最低
 PATH_LOGS = PATH_BASE + '/logs.txt'             # 记录策略的历史日志
 PATH_INFO = PATH_BASE + '/tmp_{}.pkl'           # 用来缓存当天的指标信息
+PATH_SNAP = PATH_BASE + '/snap_{}.pkl'          # 盘后算好的下一交易日指标快照
 disk_lock = threading.Lock()                    # 操作磁盘文件缓存的锁
 cache_selected: Dict[str, Set] = {}             # 记录选股历史，去重
+cache_streams = StreamCache(seed_stream)        # 选股公式的流式指标，盘前用历史日线播种
 
 
 def debug(*args, **kwargs):
@@ -130,6 +134,7 @@ def prepare_history() -> None:
     now = datetime.datetime.now()
     for i in range(15, 30):
         delete_file(PATH_INFO.format((now - datetime.timedelta(days=i)).strftime('%Y_%m_%d')))
+        delete_file(PATH_SNAP.format((now - datetime.timedelta(days=i)).strftime('%Y_%m_%d')))
     cache_path = PATH_INFO.format(now.strftime('%Y_%m_%d'))
 
     start = get_prev_trading_date(now, PoolConf.day_count)
@@ -137,8 +142,8 @@ def prepare_history() -> None:
 
     # 白名单加持仓列表
     positions = my_delegate.check_positions()
-    history_list = my_pool.get_code_list()
-    history_list += [position.stock_code for position in positions if is_symbol(position.stock_code)]
+    holding_list = [position.stock_code for position in positions if is_symbol(position.stock_code)]
+    history_list = my_pool.get_code_list() + holding_list
 
     my_suber.download_cache_history(
         cache_path=cache_path,
@@ -147,18 +152,55 @@ def prepare_history() -> None:
         end=end,
         adjust=PoolConf.price_adjust,
         columns=PoolConf.columns,
-        data_source=data_source
+        data_source=data_source,
+        kline_store=data_store,
     )
 
+    # 优先用昨天盘后算好的快照，与日线不一致或缺失的股票在这里补算
+    snapshot = load_indicator_snapshot(PATH_SNAP.format(now.strftime('%Y_%m_%d')), now.strftime('%Y-%m-%d'))
+    snapshot = build_snapshot(my_suber.cache_history, history_list, holding_list, snapshot)
+    cache_streams.load(snapshot, 'formula', my_suber.cache_history)
+    my_seller.load_snapshot(snapshot)
+
+
+# ======== 盘后 ========
+
+
+def build_snapshot(histories: Dict, history_list: List[str], holding_list: List[str], snapshot: Dict = None) -> Dict:
+    # 选股公式的流式指标给所有股票，卖出指标只给持仓
+    snapshot = build_indicator_snapshot(histories, {'formula': seed_stream}, history_list, snapshot)
+    return build_indicator_snapshot(histories, my_seller.snapshot_factories(), holding_list, snapshot)
+
+
+def snapshot_indicators() -> None:
+    now = datetime.datetime.now()
+    if not check_is_open_day(now.strftime('%Y-%m-%d')):
+        return
+
+    # 下一个交易日盘前下载的日线范围
+    next_date = get_next_trading_date(now, 1, basic_format=False)
+    start = get_prev_trading_date(now, PoolConf.day_count - 1)
+    end = now.strftime('%Y%m%d')
+
+    positions = my_delegate.check_positions()
+    holding_list = [position.stock_code for position in positions if is_symbol(position.stock_code)]
+    history_list = my_pool.get_code_list() + holding_list
+
+    histories = {}
+    my_suber.download_from_remote(
+        history_list, start, end, PoolConf.price_adjust, PoolConf.columns, data_source, target=histories)
+
+    snapshot = build_snapshot(histories, history_list, holding_list)
+    save_indicator_snapshot(PATH_SNAP.format(next_date.replace('-', '_')), snapshot, next_date)
+    print(f'{len(snapshot)} indicator snapshots saved for {next_date}')
+
 
 # ======== 买点 ========
 
 
 def check_stock(code: str, quote: Dict, curr_date: str) -> (bool, Dict):
-    df = concat_ak_quote_dict(my_suber.cache_history[code], quote, curr_date)
-
-    result_df = select(df, code, quote)
-    buy = result_df['PASS'].values[-1]
+    stream = cache_streams.get(code, my_suber.cache_history[code])
+    buy = select_stream(stream, quote)
 
     return buy, {'reason': ''}
 
@@ -384,6 +426,7 @@ if __name__ == '__main__':
         path_deal=PATH_DEAL,
         path_assets=PATH_ASSETS,
         execute_strategy=execute_strategy,
+        finish_trade_day=snapshot_indicators,
         use_ap_scheduler=True,
         ding_messager=DING_MESSAGER,
         open_tick_memory_cache=True,
@@ -8,7 +8,9 @@ from credentials import *
 from tools.utils_basic import logging_init, is_symbol
 from tools.utils_cache import *
 from tools.utils_ding import DingMessager
+from tools.utils_state import flush_state_files
 from tools.utils_remote import DataSource
+from tools.utils_snapshot import build_indicator_snapshot, save_indicator_snapshot, load_indicator_snapshot
 
 from delegate.xt_delegate import xt_get_ticks
 from delegate.xt_subscriber import XtSubscriber, update_position_held
@@ -39,6 +41,7 @@ PATH_MAXP = PATH_BASE + '/max_price.json'       # 记录建仓后历史最高
 PATH_MINP = PATH_BASE + '/min_price.json'       # 记录建仓后历史最低
 PATH_LOGS = PATH_BASE + '/logs.txt'             # 记录策略的历史日志
 PATH_INFO = PATH_BASE + '/tmp_{}.pkl'           # 用来缓存当天的指标信息
+PATH_SNAP = PATH_BASE + '/snap_{}.pkl'          # 盘后算好的下一交易日指标快照
 disk_lock = threading.Lock()                    # 操作磁盘文件缓存的锁
 cache_selected: Dict[str, Set] = {}             # 记录选股历史，去重
 
@@ -132,6 +135,7 @@ def prepare_history() -> None:
     now = datetime.datetime.now()
     for i in range(15, 30):
         delete_file(PATH_INFO.format((now - datetime.timedelta(days=i)).strftime('%Y_%m_%d')))
+        delete_file(PATH_SNAP.format((now - datetime.timedelta(days=i)).strftime('%Y_%m_%d')))
     cache_path = PATH_INFO.format(now.strftime('%Y_%m_%d'))
 
     start = get_prev_trading_date(now, PoolConf.day_count)
@@ -148,9 +152,41 @@ def prepare_history() -> None:
         end=end,
         adjust=PoolConf.price_adjust,
         columns=PoolConf.columns,
-        data_source=data_source
+        data_source=data_source,
+        kline_store=data_store,
     )
 
+    # 优先用昨天盘后算好的快照，与日线不一致或缺失的股票在这里补算
+    snapshot = load_indicator_snapshot(PATH_SNAP.format(now.strftime('%Y_%m_%d')), now.strftime('%Y-%m-%d'))
+    snapshot = build_indicator_snapshot(
+        my_suber.cache_history, my_seller.snapshot_factories(), holding_list, snapshot)
+    my_seller.load_snapshot(snapshot)
+
+
+# ======== 盘后 ========
+
+
+def snapshot_indicators() -> None:
+    now = datetime.datetime.now()
+    if not check_is_open_day(now.strftime('%Y-%m-%d')):
+        return
+
+    # 下一个交易日盘前下载的日线范围
+    next_date = get_next_trading_date(now, 1, basic_format=False)
+    start = get_prev_trading_date(now, PoolConf.day_count - 1)
+    end = now.strftime('%Y%m%d')
+
+    positions = my_delegate.check_positions()
+    holding_list = [position.stock_code for position in positions if is_symbol(position.stock_code)]
+
+    histories = {}
+    my_suber.download_from_remote(
+        holding_list, start, end, PoolConf.price_adjust, PoolConf.columns, data_source, target=histories)
+
+    snapshot = build_indicator_snapshot(histories, my_seller.snapshot_factories(), holding_list)
+    save_indicator_snapshot(PATH_SNAP.format(next_date.replace('-', '_')), snapshot, next_date)
+    print(f'{len(snapshot)} indicator snapshots saved for {next_date}')
+
 
 # ======== 买点 ========
 
@@ -385,6 +421,7 @@ if __name__ == '__main__':
     schedule.every().day.at('08:05').do(held_increase)
     schedule.every().day.at('08:10').do(refresh_code_list)
     schedule.every().day.at('08:15').do(prepare_history)    # 必须先 refresh code list
+    schedule.every().day.at('15:45').do(snapshot_indicators)  # 收盘后日线更新了再算
 
     if '08:05' < temp_time < '15:30' and check_is_open_day(temp_date):
         held_increase()
@@ -407,6 +444,7 @@ if __name__ == '__main__':
         print('[手动结束进程]')
     finally:
         schedule.clear()
+        flush_state_files()
         my_delegate.shutdown()
         try:
             import sys
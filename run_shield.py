@@ -7,6 +7,7 @@ from credentials import *
 from tools.utils_basic import logging_init, is_symbol
 from tools.utils_cache import *
 from tools.utils_ding import DingMessager
+from tools.utils_state import flush_state_files
 
 from delegate.xt_subscriber import XtSubscriber, update_position_held
 
@@ -251,6 +252,7 @@ if __name__ == '__main__':
         print('[手动结束进程]')
     finally:
         schedule.clear()
+        flush_state_files()
         my_delegate.shutdown()
         try:
             import sys
@@ -1,15 +1,17 @@
 import time
 import math
+import numpy as np
 import logging
 import schedule
 
 from credentials import *
 
-from tools.utils_basic import logging_init, is_symbol, time_diff_seconds
+from tools.utils_basic import logging_init, is_symbol
 from tools.utils_cache import *
 from tools.utils_ding import DingMessager
 
 from delegate.xt_subscriber import XtSubscriber, update_position_held
+from delegate.tick_history import TickBuffer, time_str_to_seconds
 
 from trader.pools import StocksPoolWhiteCustomSymbol as Pool
 from trader.buyer import BaseBuyer as Buyer
@@ -128,27 +130,17 @@ def check_block_ticks(
     quote: dict,
     curr_time: str,
     curr_seconds: str,
-    ticks: list,
+    ticks: TickBuffer,
 ) -> bool:
     curr_price = quote['lastPrice']
 
-    # 获取一段之前的最大价格
-    max_price = curr_price
-    i = len(ticks) - 1
-    now_seconds = datetime.datetime.strptime(f'{curr_time}:{curr_seconds}', '%H:%M:%S')
-    while i >= 0:
-        i_seconds = datetime.datetime.strptime(ticks[i][0], '%H:%M:%S')
-        if time_diff_seconds(now_seconds, i_seconds) > BuyConf.block_seconds:
-            break
-        i_price = ticks[i][1]
-        if i_price < max_price:  # 保证时间段内的价格都是最大
-            return False
-
-        max_price = max(max_price, i_price)
-        i -= 1
-
-    # 最后还要保证没有已经炸板的情况
-    return curr_price >= max_price
+    # 获取一段时间内的 tick 价格（tick 按时间顺序追加，二分定位窗口起点）
+    now_seconds = time_str_to_seconds(f'{curr_time}:{curr_seconds}')
+    start = np.searchsorted(ticks.times, now_seconds - BuyConf.block_seconds, side='left')
+    window_prices = ticks.prices[start:]
+
+    # 保证时间段内的价格都是最大，且最后没有已经炸板的情况
+    return bool(np.all(window_prices == curr_price))
 
 
 def select_stocks(
@@ -95,16 +95,23 @@ import warnings
 warnings.filterwarnings("ignore")
 
 from mytt.MyTT_advance import *
+from mytt.LastBar import CHAIN_, EMA_BARS, SMA_BARS, TAIL_FORMULA
 
 
-def select(df: pd.DataFrame, code: str, quote: dict):
-    O = df.open
-    H = df.high
-    L = df.low
-    C = df.close
-    # VOL = df.volume
-    # AMOUNT = df.amount
+# 计算最后一天的 PASS 需要的K线数：GZ 里最长的依赖链，再加上 PC = REF(COUNT(~GZ, LM), 1)
+GZ_LOOKBACK = max(
+    CHAIN_(EMA_BARS(13), EMA_BARS(5)),                  # SL1
+    CHAIN_(8, SMA_BARS(3, 1), SMA_BARS(3, 1)),          # SL2
+    CHAIN_(2, SMA_BARS(13, 1)),                         # SL3
+    CHAIN_(13, SMA_BARS(3, 1), SMA_BARS(3, 1)),         # SL4
+    24,                                                 # SL5
+    CHAIN_(2, EMA_BARS(13), EMA_BARS(8)),               # SL6
+)
+LOOKBACK = CHAIN_(GZ_LOOKBACK, 5, 2)
 
+
+def formula(O, H, L, C) -> dict:
+    # O H L C 可以是一维序列（单只股票），也可以是 (时间 x 股票) 的二维面板
     DIFF = EMA(C, 8) - EMA(C, 13)
     DEA = EMA(DIFF, 5)
     SL1 = DIFF > DEA
@@ -138,19 +145,42 @@ def select(df: pd.DataFrame, code: str, quote: dict):
     PC = REF(COUNT(~GZ, LM), 1)
     LMZJ = GZ & (REF(~GZ, 1)) & (PC == LM)
 
-    df['SL1'] = SL1
-    df['SL2'] = SL2
-    df['SL3'] = SL3
-    df['SL4'] = SL4
-    df['SL5'] = SL5
-    df['SL6'] = SL6
-    df['GZ'] = GZ
-    df['PC'] = PC
+    DD = C > O
+    EE = C > REF(C, 1) * 1.02
+    FF = (H - MAX(C, O)) / (H - L) < 0.2
+
+    return {
+        'SL1': SL1, 'SL2': SL2, 'SL3': SL3, 'SL4': SL4, 'SL5': SL5, 'SL6': SL6,
+        'GZ': GZ, 'PC': PC, 'DD': DD, 'EE': EE, 'FF': FF,
+        'PASS': LMZJ & DD & EE & FF,
+    }
+
 
-    df['DD'] = C > O
-    df['EE'] = C > REF(C, 1) * 1.02
-    df['FF'] = (H - MAX(C, O)) / (H - L) < 0.2
+formula_tail = TAIL_FORMULA(formula)  # 尾部模式，只保证最后一天的结果
 
-    df['PASS'] = LMZJ & df['DD'] & df['EE'] & df['FF']
+
+def select(df: pd.DataFrame, code: str, quote: dict, tail: bool = False):
+    O = df.open
+    H = df.high
+    L = df.low
+    C = df.close
+    # VOL = df.volume
+    # AMOUNT = df.amount
+
+    for key, value in (formula_tail if tail else formula)(O, H, L, C).items():
+        df[key] = value
 
     return df
+
+
+def select_tail(df: pd.DataFrame, code: str, quote: dict):
+    """ 只用最近 LOOKBACK 根K线算最后一天的 PASS，配合 StockPool.filter_white_list_by_selector 的 lookback 使用 """
+    return select(df, code, quote, tail=True)
+
+
+def select_panel(panel: dict, codes: list) -> np.ndarray:
+    """ panel: { column: ndarray[时间, 股票] }，返回每只股票最后一天是否通过 """
+    # 包成 DataFrame，布尔运算遇到 REF 产生的 nan 时与单只股票的 Series 行为一致
+    O, H, L, C = (pd.DataFrame(panel[column]) for column in ('open', 'high', 'low', 'close'))
+    result = formula(O, H, L, C)
+    return np.asarray(result['PASS'])[-1]
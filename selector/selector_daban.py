@@ -22,10 +22,40 @@ BUY: AA AND BB AND CC AND DD AND EE AND FF AND GG AND HH AND II AND JJ;
 
 from mytt.MyTT import *
 from mytt.MyTT_advance import *
+from mytt.LastBar import CHAIN_, TAIL_FORMULA
 from tools.utils_basic import get_limiting_up_rate
 
 
-def select(df: pd.DataFrame, code: str, quote: dict):
+# 计算最后一天的 PASS 需要的K线数：SLOPE(MA(C, 60), 3) 与 COUNT(C >= REF(C, 1) * LIMITINGUPRATE, 60)
+LOOKBACK = max(CHAIN_(60, 3), CHAIN_(2, 60))
+
+
+def formula(H, C, VOL, LIMITINGUPRATE) -> dict:
+    # H C VOL 可以是一维序列（单只股票），也可以是 (时间 x 股票) 的二维面板，此时 LIMITINGUPRATE 为每只股票的涨停比例
+    ans = {}
+    ans['AA'] = C >= REF(C, 1) * LIMITINGUPRATE  # 价格是涨停
+    ans['BB'] = C > REF(HHV(C, 30), 1)           # 当日首次突破前30日内收盘新高
+    ans['CC'] = C < LLV(C, 60) * 2.0             # 现价 < 前60日最低 * 2
+    ans['DD'] = VOL < REF(VOL, 1) * 3.00         # 当日成交量 < 昨日成交 * 4.00
+
+    MA10 = MA(C, 10)
+    MA20 = MA(C, 20)
+    MA30 = MA(C, 30)
+    MA60 = MA(C, 60)
+    ans['EE'] = H < MA60 * 1.3                                  # 当日最高价 < 60日均线价格 * 1.3
+    ans['FF'] = (SLOPE(MA10, 3) > 0) & (SLOPE(MA20, 3) > 0) & \
+                (SLOPE(MA30, 3) > 0) & (SLOPE(MA60, 3) > 0)     # 均线上升趋势
+    ans['GG'] = (C > MA10) & (MA10 > MA20) & \
+                (MA20 > MA30) & (MA30 > MA60)                   # 现价10日20日30日60日均线呈多头排列
+    ans['HH'] = COUNT(C >= REF(C, 1) * LIMITINGUPRATE, 60) < 3  # 60天内涨停次数小于三次
+    ans['II'] = COUNT(C >= REF(C, 1) * LIMITINGUPRATE, 3) < 1   # 最近三天没有过涨停
+    return ans
+
+
+formula_tail = TAIL_FORMULA(formula)  # 尾部模式，只保证最后一天的结果
+
+
+def select(df: pd.DataFrame, code: str, quote: dict, tail: bool = False):
     LIMITINGUPRATE = get_limiting_up_rate(code)
 
     # O = df.open
@@ -35,25 +65,28 @@ def select(df: pd.DataFrame, code: str, quote: dict):
     VOL = df.volume
     # AMOUNT = df.amount
 
-    df['AA'] = C >= REF(C, 1) * LIMITINGUPRATE  # 价格是涨停
-    df['BB'] = C > REF(HHV(C, 30), 1)           # 当日首次突破前30日内收盘新高
-    df['CC'] = C < LLV(C, 60) * 2.0             # 现价 < 前60日最低 * 2
-    df['DD'] = VOL < REF(VOL, 1) * 3.00         # 当日成交量 < 昨日成交 * 4.00
-
-    MA10 = MA(C, 10)
-    MA20 = MA(C, 20)
-    MA30 = MA(C, 30)
-    MA60 = MA(C, 60)
-    df['EE'] = H < MA60 * 1.3                                   # 当日最高价 < 60日均线价格 * 1.3
-    df['FF'] = (SLOPE(MA10, 3) > 0) & (SLOPE(MA20, 3) > 0) & \
-               (SLOPE(MA30, 3) > 0) & (SLOPE(MA60, 3) > 0)      # 均线上升趋势
-    df['GG'] = (C > MA10) & (MA10 > MA20) & \
-               (MA20 > MA30) & (MA30 > MA60)                    # 现价10日20日30日60日均线呈多头排列
-    df['HH'] = COUNT(C >= REF(C, 1) * LIMITINGUPRATE, 60) < 3   # 60天内涨停次数小于三次
-    df['II'] = COUNT(C >= REF(C, 1) * LIMITINGUPRATE, 3) < 1    # 最近三天没有过涨停
+    for key, value in (formula_tail if tail else formula)(H, C, VOL, LIMITINGUPRATE).items():
+        df[key] = value
 
     df['PASS'] = df['AA']
     for i in range(ord('B'), ord('I') + 1):
         df['PASS'] = df['PASS'] & df[f'{chr(i)}{chr(i)}']
 
     return df
+
+
+def select_tail(df: pd.DataFrame, code: str, quote: dict):
+    """ 只用最近 LOOKBACK 根K线算最后一天的 PASS，配合 StockPool.filter_white_list_by_selector 的 lookback 使用 """
+    return select(df, code, quote, tail=True)
+
+
+def select_panel(panel: dict, codes: list) -> np.ndarray:
+    """ panel: { column: ndarray[时间, 股票] }，返回每只股票最后一天是否通过 """
+    LIMITINGUPRATE = np.array([get_limiting_up_rate(code) for code in codes])
+    H, C, VOL = (pd.DataFrame(panel[column]) for column in ('high', 'close', 'volume'))
+    result = formula(H, C, VOL, LIMITINGUPRATE)
+
+    passed = np.ones(len(codes), dtype=bool)
+    for value in result.values():
+        passed &= np.asarray(value)[-1]
+    return passed
@@ -90,19 +90,22 @@
 # from mytt.MyTT import *
 from mytt.MyTT_advance import *
 from mytt.MyTT_custom import *
+from mytt.LastBar import CHAIN_, EMA_BARS, SMA_BARS, TAIL_FORMULA
+from mytt.MyTT_stream import StreamIndicator, StreamEMA, StreamMA, StreamSMA, StreamHHV, StreamREF
+from tools.utils_panel import get_panel_lengths
 
 
-def select(df: pd.DataFrame, code: str, quote: dict):
-    if len(df.close) < 90:
-        df['PASS'] = False
-        return df
+# 计算最后一天的 选股信号 需要的K线数，且不少于 select 要求的 90 根
+LOOKBACK = max(
+    CHAIN_(EMA_BARS(30), 2),                            # COND_趋势
+    CHAIN_(2, SMA_BARS(5, 1), 4),                       # COND_动量
+    30,                                                 # COND_流动性
+    90,
+)
 
-    O = df.open
-    C = df.close
-    H = df.high
-    L = df.low
-    V = df.volume
 
+def formula(O, C, H, L, V):
+    # O C H L V 可以是一维序列（单只股票），也可以是 (时间 x 股票) 的二维面板
     # ————— 参数模块（可自定义调整）—————
     趋势周期 = 30   # 趋势判定周期，建议20~60
     动量周期 = 5    # 短期动量周期，建议5~10
@@ -139,7 +142,81 @@ def select(df: pd.DataFrame, code: str, quote: dict):
     # 波动率可控
     # 基础流动性保障
     选股信号 = COND_趋势 & COND_放量 & COND_动量 & COND_波动 & COND_流动性
+    return 选股信号
+
+
+formula_tail = TAIL_FORMULA(formula)  # 尾部模式，只保证最后一天的结果
 
-    df['PASS'] = 选股信号
+
+def select(df: pd.DataFrame, code: str, quote: dict, tail: bool = False):
+    if len(df.close) < 90:
+        df['PASS'] = False
+        return df
+
+    O = df.open
+    C = df.close
+    H = df.high
+    L = df.low
+    V = df.volume
+
+    df['PASS'] = (formula_tail if tail else formula)(O, C, H, L, V)
 
     return df
+
+
+def select_tail(df: pd.DataFrame, code: str, quote: dict):
+    """ 只用最近 LOOKBACK 根K线算最后一天的 PASS，配合 StockPool.filter_white_list_by_selector 的 lookback 使用 """
+    return select(df, code, quote, tail=True)
+
+
+def select_panel(panel: dict, codes: list) -> np.ndarray:
+    """ panel: { column: ndarray[时间, 股票] }，返回每只股票最后一天是否通过 """
+    O, C, H, L, V = (pd.DataFrame(panel[column]) for column in ('open', 'close', 'high', 'low', 'volume'))
+    选股信号 = formula(O, C, H, L, V)
+    return np.asarray(选股信号)[-1] & (get_panel_lengths(panel) >= 90)
+
+
+class FormulaStream(StreamIndicator):
+    """ formula 的流式版本，只算最后一天的 选股信号，与 select(历史 + 当天)['PASS'] 的最后一个值相同 """
+    def __init__(self):
+        self.count = 0  # 已提交的K线数量
+        self.ma_trend = StreamEMA(30)
+        self.vol_base, self.vol_long = StreamMA(5), StreamMA(30)
+        self.hhv_high = StreamHHV(5)
+        self.ref_close, self.ref_rsi = StreamREF(1), StreamREF(3)
+        self.rsi_up, self.rsi_all = StreamSMA(5), StreamSMA(5)
+        self.atr = StreamMA(5)
+
+    def update(self, O, C, H, L, V, commit=False):
+        # 子指标的 last 是前一天的值，即 REF(X, 1)，要在 step 之前读取
+        REF_趋势线 = self.ma_trend.last
+        MA_趋势线 = self.ma_trend.step(C, commit=commit)
+        趋势角度 = ATAN((MA_趋势线 / REF_趋势线 - 1) * 100) * 180 / 3.1416
+        COND_趋势 = 趋势角度 > 15
+
+        REF_HHV = self.hhv_high.last
+        self.hhv_high.step(H, commit=commit)
+        COND_放量 = (V > self.vol_base.step(V, commit=commit) * 1.6) & (C > REF_HHV)
+
+        REF_C = self.ref_close.step(C, commit=commit)
+        RSI_动量 = self.rsi_up.step(MAX(C - REF_C, 0), commit=commit) \
+            / self.rsi_all.step(ABS(C - REF_C), commit=commit) * 100
+        COND_动量 = (RSI_动量 > 60) & (RSI_动量 > self.ref_rsi.step(RSI_动量, commit=commit))
+
+        ATR值 = self.atr.step(MAX(MAX(H - L, ABS(REF_C - H)), ABS(REF_C - L)), commit=commit)
+        COND_波动 = (ATR值 / C) < 3 / 100
+
+        COND_流动性 = V > self.vol_long.step(V, commit=commit) * 0.5
+
+        count = self.count + 1
+        if commit:  self.count = count
+        return bool(COND_趋势 & COND_放量 & COND_动量 & COND_波动 & COND_流动性) and count >= 90
+
+
+def seed_stream(history: pd.DataFrame) -> FormulaStream:
+    return FormulaStream().seed(history.open, history.close, history.high, history.low, history.volume)
+
+
+def select_stream(stream: FormulaStream, quote: dict) -> bool:
+    """ 盘中用当前 quote 组成的临时K线判断 """
+    return stream.peek(quote['open'], quote['lastPrice'], quote['high'], quote['low'], quote['volume'])
@@ -21,7 +21,9 @@ def create_data_store(mode: str = 'file', config: Optional[Dict] = None) -> Base
     
     if mode == 'file':
         cache_path = config.get('cache_path')
-        return FileStore(cache_path) if cache_path else FileStore()
+        write_behind = config.get('write_behind', False)
+        wal = config.get('wal', False)
+        return FileStore(cache_path, write_behind, wal) if cache_path else FileStore(write_behind=write_behind, wal=wal)
     elif mode == 'redis':
         return RedisStore(
             host=config.get('host'), port=config.get('port'),
@@ -37,7 +39,10 @@ def create_data_store(mode: str = 'file', config: Optional[Dict] = None) -> Base
         return ClickHouseStore(
             host=config.get('host'), port=config.get('port'),
             database=config.get('database'), user=config.get('user'),
-            password=config.get('password')
+            password=config.get('password'),
+            trade_batch_size=config.get('trade_batch_size', 0),
+            trade_flush_interval=config.get('trade_flush_interval', 1.0),
+            trade_spill_path=config.get('trade_spill_path')
         )
     elif mode == 'hybrid':
         return HybridStore(
@@ -46,7 +51,12 @@ def create_data_store(mode: str = 'file', config: Optional[Dict] = None) -> Base
             enable_mysql=config.get('enable_mysql', True),
             enable_clickhouse=config.get('enable_clickhouse', True),
             enable_dual_write=config.get('enable_dual_write', True),
-            enable_auto_fallback=config.get('enable_auto_fallback', True)
+            enable_auto_fallback=config.get('enable_auto_fallback', True),
+            write_behind=config.get('write_behind', False),
+            wal=config.get('wal', False),
+            async_writes=config.get('async_writes', False),
+            async_primary=config.get('async_primary', False),
+            trade_batch_size=config.get('trade_batch_size', 0)
         )
 
 
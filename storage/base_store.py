@@ -181,6 +181,65 @@ class BaseDataStore(ABC):
         """
         pass
 
+    def get_position_states(self, account_id: str, codes: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        Query holding days, max price and min price of many positions at once.
+
+        The default implementation calls the single-key getters; backends
+        override it with one bulk read (Redis pipeline, one JSON load, ...).
+
+        Args:
+            account_id: Account ID
+            codes: Stock codes
+
+        Returns:
+            {code: {'held_days': int|None, 'max_price': float|None, 'min_price': float|None}}
+            with an entry for every code, or None if the backend failed
+
+        Example:
+            >>> store.get_position_states('55009728', ['SH600000'])
+            {'SH600000': {'held_days': 5, 'max_price': 10.85, 'min_price': 9.5}}
+        """
+        return {
+            code: {
+                'held_days': self.get_held_days(code, account_id),
+                'max_price': self.get_max_price(code, account_id),
+                'min_price': self.get_min_price(code, account_id),
+            }
+            for code in codes
+        }
+
+    def update_price_extremes(self, account_id: str, extremes: Dict[str, Tuple]) -> bool:
+        """
+        Raise max prices and lower min prices of many positions at once.
+
+        A stored max price is replaced only by a higher price and a stored
+        min price only by a lower one (missing values are always set).
+        Prices are rounded to 3 decimals like update_max_price/update_min_price.
+
+        Args:
+            account_id: Account ID
+            extremes: {code: (high, low)}, either price may be None to skip it
+
+        Returns:
+            True if the update succeeded
+
+        Example:
+            >>> store.update_price_extremes('55009728', {'SH600000': (10.90, 9.45)})
+            True
+        """
+        success = True
+        for code, (high, low) in extremes.items():
+            if high is not None:
+                current = self.get_max_price(code, account_id)
+                if current is None or round(high, 3) > current:
+                    success = self.update_max_price(code, account_id=account_id, price=high) is not False and success
+            if low is not None:
+                current = self.get_min_price(code, account_id)
+                if current is None or round(low, 3) < current:
+                    success = self.update_min_price(code, account_id=account_id, price=low) is not False and success
+        return success
+
     # ===== Trade Record Operations (COOL layer) =====
 
     @abstractmethod
@@ -377,6 +436,58 @@ class BaseDataStore(ABC):
         """
         pass
 
+    def batch_append_kline(self, klines: Dict[str, pd.DataFrame]) -> bool:
+        """
+        Append daily kline rows for many stocks at once.
+
+        Rows with the same (code, datetime) as stored rows replace them.
+        Backends without kline persistence keep this default and return False.
+
+        Args:
+            klines: {code: DataFrame with columns datetime (YYYYMMDD int),
+                    open, high, low, close, volume, amount}
+
+        Returns:
+            True if all rows were written, False otherwise
+
+        Example:
+            >>> store.batch_append_kline({'SH600000': df_today})
+            True
+        """
+        return False
+
+    def batch_replace_kline(self, klines: Dict[str, pd.DataFrame]) -> bool:
+        """
+        Replace the whole daily kline history of many stocks at once.
+
+        All stored rows of each given code are removed before its new rows are written,
+        e.g. when a full download backfills the store.
+        Backends without kline persistence keep this default and return False.
+
+        Args:
+            klines: {code: DataFrame}, same columns as batch_append_kline
+
+        Returns:
+            True if all rows were written, False otherwise
+        """
+        return False
+
+    def delete_kline(self, codes: List[str]) -> bool:
+        """
+        Delete all stored daily kline rows of the given stocks.
+
+        Used when the local history of a stock is dropped, e.g. after an ex-rights event
+        invalidates its forward-adjusted prices.
+        Backends without kline persistence keep this default and return False.
+
+        Args:
+            codes: Stock codes to delete
+
+        Returns:
+            True if the rows were deleted, False otherwise
+        """
+        return False
+
     # ===== Account Management (WARM layer) =====
 
     @abstractmethod
@@ -622,6 +733,17 @@ class BaseDataStore(ABC):
 
     # ===== Connection Management =====
 
+    def flush(self) -> None:
+        """
+        Persist buffered writes (write-behind backends).
+
+        Backends that write through immediately need not override this.
+
+        Example:
+            >>> store.flush()
+        """
+        pass
+
     @abstractmethod
     def close(self) -> None:
         """
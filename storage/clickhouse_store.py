@@ -10,8 +10,14 @@ COOL层存储,用于交易记录和K线数据的时序数据存储
 - 海量历史数据查询和聚合统计
 """
 
+import os
+import json
+import struct
+import threading
 from clickhouse_driver import Client
+from clickhouse_driver.errors import ErrorCodes, ServerException, TypeMismatchError
 from typing import Optional, Dict, List, Tuple
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from decimal import Decimal
@@ -20,6 +26,318 @@ from storage.base_store import BaseDataStore
 from storage.config import CLICKHOUSE_CONFIG
 
 
+TRADE_COLUMNS = [
+    'timestamp', 'date', 'account_id', 'stock_code', 'stock_name',
+    'order_type', 'strategy_name', 'price', 'volume', 'amount', 'remark',
+]
+
+
+def _trade_row(
+    account_id: str,
+    timestamp: str,
+    stock_code: str,
+    stock_name: str,
+    order_type: str,
+    remark: str,
+    price: float,
+    volume: int,
+    strategy_name: Optional[str] = None
+) -> tuple:
+    """record_trade 的参数转换为 trade 表的一行,列顺序与 TRADE_COLUMNS 一致"""
+    dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    amount = round(price * volume, 2)
+    return (dt, dt.date(), account_id, stock_code, stock_name,
+            order_type, strategy_name or '', price, volume, amount, remark)
+
+
+# 服务端因行数据本身拒绝写入的错误码,拆分批次找出这些行; 断连、超时、TOO_MANY_PARTS 等其他错误整批保留重试
+REJECTED_ERROR_CODES = {
+    ErrorCodes.CANNOT_PARSE_TEXT, ErrorCodes.CANNOT_PARSE_NUMBER, ErrorCodes.CANNOT_PARSE_DATE,
+    ErrorCodes.CANNOT_PARSE_DATETIME, ErrorCodes.CANNOT_PARSE_QUOTED_STRING,
+    ErrorCodes.CANNOT_PARSE_INPUT_ASSERTION_FAILED, ErrorCodes.CANNOT_CONVERT_TYPE, ErrorCodes.TYPE_MISMATCH,
+    ErrorCodes.INCORRECT_DATA, ErrorCodes.VALUE_IS_OUT_OF_RANGE_OF_DATA_TYPE,
+    ErrorCodes.CANNOT_INSERT_NULL_IN_ORDINARY_COLUMN, ErrorCodes.TOO_LARGE_STRING_SIZE,
+    ErrorCodes.ARGUMENT_OUT_OF_BOUND,
+}
+
+
+def _is_rejected(e: Exception) -> bool:
+    """写入失败是否因为行数据本身 (服务端拒绝或客户端无法编码),而不是连接或服务端状态"""
+    if isinstance(e, ServerException):
+        return e.code in REJECTED_ERROR_CODES
+    return isinstance(e, (TypeMismatchError, TypeError, ValueError, OverflowError, struct.error))
+
+
+KLINE_COLUMNS = ['date', 'datetime', 'open', 'high', 'low', 'close', 'volume', 'amount']
+KLINE_DTYPES = {'datetime': np.int64, 'open': np.float64, 'high': np.float64, 'low': np.float64,
+                'close': np.float64, 'volume': np.int64, 'amount': np.float64}
+
+# get_kline / batch_get_kline 共用的列: datetime 由 date 计算为 YYYYMMDD 整数,
+# 数值列在服务端转为 Float64 / Int64, 避免逐行转换 Decimal
+KLINE_SELECT = '''
+                    date,
+                    toYYYYMMDD(date) AS datetime,
+                    toFloat64(open) AS open,
+                    toFloat64(high) AS high,
+                    toFloat64(low) AS low,
+                    toFloat64(close) AS close,
+                    toInt64(volume) AS volume,
+                    toFloat64(amount) AS amount'''
+
+
+def _split_kline_columns(columns: list) -> Dict[str, pd.DataFrame]:
+    """
+    列式查询结果 [stock_code, *KLINE_COLUMNS] 按 stock_code 一次切分
+
+    每列只转换一次为 NumPy 数组,按代码排序后用切片取出每只股票的行,
+    不对整个结果逐个代码做布尔过滤
+    """
+    if not columns or len(columns[0]) == 0:
+        return {}
+
+    codes, uniques = pd.factorize(np.asarray(columns[0], dtype=object))
+    arrays = {
+        name: np.asarray(values, dtype=KLINE_DTYPES.get(name, object))
+        for name, values in zip(KLINE_COLUMNS, columns[1:])
+    }
+
+    # ORDER BY stock_code 时已经有序, 这里只是保证切片正确
+    if np.any(codes[1:] < codes[:-1]):
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        arrays = {name: array[order] for name, array in arrays.items()}
+
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+    return {
+        code: pd.DataFrame({name: array[bounds[i]:bounds[i + 1]] for name, array in arrays.items()})
+        for i, code in enumerate(uniques)
+    }
+
+
+class TradeBuffer:
+    """
+    交易记录的批量写入缓冲
+
+    record_trade 只把行放入内存缓冲 (并追加到本地 spill 文件),后台线程在缓冲达到 batch_size 行
+    或距上次写入超过 flush_interval 秒时,用列式 INSERT 一次写入整批,避免 MergeTree 产生大量小 part
+    - 断连、超时等写入失败时整批留在缓冲和 spill 文件中一直重试,连续失败时递增等待 (最多 max_backoff 秒)
+    - 服务端拒绝行数据时 (见 REJECTED_ERROR_CODES) 二分拆分批次,写入其余的行,
+      单独写入仍被拒绝的行移到死信文件 {spill}.failed.jsonl,不再阻塞后面的交易
+    - 缓冲最多 max_rows 行,已满时拒绝新的交易 (append 返回 False),由调用方降级
+    - spill 文件记录还没写入 ClickHouse 的 record_trade 参数,每次写入成功后原子替换为剩余的行,
+      进程崩溃后重启时重新放入缓冲; 死信文件中的行在启动时也重新放入缓冲再尝试一次
+    """
+
+    def __init__(
+        self,
+        client,
+        database: str,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        spill_path: Optional[str] = None,
+        max_rows: int = 100000,
+        max_backoff: float = 60.0
+    ):
+        self.client = client
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.failed_path = os.path.splitext(spill_path)[0] + '.failed.jsonl' if spill_path else None
+        self.max_rows = max_rows
+        self.max_backoff = max_backoff
+
+        self.rows: List[tuple] = []       # 等待写入的行
+        self.args: List[list] = []        # 与 rows 一一对应的 record_trade 参数,用于 spill 文件
+        self.flush_count = 0              # INSERT 次数
+        self.flushed_rows = 0             # 已写入的行数
+        self.failures = 0                 # 连续写入失败的次数
+        self.dead_rows = 0                # 被拒绝移到死信文件的行数
+        self.rejected_rows = 0            # 缓冲已满被拒绝的行数
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 同一时间只有一个 INSERT
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+        self._spill = None
+        if spill_path:
+            replayed = self._recover()
+            self._spill = open(spill_path, 'a', encoding='utf-8')
+            if replayed:
+                # 死信中的行先并入 spill 文件再删除死信文件,不会丢失
+                with self._lock:
+                    self._rewrite_spill()
+                os.remove(self.failed_path)
+
+        self._thread = threading.Thread(target=self._run, name='clickhouse-trade-buffer', daemon=True)
+        self._thread.start()
+
+    def _recover(self) -> int:
+        """
+        把 spill 文件中还没写入的交易和死信文件中被拒绝的交易重新放入缓冲
+
+        Returns:
+            从死信文件放入缓冲的行数
+        """
+        replayed = 0
+        for path in [self.spill_path, self.failed_path]:
+            if not os.path.exists(path):
+                continue
+            count = 0
+            with open(path, 'r', encoding='utf-8') as r:
+                for line in r:
+                    try:
+                        args = json.loads(line)
+                        self.rows.append(_trade_row(*args))
+                        self.args.append(args)
+                        count += 1
+                    except (ValueError, TypeError):
+                        print(f'[ClickHouseStore] skip unreadable trade in {path}: {line.strip()}')
+            if count > 0:
+                print(f'[ClickHouseStore] recovered {count} trades from {path}')
+            if path == self.failed_path:
+                replayed = count
+        return replayed
+
+    def _rewrite_spill(self):
+        """spill 文件只保留缓冲中的行,调用方持有 _lock"""
+        temp_path = self.spill_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as w:
+            for args in self.args:
+                w.write(json.dumps(args, ensure_ascii=False) + '\n')
+        self._spill.close()
+        os.replace(temp_path, self.spill_path)
+        self._spill = open(self.spill_path, 'a', encoding='utf-8')
+
+    def append(self, args: list) -> bool:
+        """
+        放入一笔交易,参数顺序与 record_trade 相同
+
+        Returns:
+            True: 已放入缓冲; False: 缓冲已满
+        """
+        row = _trade_row(*args)
+        with self._lock:
+            if len(self.rows) >= self.max_rows:
+                self.rejected_rows += 1
+                print(f'[ClickHouseStore] trade buffer full ({self.max_rows} rows), reject {args[2]}')
+                return False
+            if self._spill is not None:
+                self._spill.write(json.dumps(args, ensure_ascii=False) + '\n')
+                self._spill.flush()
+            self.rows.append(row)
+            self.args.append(args)
+            full = len(self.rows) >= self.batch_size
+        if full:
+            self._wakeup.set()
+        return True
+
+    def _insert(self, rows: List[tuple]) -> None:
+        self.client.execute(
+            f'INSERT INTO {self.database}.trade ({", ".join(TRADE_COLUMNS)}) VALUES',
+            [list(column) for column in zip(*rows)],
+            columnar=True
+        )
+
+    def _isolate(self, rows: List[tuple], start: int, end: int, written: List[int], rejected: List[int]):
+        """
+        二分拆分被拒绝的 rows[start:end],写入可以写入的部分; 单独写入仍被拒绝的行记入 rejected,
+        写入成功的行记入 written,遇到连接等其他错误时向上抛出
+        """
+        if end - start == 1:
+            rejected.append(start)
+            return
+        mid = (start + end) // 2
+        for lo, hi in [(start, mid), (mid, end)]:
+            try:
+                self._insert(rows[lo:hi])
+                written.extend(range(lo, hi))
+            except Exception as e:
+                if not _is_rejected(e):
+                    raise
+                self._isolate(rows, lo, hi, written, rejected)
+
+    def flush(self) -> bool:
+        """把缓冲中的行一次写入 ClickHouse,失败时保留在缓冲中,被拒绝的行移到死信文件"""
+        with self._flush_lock:
+            with self._lock:
+                rows = self.rows[:]
+                count = len(rows)
+            if count == 0:
+                return True
+
+            written, rejected = [], []
+            try:
+                self._insert(rows)
+                written = list(range(count))
+            except Exception as e:
+                if not _is_rejected(e):
+                    self.failures += 1
+                    print(f'[ClickHouseStore] flush {count} trades failed, keep retrying: {e}')
+                    return False
+
+                print(f'[ClickHouseStore] flush {count} trades rejected, split to find bad rows: {e}')
+                try:
+                    self._isolate(rows, 0, count, written, rejected)
+                except Exception as e:
+                    self.failures += 1
+                    print(f'[ClickHouseStore] flush {count - len(written)} trades failed, keep retrying: {e}')
+
+            self._remove(count, written, rejected)
+            if len(written) + len(rejected) == count:
+                self.failures = 0
+            if written:
+                self.flush_count += 1
+                self.flushed_rows += len(written)
+            return not rejected and len(written) == count
+
+    def _remove(self, count: int, written: List[int], rejected: List[int]):
+        """从缓冲的前 count 行中移除已写入的行,被拒绝的行写入死信文件后移除,调用方持有 _flush_lock"""
+        with self._lock:
+            if rejected:
+                dead = [self.args[i] for i in rejected]
+                if self.failed_path:
+                    try:
+                        with open(self.failed_path, 'a', encoding='utf-8') as w:
+                            for args in dead:
+                                w.write(json.dumps(args, ensure_ascii=False) + '\n')
+                        print(f'[ClickHouseStore] move {len(dead)} rejected trades to {self.failed_path}')
+                    except Exception as e:
+                        print(f'[ClickHouseStore] save {len(dead)} rejected trades failed: {e}')
+                        rejected = []  # 保留在缓冲中,下次继续尝试
+                else:
+                    print(f'[ClickHouseStore] drop {len(dead)} rejected trades: {dead}')
+                self.dead_rows += len(rejected)
+
+            done = set(written).union(rejected)
+            if not done:
+                return
+            # 写入期间新加入的行留在缓冲中
+            self.rows[:count] = [row for i, row in enumerate(self.rows[:count]) if i not in done]
+            self.args[:count] = [args for i, args in enumerate(self.args[:count]) if i not in done]
+            if self._spill is not None:
+                self._rewrite_spill()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # 连续失败时递增等待
+            self._wakeup.wait(min(self.flush_interval * (self.failures + 1), self.max_backoff))
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self) -> bool:
+        """停止后台线程并写入剩余的行,写入失败的行保留在 spill 文件中"""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        success = self.flush()
+        with self._lock:
+            if self._spill is not None and not self._spill.closed:
+                self._spill.close()
+        return success
+
+
 class ClickHouseStore(BaseDataStore):
     """
     ClickHouse存储实现 (COOL层)
@@ -41,6 +359,9 @@ class ClickHouseStore(BaseDataStore):
         database: str = None,
         user: str = None,
         password: str = None,
+        trade_batch_size: int = 0,
+        trade_flush_interval: float = 1.0,
+        trade_spill_path: Optional[str] = None,
         **kwargs
     ):
         """
@@ -52,6 +373,10 @@ class ClickHouseStore(BaseDataStore):
             database: ClickHouse数据库名,默认从config.py读取
             user: ClickHouse用户名,默认从config.py读取
             password: ClickHouse密码,默认从config.py读取
+            trade_batch_size: 大于 0 时 record_trade 先放入缓冲,攒够这么多行或超过 trade_flush_interval 秒
+                              后批量写入 (见 TradeBuffer),为 0 时每笔交易立即写入
+            trade_flush_interval: 缓冲中的交易最长等待写入的秒数
+            trade_spill_path: 缓冲的本地 spill 文件,进程崩溃后重启时写入还没写入的交易
             **kwargs: 其他clickhouse_driver.Client参数
         """
         # 使用配置文件中的默认值
@@ -74,6 +399,13 @@ class ClickHouseStore(BaseDataStore):
         self.client = Client(**config)
         self.database = config['database']
 
+        # 交易批量写入缓冲,使用单独的连接 (clickhouse_driver.Client 不是线程安全的)
+        self.trade_buffer = None
+        if trade_batch_size > 0:
+            self.trade_buffer = TradeBuffer(
+                Client(**config), self.database, trade_batch_size, trade_flush_interval, trade_spill_path
+            )
+
     # ==================== 交易记录 (Trade Records) ====================
 
     def record_trade(
@@ -91,19 +423,17 @@ class ClickHouseStore(BaseDataStore):
         """
         记录交易
 
-        Performance: ClickHouse目标 <3ms (单条插入)
+        Performance: ClickHouse目标 <3ms (单条插入); 开启批量写入时只放入内存缓冲
 
         Args:
             timestamp: 交易时间戳 (YYYY-MM-DD HH:MM:SS)
             order_type: 订单类型 (buy_order/sell_order/buy_trade/sell_trade/cancel)
         """
         try:
-            # 解析时间戳
-            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-            date = dt.date()
-
-            # 计算成交金额
-            amount = round(price * volume, 2)
+            args = [account_id, timestamp, stock_code, stock_name,
+                    order_type, remark, price, volume, strategy_name]
+            if self.trade_buffer is not None:
+                return self.trade_buffer.append(args)
 
             # 插入数据
             self.client.execute(
@@ -113,8 +443,7 @@ class ClickHouseStore(BaseDataStore):
                  order_type, strategy_name, price, volume, amount, remark)
                 VALUES
                 ''',
-                [(dt, date, account_id, stock_code, stock_name,
-                  order_type, strategy_name or '', price, volume, amount, remark)]
+                [_trade_row(*args)]
             )
             return True
 
@@ -139,6 +468,9 @@ class ClickHouseStore(BaseDataStore):
                                     order_type, price, volume, amount, remark]
         """
         try:
+            # 先写入缓冲中的交易,查询结果包含刚记录的交易
+            self.flush()
+
             # 构建WHERE子句
             where_clauses = [f"account_id = '{account_id}'"]
             if start_date:
@@ -212,6 +544,8 @@ class ClickHouseStore(BaseDataStore):
             DataFrame with aggregated results
         """
         try:
+            self.flush()
+
             # 构建GROUP BY子句
             if group_by == 'stock':
                 group_cols = 'stock_code, stock_name'
@@ -281,51 +615,36 @@ class ClickHouseStore(BaseDataStore):
             frequency: 'daily' (日线, 其他频率暂不支持)
 
         Returns:
-            DataFrame with columns: [date, datetime, open, high, low, close, volume, amount]
+            DataFrame with columns: [date, datetime, open, high, low, close, volume, amount],
+            列和类型与 batch_get_kline 相同, datetime 为 YYYYMMDD 整数
         """
         try:
             if frequency != 'daily':
                 print(f'[ClickHouseStore] Only daily frequency is supported')
                 return pd.DataFrame()
 
-            # 执行查询
             query = f'''
-                SELECT
-                    date,
-                    datetime,
-                    open,
-                    high,
-                    low,
-                    close,
-                    volume,
-                    amount
+                SELECT{KLINE_SELECT}
                 FROM {self.database}.daily_kline
-                WHERE stock_code = '{stock_code}'
-                  AND date >= '{start_date}'
-                  AND date <= '{end_date}'
+                WHERE stock_code = %(code)s
+                  AND date >= %(start_date)s
+                  AND date <= %(end_date)s
                 ORDER BY date ASC
             '''
 
-            result = self.client.execute(query)
+            columns = self.client.execute(query, {
+                'code': stock_code,
+                'start_date': start_date,
+                'end_date': end_date,
+            }, columnar=True)
 
-            if not result:
-                return pd.DataFrame(columns=[
-                    'date', 'datetime', 'open', 'high', 'low', 'close', 'volume', 'amount'
-                ])
+            if not columns or len(columns[0]) == 0:
+                return pd.DataFrame(columns=KLINE_COLUMNS)
 
-            df = pd.DataFrame(result, columns=[
-                'date', 'datetime', 'open', 'high', 'low', 'close', 'volume', 'amount'
-            ])
-
-            # 转换数据类型
-            df['open'] = df['open'].astype(float)
-            df['high'] = df['high'].astype(float)
-            df['low'] = df['low'].astype(float)
-            df['close'] = df['close'].astype(float)
-            df['volume'] = df['volume'].astype(int)
-            df['amount'] = df['amount'].astype(float)
-
-            return df
+            return pd.DataFrame({
+                name: np.asarray(values, dtype=KLINE_DTYPES.get(name, object))
+                for name, values in zip(KLINE_COLUMNS, columns)
+            })
 
         except Exception as e:
             print(f'[ClickHouseStore] get_kline failed: {e}')
@@ -336,68 +655,60 @@ class ClickHouseStore(BaseDataStore):
         stock_codes: List[str],
         start_date: str,
         end_date: str,
-        frequency: str = 'daily'
+        frequency: str = 'daily',
+        chunk_size: int = 1000
     ) -> Dict[str, pd.DataFrame]:
         """
         批量查询K线数据
 
         Performance: ClickHouse目标 <100ms (10只股票 × 60天)
 
+        - 参数化查询,代码列表按 chunk_size 分块,每块一次查询
+        - 以列式结果读取,数值类型在 SQL 中转换,整块一次性转为 NumPy 数组
+        - 结果按 stock_code 排序,一次切分出每只股票的 DataFrame
+
+        Args:
+            chunk_size: 每次查询的股票数量
+
         Returns:
             {stock_code: DataFrame, ...}
+            DataFrame columns: [date, datetime, open, high, low, close, volume, amount],
+            datetime 为 YYYYMMDD 整数, 与 DailyHistory 的格式一致
         """
         try:
             if frequency != 'daily':
                 print(f'[ClickHouseStore] Only daily frequency is supported')
                 return {}
 
-            # 构建IN子句
-            codes_str = "', '".join(stock_codes)
-
-            # 执行查询
             query = f'''
                 SELECT
-                    stock_code,
-                    date,
-                    datetime,
-                    open,
-                    high,
-                    low,
-                    close,
-                    volume,
-                    amount
+                    stock_code,{KLINE_SELECT}
                 FROM {self.database}.daily_kline
-                WHERE stock_code IN ('{codes_str}')
-                  AND date >= '{start_date}'
-                  AND date <= '{end_date}'
+                WHERE stock_code IN %(codes)s
+                  AND date >= %(start_date)s
+                  AND date <= %(end_date)s
                 ORDER BY stock_code, date ASC
             '''
 
-            result = self.client.execute(query)
-
-            if not result:
+            result_dict = {}
+            stock_codes = list(dict.fromkeys(stock_codes))
+            for i in range(0, len(stock_codes), chunk_size):
+                chunk = stock_codes[i:i + chunk_size]
+                columns = self.client.execute(query, {
+                    'codes': tuple(chunk),
+                    'start_date': start_date,
+                    'end_date': end_date,
+                }, columnar=True)
+                result_dict.update(_split_kline_columns(columns))
+
+            if not result_dict:
                 return {}
 
-            # 转换为DataFrame
-            df_all = pd.DataFrame(result, columns=[
-                'stock_code', 'date', 'datetime', 'open', 'high', 'low', 'close', 'volume', 'amount'
-            ])
-
-            # 按股票代码分组
-            result_dict = {}
+            # 没有数据的股票返回空DataFrame
+            empty = pd.DataFrame(columns=KLINE_COLUMNS)
             for code in stock_codes:
-                df_code = df_all[df_all['stock_code'] == code].drop('stock_code', axis=1).copy()
-
-                # 转换数据类型
-                if not df_code.empty:
-                    df_code['open'] = df_code['open'].astype(float)
-                    df_code['high'] = df_code['high'].astype(float)
-                    df_code['low'] = df_code['low'].astype(float)
-                    df_code['close'] = df_code['close'].astype(float)
-                    df_code['volume'] = df_code['volume'].astype(int)
-                    df_code['amount'] = df_code['amount'].astype(float)
-
-                result_dict[code] = df_code
+                if code not in result_dict:
+                    result_dict[code] = empty.copy()
 
             return result_dict
 
@@ -554,8 +865,20 @@ class ClickHouseStore(BaseDataStore):
             print(f'[ClickHouseStore] health_check failed: {e}')
             return False
 
+    def flush(self) -> None:
+        """把缓冲中的交易立即写入 ClickHouse"""
+        if self.trade_buffer is not None:
+            self.trade_buffer.flush()
+
     def close(self) -> None:
-        """关闭ClickHouse连接"""
+        """写入缓冲中的交易后关闭ClickHouse连接"""
+        if self.trade_buffer is not None:
+            self.trade_buffer.close()
+            try:
+                self.trade_buffer.client.disconnect()
+            except Exception as e:
+                print(f'[ClickHouseStore] close failed: {e}')
+
         try:
             self.client.disconnect()
         except Exception as e:
@@ -14,7 +14,10 @@ import pandas as pd
 
 from storage.base_store import BaseDataStore
 from storage.config import CACHE_PROD_PATH
+from storage.state_log import StateLog
+from storage.kline_parquet import KlineParquet, KLINE_COLUMNS, HAS_PARQUET
 from tools import utils_cache
+from tools.utils_state import get_state_files, attach_state_files, attach_state_log, flush_state_files
 
 
 class FileStore(BaseDataStore):
@@ -26,12 +29,19 @@ class FileStore(BaseDataStore):
     - 向后兼容现有文件存储逻辑
     """
 
-    def __init__(self, cache_path: str = CACHE_PROD_PATH):
+    def __init__(self, cache_path: str = CACHE_PROD_PATH, write_behind: bool = False, wal: bool = False):
         """
         初始化文件存储
 
         Args:
             cache_path: 缓存目录路径,默认从 config.py 读取
+            write_behind: 持仓天数/最高价/最低价三个文件挂载为内存热副本,读写只访问内存,
+                          后台线程定期合并落盘 (见 tools/utils_state.py)
+            wal: 持仓天数/最高价/最低价常驻内存,每次修改只追加一行预写日志,定期压缩为快照,
+                 启动时从快照和日志恢复,三个 json 文件只作为压缩时导出的视图 (见 storage/state_log.py)
+                 开启后 write_behind 不再生效; 本进程内 utils_cache 对这三个文件的读写
+                 (update_max_prices / new_held / del_key / update_position_held 等) 也改为读写 StateLog,
+                 但其他进程直接写这三个 json 文件的改动会被下一次导出覆盖,有其他进程写这些文件时不要开启
         """
         self.cache_path = cache_path
         os.makedirs(self.cache_path, exist_ok=True)
@@ -54,6 +64,22 @@ class FileStore(BaseDataStore):
         # 初始化必要的文件
         self._init_files()
 
+        self.state_log: Optional[StateLog] = None
+        if wal:
+            self.state_log = StateLog(cache_path, {
+                'held_days': self.path_held,
+                'max_prices': self.path_max_prices,
+                'min_prices': self.path_min_prices,
+            })
+            attach_state_log(self.state_log)
+
+        # 日线 Parquet 存储, 没有安装 pyarrow 时不支持 K线
+        self.kline: Optional[KlineParquet] = KlineParquet(cache_path) if HAS_PARQUET else None
+
+        self.write_behind = write_behind and not wal
+        if self.write_behind:
+            attach_state_files(self.path_held, self.path_max_prices, self.path_min_prices)
+
     def _init_files(self):
         """初始化必要的 JSON 文件"""
         for path in [self.path_held, self.path_max_prices, self.path_min_prices,
@@ -69,6 +95,9 @@ class FileStore(BaseDataStore):
 
         Performance: 文件存储目标 <2ms (规范要求 <1ms,文件 IO 放宽到 2ms)
         """
+        if self.state_log is not None:
+            return self.state_log.get('held_days', code)
+
         held_days_data = utils_cache.load_json(self.path_held)
         # 文件存储暂不支持多账户,使用全局持仓数据
         return held_days_data.get(code)
@@ -76,6 +105,10 @@ class FileStore(BaseDataStore):
     def update_held_days(self, code: str, account_id: str, days: int) -> bool:
         """更新持仓天数"""
         try:
+            if self.state_log is not None:
+                self.state_log.update('held_days', sets={code: days})
+                return True
+
             with self._held_lock:
                 held_days_data = utils_cache.load_json(self.path_held)
                 held_days_data[code] = days
@@ -88,6 +121,10 @@ class FileStore(BaseDataStore):
     def delete_held_days(self, code: str, account_id: str) -> bool:
         """删除持仓记录"""
         try:
+            if self.state_log is not None:
+                self.state_log.update('held_days', deletes=[code])
+                return True
+
             utils_cache.del_key(self._held_lock, self.path_held, code)
             return True
         except Exception as e:
@@ -97,6 +134,10 @@ class FileStore(BaseDataStore):
     def batch_new_held(self, account_id: str, codes: List[str]) -> bool:
         """批量新增持仓,初始天数为 0"""
         try:
+            if self.state_log is not None:
+                self.state_log.update('held_days', sets={code: 0 for code in codes})
+                return True
+
             utils_cache.new_held(self._held_lock, self.path_held, codes)
             return True
         except Exception as e:
@@ -114,16 +155,38 @@ class FileStore(BaseDataStore):
             True: 执行了递增操作
             False: 今日已执行过,跳过
         """
+        if self.state_log is not None:
+            with self._held_lock:
+                held_days = self.state_log.items('held_days')
+                today = datetime.datetime.now().strftime('%Y-%m-%d')
+                if held_days.get('_inc_date') == today:
+                    return False
+                try:
+                    sets = {code: days + 1 for code, days in held_days.items() if code != '_inc_date'}
+                    sets['_inc_date'] = today
+                    self.state_log.update('held_days', sets=sets)
+                    return True
+                except Exception as e:
+                    print(f'[FileStore] all_held_inc failed: {e}')
+                    return False
+
         return utils_cache.all_held_inc(self._held_lock, self.path_held)
 
     def get_max_price(self, code: str, account_id: str) -> Optional[float]:
         """查询持仓期间最高价"""
+        if self.state_log is not None:
+            return self.state_log.get('max_prices', code)
+
         max_prices = utils_cache.load_json(self.path_max_prices)
         return max_prices.get(code)
 
     def update_max_price(self, code: str, account_id: str, price: float) -> bool:
         """更新最高价"""
         try:
+            if self.state_log is not None:
+                self.state_log.update('max_prices', sets={code: round(price, 3)})
+                return True
+
             with self._price_lock:
                 max_prices = utils_cache.load_json(self.path_max_prices)
                 max_prices[code] = round(price, 3)
@@ -135,12 +198,19 @@ class FileStore(BaseDataStore):
 
     def get_min_price(self, code: str, account_id: str) -> Optional[float]:
         """查询持仓期间最低价"""
+        if self.state_log is not None:
+            return self.state_log.get('min_prices', code)
+
         min_prices = utils_cache.load_json(self.path_min_prices)
         return min_prices.get(code)
 
     def update_min_price(self, code: str, account_id: str, price: float) -> bool:
         """更新最低价"""
         try:
+            if self.state_log is not None:
+                self.state_log.update('min_prices', sets={code: round(price, 3)})
+                return True
+
             with self._price_lock:
                 min_prices = utils_cache.load_json(self.path_min_prices)
                 min_prices[code] = round(price, 3)
@@ -150,6 +220,67 @@ class FileStore(BaseDataStore):
             print(f'[FileStore] update_min_price failed: {e}')
             return False
 
+    def get_position_states(self, account_id: str, codes: List[str]) -> Optional[Dict[str, Dict]]:
+        """批量查询持仓天数/最高价/最低价,每个文件只读一次"""
+        try:
+            if self.state_log is not None:
+                held_days = self.state_log.tables['held_days']
+                max_prices = self.state_log.tables['max_prices']
+                min_prices = self.state_log.tables['min_prices']
+            else:
+                held_days = utils_cache.load_json(self.path_held)
+                max_prices = utils_cache.load_json(self.path_max_prices)
+                min_prices = utils_cache.load_json(self.path_min_prices)
+
+            return {
+                code: {
+                    'held_days': held_days.get(code),
+                    'max_price': max_prices.get(code),
+                    'min_price': min_prices.get(code),
+                }
+                for code in codes
+            }
+        except Exception as e:
+            print(f'[FileStore] get_position_states failed: {e}')
+            return None
+
+    def update_price_extremes(self, account_id: str, extremes: Dict[str, Tuple]) -> bool:
+        """批量更新最高价/最低价,只写入更高的最高价和更低的最低价,每个文件最多读写一次"""
+        try:
+            with self._price_lock:
+                if self.state_log is not None:
+                    max_prices = self.state_log.tables['max_prices']
+                    min_prices = self.state_log.tables['min_prices']
+                else:
+                    max_prices = utils_cache.load_json(self.path_max_prices)
+                    min_prices = utils_cache.load_json(self.path_min_prices)
+
+                max_updates, min_updates = {}, {}
+                for code, (high, low) in extremes.items():
+                    if high is not None:
+                        high = round(high, 3)
+                        if code not in max_prices or high > max_prices[code]:
+                            max_updates[code] = high
+                    if low is not None:
+                        low = round(low, 3)
+                        if code not in min_prices or low < min_prices[code]:
+                            min_updates[code] = low
+
+                if self.state_log is not None:
+                    self.state_log.update('max_prices', sets=max_updates)
+                    self.state_log.update('min_prices', sets=min_updates)
+                else:
+                    if max_updates:
+                        max_prices.update(max_updates)
+                        utils_cache.save_json(self.path_max_prices, max_prices)
+                    if min_updates:
+                        min_prices.update(min_updates)
+                        utils_cache.save_json(self.path_min_prices, min_prices)
+            return True
+        except Exception as e:
+            print(f'[FileStore] update_price_extremes failed: {e}')
+            return False
+
     # ==================== 交易记录 (Trade Records) ====================
 
     def record_trade(
@@ -292,11 +423,22 @@ class FileStore(BaseDataStore):
         """
         查询 K线数据
 
-        注意: 文件存储不支持 K线持久化,返回空 DataFrame
-        需要调用方从实时数据源获取 (如 akshare, mootdx)
+        日线按月分区存放在 kline_daily/{YYYYMM}.parquet (见 storage/kline_parquet.py),
+        只读取日期范围内的分区中包含该代码的 row group
+
+        Returns:
+            DataFrame with columns: [datetime, open, high, low, close, volume, amount]
         """
-        print(f'[FileStore] K线数据不支持文件存储,请使用实时数据源')
-        return pd.DataFrame()
+        if self.kline is None or frequency != 'daily':
+            print(f'[FileStore] K线数据需要安装 pyarrow,且只支持日线')
+            return pd.DataFrame(columns=KLINE_COLUMNS)
+
+        try:
+            df = self.kline.read([stock_code], start_date, end_date)
+            return df[KLINE_COLUMNS]
+        except Exception as e:
+            print(f'[FileStore] get_kline failed: {e}')
+            return pd.DataFrame(columns=KLINE_COLUMNS)
 
     def batch_get_kline(
         self,
@@ -308,10 +450,69 @@ class FileStore(BaseDataStore):
         """
         批量查询 K线数据
 
-        注意: 文件存储不支持 K线持久化,返回空字典
+        Returns:
+            {stock_code: DataFrame, ...},没有任何数据时返回空字典
         """
-        print(f'[FileStore] K线数据不支持文件存储,请使用实时数据源')
-        return {}
+        if self.kline is None or frequency != 'daily':
+            print(f'[FileStore] K线数据需要安装 pyarrow,且只支持日线')
+            return {}
+
+        try:
+            df = self.kline.read(stock_codes, start_date, end_date)
+            if df.empty:
+                return {}
+
+            # 结果已按 code 排序,一次分组切分
+            result = {
+                code: group[KLINE_COLUMNS].reset_index(drop=True)
+                for code, group in df.groupby('code', sort=False)
+            }
+            for code in stock_codes:
+                if code not in result:
+                    result[code] = pd.DataFrame(columns=KLINE_COLUMNS)
+            return result
+        except Exception as e:
+            print(f'[FileStore] batch_get_kline failed: {e}')
+            return {}
+
+    def batch_append_kline(self, klines: Dict[str, pd.DataFrame]) -> bool:
+        """批量追加日线,同一 (code, datetime) 的新行覆盖旧行"""
+        if self.kline is None:
+            print(f'[FileStore] K线数据需要安装 pyarrow')
+            return False
+
+        try:
+            self.kline.append(klines)
+            return True
+        except Exception as e:
+            print(f'[FileStore] batch_append_kline failed: {e}')
+            return False
+
+    def batch_replace_kline(self, klines: Dict[str, pd.DataFrame]) -> bool:
+        """整只股票替换日线,这些 code 原有的行全部删除后再写入"""
+        if self.kline is None:
+            print(f'[FileStore] K线数据需要安装 pyarrow')
+            return False
+
+        try:
+            self.kline.replace(klines)
+            return True
+        except Exception as e:
+            print(f'[FileStore] batch_replace_kline failed: {e}')
+            return False
+
+    def delete_kline(self, codes: List[str]) -> bool:
+        """删除这些 code 的全部日线"""
+        if self.kline is None:
+            print(f'[FileStore] K线数据需要安装 pyarrow')
+            return False
+
+        try:
+            self.kline.delete(codes)
+            return True
+        except Exception as e:
+            print(f'[FileStore] delete_kline failed: {e}')
+            return False
 
     # ==================== 账户管理 (Account Management) ====================
 
@@ -473,10 +674,25 @@ class FileStore(BaseDataStore):
             print(f'[FileStore] health_check failed: {e}')
             return False
 
+    def flush(self) -> None:
+        """把内存热副本中的改动立即落盘,预写日志模式下压缩为快照"""
+        if self.state_log is not None:
+            self.state_log.compact()
+        flush_state_files()
+
     def close(self) -> None:
         """
         关闭连接
 
-        文件存储无需显式关闭,此方法为接口兼容
+        文件存储无需显式关闭,只把内存热副本或预写日志中的改动落盘
         """
-        pass
+        if self.state_log is not None:
+            for path in self.state_log.exports.values():
+                get_state_files().detach(path)
+            self.state_log.close()
+        if self.kline is not None:
+            self.kline.close()
+        flush_state_files()
+        if self.write_behind:
+            for path in [self.path_held, self.path_max_prices, self.path_min_prices]:
+                get_state_files().detach(path)
@@ -10,8 +10,10 @@ HybridStore: 混合存储实现
 - 交易/K线: ClickHouse (主) + File (备)
 - 自动降级: 数据库异常时自动切换到文件存储
 - 双写模式: 同时写入数据库和文件,确保数据一致性
+- 异步写回: 文件写入 (以及可选的交易记录/账户资金等非关键的数据库写入) 放入后台队列,不阻塞交易回调
 """
 
+import os
 import logging
 from typing import Optional, Dict, List, Tuple
 import pandas as pd
@@ -21,6 +23,7 @@ from storage.file_store import FileStore
 from storage.redis_store import RedisStore
 from storage.mysql_store import MySQLStore
 from storage.clickhouse_store import ClickHouseStore
+from storage.write_queue import WriteQueue
 from storage.logging_config import (
     setup_storage_logger,
     log_performance,
@@ -48,6 +51,9 @@ class HybridStore(BaseDataStore):
     - 日志记录: 降级事件记录在 WARNING 级别
     """
 
+    # File 作为主存储读取前等待写回队列的最长秒数,超时后读取当前文件内容
+    FILE_FLUSH_TIMEOUT = 5.0
+
     def __init__(
         self,
         cache_path: str = None,
@@ -55,7 +61,12 @@ class HybridStore(BaseDataStore):
         enable_mysql: bool = True,
         enable_clickhouse: bool = True,
         enable_dual_write: bool = True,
-        enable_auto_fallback: bool = True
+        enable_auto_fallback: bool = True,
+        write_behind: bool = False,
+        wal: bool = False,
+        async_writes: bool = False,
+        async_primary: bool = False,
+        trade_batch_size: int = 0
     ):
         """
         初始化混合存储
@@ -67,12 +78,20 @@ class HybridStore(BaseDataStore):
             enable_clickhouse: 是否启用ClickHouse
             enable_dual_write: 是否启用双写模式
             enable_auto_fallback: 是否启用自动降级
+            write_behind: FileStore 的持仓状态文件是否使用内存热副本定期落盘
+            wal: FileStore 的持仓状态是否使用预写日志 + 快照
+            async_writes: 双写中的 File 写入放入异步写回队列 (见 storage/write_queue.py),
+                          降级到 File 读写前先等待队列中的写入完成
+            async_primary: 交易记录 (ClickHouse) 和账户资金 (MySQL) 的写入也放入队列,
+                           未开启双写时重试失败后改写 File; 需要同时开启 async_writes
+            trade_batch_size: 大于 0 时 ClickHouse 交易记录批量写入,spill 文件放在 File 缓存目录
         """
         self.enable_dual_write = enable_dual_write
         self.enable_auto_fallback = enable_auto_fallback
 
         # 初始化 FileStore (必需,作为备份)
-        self.file_store = FileStore(cache_path) if cache_path else FileStore()
+        self.file_store = FileStore(cache_path, write_behind, wal) if cache_path \
+            else FileStore(write_behind=write_behind, wal=wal)
 
         # 初始化数据库存储 (可选)
         self.redis_store = None
@@ -101,14 +120,50 @@ class HybridStore(BaseDataStore):
 
         if enable_clickhouse:
             try:
-                self.clickhouse_store = ClickHouseStore()
+                self.clickhouse_store = ClickHouseStore(
+                    trade_batch_size=trade_batch_size,
+                    trade_spill_path=os.path.join(self.file_store.cache_path, 'trade_spill.jsonl')
+                    if trade_batch_size > 0 else None
+                )
                 if not self.clickhouse_store.health_check():
                     logger.warning('[HybridStore] ClickHouse health check failed, will use File only')
+                    self.clickhouse_store.close()
                     self.clickhouse_store = None
             except Exception as e:
                 logger.warning(f'[HybridStore] Failed to initialize ClickHouse: {e}')
                 self.clickhouse_store = None
 
+        # 异步写回队列 (可选)
+        self.write_queue = None
+        self.async_primary = async_writes and async_primary
+        if async_writes:
+            self.write_queue = WriteQueue({
+                'file': self.file_store,
+                'redis': self.redis_store,
+                'mysql': self.mysql_store,
+                'clickhouse': self.clickhouse_store,
+            }, self.file_store.cache_path)
+
+    def _write_file(self, method: str, *args) -> bool:
+        """写入 File,异步模式下放入写回队列"""
+        if self.write_queue is not None:
+            return self.write_queue.put('file', method, *args)
+        return getattr(self.file_store, method)(*args)
+
+    def _file(self) -> FileStore:
+        """
+        File 作为主存储读写前,先等待写回队列中的 File 写入完成,最多等待 FILE_FLUSH_TIMEOUT 秒
+
+        只等待 File 目标的操作,数据库故障重试中的操作在各自的后台线程执行,不影响 File 读取
+        """
+        if self.write_queue is not None:
+            if not self.write_queue.flush(timeout=self.FILE_FLUSH_TIMEOUT, target='file'):
+                logger.warning(
+                    f'[HybridStore] file writes not drained in {self.FILE_FLUSH_TIMEOUT}s, '
+                    f'read File with {self.write_queue.stats()["pending_by_target"]["file"]} pending writes'
+                )
+        return self.file_store
+
     # ==================== 持仓状态 (Position State) - Redis + File ====================
 
     @log_performance("get_held_days", logger)
@@ -130,7 +185,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.get_held_days(code, account_id)
+        return self._file().get_held_days(code, account_id)
 
     def update_held_days(self, code: str, account_id: str, days: int) -> bool:
         """
@@ -151,7 +206,7 @@ class HybridStore(BaseDataStore):
         # 写入 File (双写模式或Redis失败)
         if self.enable_dual_write or not success_redis:
             try:
-                success_file = self.file_store.update_held_days(code, account_id, days)
+                success_file = self._write_file('update_held_days', code, account_id, days)
             except Exception as e:
                 logger.error(f'[HybridStore] File update_held_days failed: {e}')
 
@@ -177,7 +232,7 @@ class HybridStore(BaseDataStore):
         # 删除 File
         if self.enable_dual_write or not success_redis:
             try:
-                success_file = self.file_store.delete_held_days(code, account_id)
+                success_file = self._write_file('delete_held_days', code, account_id)
             except Exception as e:
                 logger.error(f'[HybridStore] File delete_held_days failed: {e}')
 
@@ -202,7 +257,7 @@ class HybridStore(BaseDataStore):
         # 写入 File
         if self.enable_dual_write or not success_redis:
             try:
-                success_file = self.file_store.batch_new_held(account_id, codes)
+                success_file = self._write_file('batch_new_held', account_id, codes)
             except Exception as e:
                 logger.error(f'[HybridStore] File batch_new_held failed: {e}')
 
@@ -222,7 +277,7 @@ class HybridStore(BaseDataStore):
                 # 如果启用双写,同时更新File
                 if self.enable_dual_write and result:
                     try:
-                        self.file_store.all_held_inc(account_id)
+                        self._write_file('all_held_inc', account_id)
                     except Exception as e:
                         logger.error(f'[HybridStore] File all_held_inc failed in dual-write: {e}')
                 return result
@@ -233,7 +288,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.all_held_inc(account_id)
+        return self._file().all_held_inc(account_id)
 
     def get_max_price(self, code: str, account_id: str) -> Optional[float]:
         """
@@ -253,7 +308,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.get_max_price(code, account_id)
+        return self._file().get_max_price(code, account_id)
 
     def update_max_price(self, code: str, account_id: str, price: float) -> bool:
         """
@@ -274,7 +329,7 @@ class HybridStore(BaseDataStore):
         # 写入 File
         if self.enable_dual_write or not success_redis:
             try:
-                success_file = self.file_store.update_max_price(code, account_id, price)
+                success_file = self._write_file('update_max_price', code, account_id, price)
             except Exception as e:
                 logger.error(f'[HybridStore] File update_max_price failed: {e}')
 
@@ -298,7 +353,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.get_min_price(code, account_id)
+        return self._file().get_min_price(code, account_id)
 
     def update_min_price(self, code: str, account_id: str, price: float) -> bool:
         """
@@ -319,12 +374,62 @@ class HybridStore(BaseDataStore):
         # 写入 File
         if self.enable_dual_write or not success_redis:
             try:
-                success_file = self.file_store.update_min_price(code, account_id, price)
+                success_file = self._write_file('update_min_price', code, account_id, price)
             except Exception as e:
                 logger.error(f'[HybridStore] File update_min_price failed: {e}')
 
         return success_redis or success_file
 
+    @log_performance("get_position_states", logger)
+    def get_position_states(self, account_id: str, codes: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        批量查询持仓天数/最高价/最低价
+
+        策略: 优先 Redis (一次 pipeline),失败则降级到 File
+        """
+        # 尝试 Redis
+        if self.redis_store:
+            try:
+                result = self.redis_store.get_position_states(account_id, codes)
+                if result is not None:
+                    return result
+                if not self.enable_auto_fallback:
+                    return None
+                logger.warning('[DEGRADATION] Redis get_position_states failed, fallback to File')
+            except Exception as e:
+                if self.enable_auto_fallback:
+                    logger.warning(f'[DEGRADATION] Redis get_position_states failed, fallback to File: {e}')
+                else:
+                    raise
+
+        # 降级到 File
+        return self._file().get_position_states(account_id, codes)
+
+    def update_price_extremes(self, account_id: str, extremes: Dict[str, Tuple]) -> bool:
+        """
+        批量更新最高价/最低价
+
+        策略: 双写 Redis + File
+        """
+        success_redis = False
+        success_file = False
+
+        # 写入 Redis
+        if self.redis_store:
+            try:
+                success_redis = self.redis_store.update_price_extremes(account_id, extremes)
+            except Exception as e:
+                logger.error(f'[HybridStore] Redis update_price_extremes failed: {e}')
+
+        # 写入 File
+        if self.enable_dual_write or not success_redis:
+            try:
+                success_file = self._write_file('update_price_extremes', account_id, extremes)
+            except Exception as e:
+                logger.error(f'[HybridStore] File update_price_extremes failed: {e}')
+
+        return success_redis or success_file
+
     # ==================== 交易记录 (Trade Records) - ClickHouse + File ====================
 
     def record_trade(
@@ -350,18 +455,25 @@ class HybridStore(BaseDataStore):
         # 写入 ClickHouse
         if self.clickhouse_store:
             try:
-                success_clickhouse = self.clickhouse_store.record_trade(
-                    account_id, timestamp, stock_code, stock_name,
-                    order_type, remark, price, volume, strategy_name
-                )
+                if self.async_primary:
+                    success_clickhouse = self.write_queue.put(
+                        'clickhouse', 'record_trade', account_id, timestamp, stock_code, stock_name,
+                        order_type, remark, price, volume, strategy_name,
+                        fallback=None if self.enable_dual_write else 'file'
+                    )
+                else:
+                    success_clickhouse = self.clickhouse_store.record_trade(
+                        account_id, timestamp, stock_code, stock_name,
+                        order_type, remark, price, volume, strategy_name
+                    )
             except Exception as e:
                 logger.error(f'[HybridStore] ClickHouse record_trade failed: {e}')
 
         # 写入 File
         if self.enable_dual_write or not success_clickhouse:
             try:
-                success_file = self.file_store.record_trade(
-                    account_id, timestamp, stock_code, stock_name,
+                success_file = self._write_file(
+                    'record_trade', account_id, timestamp, stock_code, stock_name,
                     order_type, remark, price, volume, strategy_name
                 )
             except Exception as e:
@@ -397,7 +509,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.query_trades(account_id, start_date, end_date, stock_code)
+        return self._file().query_trades(account_id, start_date, end_date, stock_code)
 
     def aggregate_trades(
         self,
@@ -426,7 +538,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.aggregate_trades(account_id, start_date, end_date, group_by)
+        return self._file().aggregate_trades(account_id, start_date, end_date, group_by)
 
     # ==================== K线数据 (Kline Data) - ClickHouse + File ====================
 
@@ -458,7 +570,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.get_kline(stock_code, start_date, end_date, frequency)
+        return self._file().get_kline(stock_code, start_date, end_date, frequency)
 
     def batch_get_kline(
         self,
@@ -487,7 +599,32 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.batch_get_kline(stock_codes, start_date, end_date, frequency)
+        return self._file().batch_get_kline(stock_codes, start_date, end_date, frequency)
+
+    def batch_append_kline(self, klines: Dict[str, pd.DataFrame]) -> bool:
+        """
+        批量追加日线
+
+        策略: 只写 File (Parquet),作为 ClickHouse 不可用时的降级数据;
+        DataFrame 不能序列化到写回队列,直接同步写入
+        """
+        return self.file_store.batch_append_kline(klines)
+
+    def batch_replace_kline(self, klines: Dict[str, pd.DataFrame]) -> bool:
+        """
+        整只股票替换日线
+
+        策略: 只写 File (Parquet),与 batch_append_kline 相同
+        """
+        return self.file_store.batch_replace_kline(klines)
+
+    def delete_kline(self, codes: List[str]) -> bool:
+        """
+        删除这些 code 的全部日线
+
+        策略: 只删 File (Parquet),与 batch_append_kline 相同
+        """
+        return self.file_store.delete_kline(codes)
 
     # ==================== 账户管理 (Account Management) - MySQL + File ====================
 
@@ -513,8 +650,8 @@ class HybridStore(BaseDataStore):
                     # 双写到 File
                     if self.enable_dual_write:
                         try:
-                            self.file_store.create_account(
-                                account_id, account_name, broker, initial_capital
+                            self._write_file(
+                                'create_account', account_id, account_name, broker, initial_capital
                             )
                         except Exception as e:
                             logger.error(f'[HybridStore] File create_account failed in dual-write: {e}')
@@ -526,7 +663,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.create_account(account_id, account_name, broker, initial_capital)
+        return self._file().create_account(account_id, account_name, broker, initial_capital)
 
     def get_account(self, account_id: str) -> Optional[Dict]:
         """
@@ -547,7 +684,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.get_account(account_id)
+        return self._file().get_account(account_id)
 
     def update_account_capital(self, account_id: str, current_capital: float) -> bool:
         """
@@ -561,14 +698,20 @@ class HybridStore(BaseDataStore):
         # 写入 MySQL
         if self.mysql_store:
             try:
-                success_mysql = self.mysql_store.update_account_capital(account_id, current_capital)
+                if self.async_primary:
+                    success_mysql = self.write_queue.put(
+                        'mysql', 'update_account_capital', account_id, current_capital,
+                        fallback=None if self.enable_dual_write else 'file'
+                    )
+                else:
+                    success_mysql = self.mysql_store.update_account_capital(account_id, current_capital)
             except Exception as e:
                 logger.error(f'[HybridStore] MySQL update_account_capital failed: {e}')
 
         # 写入 File
         if self.enable_dual_write or not success_mysql:
             try:
-                success_file = self.file_store.update_account_capital(account_id, current_capital)
+                success_file = self._write_file('update_account_capital', account_id, current_capital)
             except Exception as e:
                 logger.error(f'[HybridStore] File update_account_capital failed: {e}')
 
@@ -598,8 +741,8 @@ class HybridStore(BaseDataStore):
                     # 双写到 File
                     if self.enable_dual_write:
                         try:
-                            self.file_store.create_strategy(
-                                strategy_name, strategy_code, strategy_type, version
+                            self._write_file(
+                                'create_strategy', strategy_name, strategy_code, strategy_type, version
                             )
                         except Exception as e:
                             logger.error(f'[HybridStore] File create_strategy failed in dual-write: {e}')
@@ -611,7 +754,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.create_strategy(strategy_name, strategy_code, strategy_type, version)
+        return self._file().create_strategy(strategy_name, strategy_code, strategy_type, version)
 
     def get_strategy_params(self, strategy_code: str) -> Optional[Dict]:
         """
@@ -632,7 +775,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.get_strategy_params(strategy_code)
+        return self._file().get_strategy_params(strategy_code)
 
     def save_strategy_params(self, strategy_code: str, params: Dict) -> bool:
         """
@@ -653,7 +796,7 @@ class HybridStore(BaseDataStore):
         # 写入 File
         if self.enable_dual_write or not success_mysql:
             try:
-                success_file = self.file_store.save_strategy_params(strategy_code, params)
+                success_file = self._write_file('save_strategy_params', strategy_code, params)
             except Exception as e:
                 logger.error(f'[HybridStore] File save_strategy_params failed: {e}')
 
@@ -680,7 +823,7 @@ class HybridStore(BaseDataStore):
                     raise
 
         # 降级到 File
-        return self.file_store.compare_strategy_params(strategy_code, new_params)
+        return self._file().compare_strategy_params(strategy_code, new_params)
 
     # ==================== 连接管理 (Connection Management) ====================
 
@@ -727,8 +870,20 @@ class HybridStore(BaseDataStore):
         # 只要 File 可用即可 (最基本的降级保证)
         return health_status['file']
 
+    def flush(self) -> None:
+        """等待异步写回队列清空,并把 FileStore 内存热副本中的改动立即落盘"""
+        if self.write_queue is not None:
+            self.write_queue.flush()
+        self.file_store.flush()
+
     def close(self) -> None:
-        """关闭所有后端连接"""
+        """关闭所有后端连接,关闭前先执行完异步写回队列中的所有写入"""
+        if self.write_queue is not None:
+            try:
+                self.write_queue.close()
+            except Exception as e:
+                logger.error(f'[HybridStore] Write queue close failed: {e}')
+
         try:
             self.file_store.close()
         except Exception as e:
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+KlineParquet: FileStore 的日线 Parquet 存储
+
+- 按月分区: {cache_path}/kline_daily/{YYYYMM}.parquet,每个文件内按 (code, datetime) 排序
+- 查询时先按日期范围选出月份文件,再用每个 row group 的 code / datetime 统计信息跳过不相关的 row group,
+  只读取可能命中的 row group,最后在内存中按 code 和日期范围过滤
+- 批量追加时按月份合并: 读出旧文件,新行覆盖同一 (code, datetime) 的旧行,排序后写临时文件再原子替换,
+  读取方不会看到写了一半的文件
+- 整只股票替换 (全量下载回填) 和删除 (除权后丢弃前复权数据) 时,先从每个月份文件中去掉这些 code 的旧行
+- 依赖 pyarrow,未安装时 HAS_PARQUET 为 False,由调用方降级
+"""
+
+import os
+import bisect
+import threading
+from typing import Dict, List, Optional, Iterable
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+KLINE_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume', 'amount']
+KLINE_DTYPES = {
+    'code': 'object', 'datetime': 'int64', 'open': 'float64', 'high': 'float64',
+    'low': 'float64', 'close': 'float64', 'volume': 'float64', 'amount': 'float64',
+}
+
+
+def date_to_int(date) -> int:
+    """'2024-01-31' / '20240131' / 20240131 -> 20240131"""
+    return int(str(date).replace('-', ''))
+
+
+class KlineParquet:
+    """按月分区的日线 Parquet 存储"""
+
+    DIR_NAME = 'kline_daily'
+
+    def __init__(self, cache_path: str, row_group_size: int = 8192):
+        """
+        Args:
+            cache_path: 存储根目录,分区文件放在其下的 kline_daily 目录
+            row_group_size: 每个 row group 的行数,越小跳过得越精确,文件元数据越大
+        """
+        self.root_path = os.path.join(cache_path, self.DIR_NAME)
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+
+        # { path: (mtime, ParquetFile, row group 统计) },文件被替换后按 mtime 重新打开
+        self._files: Dict[str, tuple] = {}
+
+    # ==================== 分区 ====================
+
+    def _path(self, month: int) -> str:
+        return os.path.join(self.root_path, f'{month}.parquet')
+
+    def months(self) -> List[int]:
+        if not os.path.isdir(self.root_path):
+            return []
+        return sorted(
+            int(name[:-len('.parquet')]) for name in os.listdir(self.root_path)
+            if name.endswith('.parquet') and name[:-len('.parquet')].isdigit()
+        )
+
+    def _open(self, path: str) -> Optional[tuple]:
+        """打开分区文件并缓存 row group 的 (code 最小值, code 最大值, datetime 最小值, datetime 最大值)"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        cached = self._files.get(path)
+        if cached is not None:
+            if cached[0] == mtime:
+                return cached
+            self._release(path)  # 已被其他进程替换
+
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names
+        i_code, i_datetime = names.index('code'), names.index('datetime')
+        stats = []
+        for i in range(parquet_file.num_row_groups):
+            row_group = parquet_file.metadata.row_group(i)
+            code_stats = row_group.column(i_code).statistics
+            datetime_stats = row_group.column(i_datetime).statistics
+            if code_stats is None or datetime_stats is None or not code_stats.has_min_max:
+                stats.append(None)  # 没有统计信息,不能跳过
+            else:
+                stats.append((code_stats.min, code_stats.max, datetime_stats.min, datetime_stats.max))
+
+        cached = (mtime, parquet_file, stats)
+        self._files[path] = cached
+        return cached
+
+    # ==================== 读取 ====================
+
+    def read(self, codes: Iterable[str], start_date, end_date) -> pd.DataFrame:
+        """
+        读取多个 code 在日期范围内的日线
+
+        Returns:
+            DataFrame columns: [code, datetime, open, high, low, close, volume, amount],按 (code, datetime) 排序
+        """
+        start, end = date_to_int(start_date), date_to_int(end_date)
+        code_list = sorted(set(codes))
+        if not code_list or start > end:
+            return pd.DataFrame(columns=['code'] + KLINE_COLUMNS)
+
+        tables = []
+        with self._lock:  # 写入时会关闭并替换缓存的句柄
+            for month in self.months():
+                if month < start // 100 or month > end // 100:
+                    continue
+                opened = self._open(self._path(month))
+                if opened is None:
+                    continue
+                _, parquet_file, stats = opened
+
+                row_groups = []
+                for i, stat in enumerate(stats):
+                    if stat is not None:
+                        code_min, code_max, datetime_min, datetime_max = stat
+                        if datetime_max < start or datetime_min > end:
+                            continue
+                        # 排序后的 code_list 中是否有落在 [code_min, code_max] 内的
+                        j = bisect.bisect_left(code_list, code_min)
+                        if j == len(code_list) or code_list[j] > code_max:
+                            continue
+                    row_groups.append(i)
+                if row_groups:
+                    tables.append(parquet_file.read_row_groups(row_groups))
+
+        if not tables:
+            return pd.DataFrame(columns=['code'] + KLINE_COLUMNS)
+
+        table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+        mask = pc.and_(
+            pc.is_in(table['code'], value_set=pa.array(code_list, type=table.schema.field('code').type)),
+            pc.and_(pc.greater_equal(table['datetime'], start), pc.less_equal(table['datetime'], end)),
+        )
+        df = table.filter(mask).to_pandas()
+        if len(tables) > 1:
+            df = df.sort_values(['code', 'datetime'], kind='stable', ignore_index=True)
+        return df
+
+    # ==================== 写入 ====================
+
+    def append(self, frames: Dict[str, pd.DataFrame]) -> int:
+        """
+        批量追加 { code: DataFrame },同一 (code, datetime) 的新行覆盖旧行
+
+        Returns:
+            写入的行数
+        """
+        return self._write(frames, set())
+
+    def replace(self, frames: Dict[str, pd.DataFrame]) -> int:
+        """
+        整只股票替换 { code: DataFrame },这些 code 原有的行全部删除后再写入
+
+        Returns:
+            写入的行数
+        """
+        return self._write(frames, set(frames))
+
+    def delete(self, codes: Iterable[str]) -> None:
+        """删除这些 code 的全部行"""
+        self._write({}, set(codes))
+
+    def _write(self, frames: Dict[str, pd.DataFrame], drop_codes: set) -> int:
+        items = [(code, df) for code, df in frames.items() if df is not None and len(df) > 0]
+        months: Dict[int, Optional[pd.DataFrame]] = {}
+        count = 0
+        if items:
+            # 整体拼接后再选列, code 列按长度重复生成, 不对每个 DataFrame 做 assign / 选列
+            rows = pd.concat([df for _, df in items], ignore_index=True)[KLINE_COLUMNS]
+            rows.insert(0, 'code', np.repeat(np.array([code for code, _ in items], dtype=object), [len(df) for _, df in items]))
+            rows = rows.astype(KLINE_DTYPES)
+            months = {int(month): group for month, group in rows.groupby(rows['datetime'] // 100)}
+            count = len(rows)
+
+        with self._lock:
+            if drop_codes:
+                for month in self.months():
+                    months.setdefault(month, None)
+            if not months:
+                return 0
+            os.makedirs(self.root_path, exist_ok=True)
+            for month in sorted(months):
+                self._merge_month(month, months[month], drop_codes)
+        return count
+
+    def _merge_month(self, month: int, rows: Optional[pd.DataFrame], drop_codes: set) -> None:
+        path = self._path(month)
+        if os.path.exists(path):
+            old = pq.read_table(path).to_pandas()
+            if drop_codes:
+                keep = ~old['code'].isin(drop_codes)
+                if rows is None and keep.all():
+                    return  # 这个月份没有要删除的 code,不需要重写
+                old = old[keep]
+            rows = old if rows is None else pd.concat([old, rows], ignore_index=True)
+        if rows is None:
+            return
+
+        if len(rows) == 0:
+            self._release(path)
+            os.remove(path)
+            return
+
+        rows = rows.drop_duplicates(subset=['code', 'datetime'], keep='last')
+        rows = rows.sort_values(['code', 'datetime'], ignore_index=True)
+
+        temp_path = path + '.tmp'
+        pq.write_table(
+            pa.Table.from_pandas(rows, preserve_index=False),
+            temp_path,
+            row_group_size=self.row_group_size,
+        )
+        self._release(path)
+        os.replace(temp_path, path)
+
+    def _release(self, path: str) -> None:
+        """替换或删除分区文件前关闭缓存的句柄, Windows 上打开的文件不能被替换"""
+        cached = self._files.pop(path, None)
+        if cached is not None:
+            cached[1].close()
+
+    def close(self) -> None:
+        with self._lock:
+            for path in list(self._files):
+                self._release(path)
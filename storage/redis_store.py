@@ -33,6 +33,7 @@ class RedisStore(BaseDataStore):
     - get_held_days: <1ms (单次HGET)
     - update_held_days: <1ms (单次HSET)
     - all_held_inc: <10ms (Lua脚本原子操作)
+    - get_position_states / update_price_extremes: 整批持仓一次网络往返
     """
 
     def __init__(
@@ -109,6 +110,37 @@ class RedisStore(BaseDataStore):
             return count  -- 返回递增的持仓数量
         """)
 
+        # update_price_extremes Lua脚本: 在服务端比较后只写入更高的最高价和更低的最低价
+        self.lua_update_extremes = self.client.register_script("""
+            local max_key = KEYS[1]        -- max_prices:{account_id}
+            local min_key = KEYS[2]        -- min_prices:{account_id}
+
+            -- ARGV: code, high, low 三个一组,空字符串表示不更新
+            local count = 0
+            for i = 1, #ARGV, 3 do
+                local code = ARGV[i]
+                local high = tonumber(ARGV[i + 1])
+                local low = tonumber(ARGV[i + 2])
+                if high then
+                    local curr = tonumber(redis.call('HGET', max_key, code))
+                    if (not curr) or high > curr then
+                        redis.call('HSET', max_key, code, ARGV[i + 1])
+                        count = count + 1
+                    end
+                end
+                if low then
+                    local curr = tonumber(redis.call('HGET', min_key, code))
+                    if (not curr) or low < curr then
+                        redis.call('HSET', min_key, code, ARGV[i + 2])
+                        count = count + 1
+                    end
+                end
+            end
+
+            return count  -- 返回写入的价格数量
+        """)
+        self.lua_extremes_enabled = True  # 服务端不支持脚本时改用 pipeline
+
     # ==================== 持仓状态 (Position State) ====================
 
     def get_held_days(self, code: str, account_id: str) -> Optional[int]:
@@ -232,6 +264,89 @@ class RedisStore(BaseDataStore):
             print(f'[RedisStore] update_min_price failed: {e}')
             return False
 
+    def get_position_states(self, account_id: str, codes: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        批量查询持仓天数/最高价/最低价
+
+        Performance: 三个 HMGET 放在一个 pipeline 中,一次网络往返
+        """
+        try:
+            if not codes:
+                return {}
+
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.hmget(f'held_days:{account_id}', codes)
+            pipeline.hmget(f'max_prices:{account_id}', codes)
+            pipeline.hmget(f'min_prices:{account_id}', codes)
+            held_days, max_prices, min_prices = pipeline.execute()
+
+            return {
+                code: {
+                    'held_days': int(held_days[i]) if held_days[i] else None,
+                    'max_price': float(max_prices[i]) if max_prices[i] else None,
+                    'min_price': float(min_prices[i]) if min_prices[i] else None,
+                }
+                for i, code in enumerate(codes)
+            }
+        except Exception as e:
+            print(f'[RedisStore] get_position_states failed: {e}')
+            return None
+
+    def update_price_extremes(self, account_id: str, extremes: Dict[str, Tuple]) -> bool:
+        """
+        批量更新最高价/最低价,只写入更高的最高价和更低的最低价
+
+        Performance: Lua脚本在服务端比较并写入,一次网络往返;
+        服务端不支持脚本时用 pipeline 读取比较后再写入,两次网络往返
+        """
+        try:
+            if not extremes:
+                return True
+
+            max_key = f'max_prices:{account_id}'
+            min_key = f'min_prices:{account_id}'
+            rounded = {
+                code: (None if high is None else round(high, 3), None if low is None else round(low, 3))
+                for code, (high, low) in extremes.items()
+            }
+
+            if self.lua_extremes_enabled:
+                args = []
+                for code, (high, low) in rounded.items():
+                    args += [code, '' if high is None else high, '' if low is None else low]
+                try:
+                    self.lua_update_extremes(keys=[max_key, min_key], args=args)
+                    return True
+                except redis.exceptions.ResponseError as e:
+                    print(f'[RedisStore] Lua scripting unavailable, use pipeline: {e}')
+                    self.lua_extremes_enabled = False
+
+            codes = list(rounded.keys())
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.hmget(max_key, codes)
+            pipeline.hmget(min_key, codes)
+            max_prices, min_prices = pipeline.execute()
+
+            max_updates, min_updates = {}, {}
+            for i, code in enumerate(codes):
+                high, low = rounded[code]
+                if high is not None and (not max_prices[i] or high > float(max_prices[i])):
+                    max_updates[code] = high
+                if low is not None and (not min_prices[i] or low < float(min_prices[i])):
+                    min_updates[code] = low
+
+            if max_updates or min_updates:
+                pipeline = self.client.pipeline()
+                if max_updates:
+                    pipeline.hset(max_key, mapping=max_updates)
+                if min_updates:
+                    pipeline.hset(min_key, mapping=min_updates)
+                pipeline.execute()
+            return True
+        except Exception as e:
+            print(f'[RedisStore] update_price_extremes failed: {e}')
+            return False
+
     # ==================== 交易记录 (Trade Records) ====================
 
     def record_trade(
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+StateLog: 持仓状态的内存表 + 预写日志 (WAL) + 快照
+
+- 所有表常驻内存,读取不访问磁盘
+- 每次修改只向 state.wal 追加一行 {"t": 表名, "s": {key: value}, "d": [key]},记录的是修改后的绝对值,
+  重放多次结果不变
+- 日志达到 compact_every 行时压缩: 先写 state.snapshot.json.tmp 再原子替换为快照,然后清空日志;
+  替换后、清空前崩溃只会让日志重放一次已包含在快照中的修改,结果相同
+- 启动时加载快照并重放日志恢复; 进程崩溃时写了一半的最后一行会被丢弃
+- 压缩时同时导出各表到原有的 json 文件,供人工查看和其他工具读取
+"""
+
+import os
+import json
+import threading
+from typing import Optional, Dict, List, Iterable
+
+
+class StateLog:
+    """持仓状态的预写日志存储"""
+
+    SNAPSHOT_NAME = 'state.snapshot.json'
+    WAL_NAME = 'state.wal'
+
+    def __init__(
+        self,
+        cache_path: str,
+        exports: Dict[str, str],
+        compact_every: int = 1000,
+        fsync: bool = False
+    ):
+        """
+        Args:
+            cache_path: 快照和日志所在目录
+            exports: {表名: 导出的 json 文件路径},没有快照时从这些文件初始化各表
+            compact_every: 日志累计多少行后压缩为快照
+            fsync: 每次追加日志后是否 fsync,关闭时只保证进程崩溃不丢数据,不保证断电不丢
+        """
+        self.cache_path = cache_path
+        self.exports = exports
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        self.path_snapshot = os.path.join(cache_path, self.SNAPSHOT_NAME)
+        self.path_wal = os.path.join(cache_path, self.WAL_NAME)
+
+        self.tables: Dict[str, dict] = {name: {} for name in exports}
+        self.wal_lines = 0  # 当前日志的行数
+        self._lock = threading.RLock()
+
+        self._recover()
+        self._wal = open(self.path_wal, 'a', encoding='utf-8')
+
+    # ==================== 恢复 ====================
+
+    def _recover(self):
+        """加载快照 (没有则从导出的 json 初始化) 并重放日志"""
+        if os.path.exists(self.path_snapshot):
+            with open(self.path_snapshot, 'r', encoding='utf-8') as r:
+                snapshot = json.load(r)
+            for name, table in snapshot.get('tables', {}).items():
+                if name in self.tables:
+                    self.tables[name] = table
+        else:
+            for name, path in self.exports.items():
+                if os.path.exists(path):
+                    try:
+                        with open(path, 'r') as r:
+                            self.tables[name] = json.load(r)
+                    except Exception as e:
+                        print(f'[StateLog] load {path} failed: {e}')
+
+        if not os.path.exists(self.path_wal):
+            return
+
+        valid_size = 0
+        with open(self.path_wal, 'rb') as r:
+            for line in r:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的最后一行
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self._apply(entry)
+                valid_size += len(line)
+                self.wal_lines += 1
+
+        if valid_size < os.path.getsize(self.path_wal):
+            print(f'[StateLog] truncate torn wal tail at {valid_size} bytes')
+            with open(self.path_wal, 'r+b') as w:
+                w.truncate(valid_size)
+
+    def _apply(self, entry: Dict):
+        table = self.tables.setdefault(entry['t'], {})
+        table.update(entry.get('s', {}))
+        for key in entry.get('d', []):
+            table.pop(key, None)
+
+    # ==================== 读写 ====================
+
+    def get(self, name: str, key: str, default=None):
+        """查询单个值"""
+        return self.tables[name].get(key, default)
+
+    def items(self, name: str) -> Dict:
+        """整张表的浅拷贝"""
+        with self._lock:
+            return dict(self.tables[name])
+
+    def update(self, name: str, sets: Optional[Dict] = None, deletes: Optional[Iterable[str]] = None):
+        """
+        修改一张表,先追加日志再改内存,一次调用只写一行日志
+
+        Args:
+            name: 表名
+            sets: {key: 修改后的值}
+            deletes: 要删除的 key
+        """
+        entry = {'t': name}
+        if sets:
+            entry['s'] = sets
+        if deletes:
+            entry['d'] = list(deletes)
+        if len(entry) == 1:
+            return
+
+        with self._lock:
+            self._wal.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self._wal.flush()
+            if self.fsync:
+                os.fsync(self._wal.fileno())
+            self._apply(entry)
+            self.wal_lines += 1
+
+            if self.wal_lines >= self.compact_every:
+                self.compact()
+
+    # ==================== 压缩与导出 ====================
+
+    @staticmethod
+    def _atomic_write(path: str, text: str, fsync: bool = True):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as w:
+            w.write(text)
+            if fsync:
+                w.flush()
+                os.fsync(w.fileno())
+        os.replace(temp_path, path)
+
+    def compact(self):
+        """写快照 (原子替换) 后清空日志,并导出 json 视图"""
+        with self._lock:
+            self._atomic_write(self.path_snapshot, json.dumps({'tables': self.tables}, ensure_ascii=False))
+            self._wal.close()
+            self._wal = open(self.path_wal, 'w', encoding='utf-8')
+            self.wal_lines = 0
+            self.export()
+
+    def export(self, names: Optional[List[str]] = None):
+        """把内存中的表导出到原有的 json 文件"""
+        with self._lock:
+            for name in (names or list(self.exports)):
+                try:
+                    self._atomic_write(self.exports[name], json.dumps(self.tables[name], indent=4), fsync=False)
+                except Exception as e:
+                    print(f'[StateLog] export {name} failed: {e}')
+
+    def close(self):
+        """压缩后关闭日志文件"""
+        with self._lock:
+            if self._wal.closed:
+                return
+            self.compact()
+            self._wal.close()
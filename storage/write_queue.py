@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+WriteQueue: HybridStore 异步写回队列
+
+调用方线程 (通常是交易回调) 只把写操作放入有界队列并追加一行到日志文件,由后台线程批量执行
+- 分目标: 每个目标 (file / redis / mysql / clickhouse) 一个队列和一个后台线程,数据库故障重试时
+  不会挡住 File 的写入; 同一目标内按放入顺序执行,flush(target=...) 只等待该目标的操作
+- 持久化: 每个写操作先追加到 write_queue.jsonl,执行完成的操作在队列清空或累计 compact_every 个后
+  从日志中移除 (临时文件 + 原子替换); 进程崩溃后重启时重新执行日志中未完成的操作 (至少执行一次)
+- 批量: 每次最多取 batch_size 个操作,同一批中对同一个 key 的覆盖写 (持仓天数/最高价/最低价) 只执行最后一个
+- 重试: 执行失败 (异常或返回 False) 按 retry_delay 递增等待后重试,超过 max_retries 次后执行 fallback 目标,
+  仍然失败则写入 write_queue.failed.jsonl
+- 背压: 目标的队列满时调用方阻塞等待 (不丢弃、不乱序),等待次数和时间计入 stats()
+- 关闭: close() 等待队列清空后停止所有后台线程
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+
+from storage.logging_config import setup_storage_logger
+
+
+logger = setup_storage_logger('storage.queue', level=logging.INFO)
+
+# 后写入的值覆盖先写入的值,同一批中只需执行最后一个
+OVERWRITE_METHODS = {'update_held_days', 'update_max_price', 'update_min_price'}
+
+# 返回 False 表示跳过 (今日已递增 / 已存在) 而不是失败,不需要重试
+SKIPPABLE_METHODS = {'all_held_inc', 'create_account', 'create_strategy'}
+
+
+class WriteQueue:
+    """有界持久化写回队列"""
+
+    JOURNAL_NAME = 'write_queue.jsonl'
+    FAILED_NAME = 'write_queue.failed.jsonl'
+
+    def __init__(
+        self,
+        targets: Dict[str, Any],
+        cache_path: str,
+        maxsize: int = 10000,
+        batch_size: int = 100,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+        compact_every: int = 1000
+    ):
+        """
+        Args:
+            targets: {目标名: 存储实例},队列中的操作按目标名找到实例并调用同名方法
+            cache_path: 日志文件所在目录
+            maxsize: 每个目标的队列容量
+            batch_size: 后台线程每批最多执行的操作数
+            max_retries: 单个操作失败后的最多重试次数
+            retry_delay: 第一次重试前的等待秒数,之后按次数递增
+            compact_every: 累计完成多少个操作后压缩日志
+        """
+        self.targets = targets
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.compact_every = compact_every
+
+        self.path_journal = os.path.join(cache_path, self.JOURNAL_NAME)
+        self.path_failed = os.path.join(cache_path, self.FAILED_NAME)
+
+        self._queues: Dict[str, queue.Queue] = {target: queue.Queue(maxsize=maxsize) for target in targets}
+        self._pending: 'OrderedDict[int, Dict]' = OrderedDict()  # 已入队未完成的操作 {seq: entry}
+        self._pending_count: Dict[str, int] = {target: 0 for target in targets}  # 每个目标未完成的操作数
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._done_since_compact = 0
+
+        self.metrics = {
+            'enqueued': 0,      # 入队的操作数
+            'written': 0,       # 执行成功的操作数
+            'coalesced': 0,     # 被同一批中后续覆盖写合并掉的操作数
+            'retried': 0,       # 重试次数
+            'failed': 0,        # 重试后仍失败写入 failed 文件的操作数
+            'blocked': 0,       # 队列满时调用方阻塞等待的次数
+            'blocked_seconds': 0.0,  # 调用方因队列满等待的总时间
+            'max_depth': 0,     # 单个目标队列的最大深度
+            'batches': 0,       # 执行的批次数
+            'recovered': 0,     # 启动时从日志恢复的操作数
+        }
+
+        self._journal = None
+        self._recover()
+        self._journal = open(self.path_journal, 'a', encoding='utf-8')
+
+        self._stop = threading.Event()
+        self._threads: Dict[str, threading.Thread] = {}
+        for target in targets:
+            self._threads[target] = threading.Thread(
+                target=self._run, args=(target,), name=f'hybrid-write-behind-{target}', daemon=True
+            )
+            self._threads[target].start()
+
+    # ==================== 恢复与日志 ====================
+
+    def _recover(self):
+        """把日志中未完成的操作重新放入队列"""
+        if not os.path.exists(self.path_journal):
+            return
+
+        with open(self.path_journal, 'r', encoding='utf-8') as r:
+            for line in r:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                if entry.get('target') not in self._queues:
+                    logger.error(f'[WriteQueue] drop recovered write to unknown target: {line.strip()}')
+                    continue
+                entry['seq'] = self._next_seq()
+                self._pending[entry['seq']] = entry
+                self._pending_count[entry['target']] += 1
+                self.metrics['recovered'] += 1
+
+        for target, count in self._pending_count.items():
+            if count > self._queues[target].maxsize:
+                self._queues[target] = queue.Queue(maxsize=count)
+        for entry in self._pending.values():
+            self._queues[entry['target']].put_nowait(entry)
+        logger.info(f'[WriteQueue] recovered {self.metrics["recovered"]} pending writes')
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    @staticmethod
+    def _dumps(entry: Dict) -> str:
+        return json.dumps(
+            {k: v for k, v in entry.items() if k != 'seq'},
+            ensure_ascii=False, separators=(',', ':')
+        ) + '\n'
+
+    @staticmethod
+    def _normalize(arg: Any) -> Any:
+        """numpy 标量 (np.int64 / np.float64 等) 转为 Python 原生类型,其他参数原样返回"""
+        if isinstance(arg, np.generic):
+            return arg.item()
+        if isinstance(arg, (list, tuple)):
+            return [WriteQueue._normalize(item) for item in arg]
+        if isinstance(arg, dict):
+            return {key: WriteQueue._normalize(value) for key, value in arg.items()}
+        return arg
+
+    def _compact(self):
+        """日志只保留未完成的操作,调用方持有 _lock"""
+        temp_path = self.path_journal + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as w:
+            for entry in self._pending.values():
+                w.write(self._dumps(entry))
+        self._journal.close()
+        os.replace(temp_path, self.path_journal)
+        self._journal = open(self.path_journal, 'a', encoding='utf-8')
+        self._done_since_compact = 0
+
+    def _ack(self, entries: List[Dict]):
+        with self._lock:
+            for entry in entries:
+                if self._pending.pop(entry['seq'], None) is not None:
+                    self._pending_count[entry['target']] -= 1
+            self._done_since_compact += len(entries)
+            if not self._pending or self._done_since_compact >= self.compact_every:
+                self._compact()
+
+    # ==================== 入队 ====================
+
+    def put(self, target: str, method: str, *args, fallback: Optional[str] = None) -> bool:
+        """
+        放入一个写操作,numpy 标量会转为 Python 原生类型,其余参数必须可以 JSON 序列化,
+        不能序列化时拒绝入队,不写日志也不进入未完成列表
+
+        Args:
+            target: 目标名
+            method: 目标实例的方法名
+            *args: 方法参数
+            fallback: 重试后仍失败时改写入的目标名
+
+        Returns:
+            True: 已入队; False: 参数不能序列化或目标不存在
+        """
+        target_queue = self._queues.get(target)
+        if target_queue is None:
+            logger.error(f'[WriteQueue] reject {target}.{method}, unknown target')
+            return False
+
+        entry = {'target': target, 'method': method, 'args': [self._normalize(arg) for arg in args]}
+        if fallback:
+            entry['fallback'] = fallback
+
+        # 先序列化,成功后才登记为未完成的操作,避免不能执行也不能压缩的操作卡住 flush / close
+        try:
+            line = self._dumps(entry)
+        except (TypeError, ValueError) as e:
+            logger.error(f'[WriteQueue] reject {target}.{method}, args not serializable: {e}')
+            return False
+
+        with self._lock:
+            entry['seq'] = self._next_seq()
+            self._pending[entry['seq']] = entry
+            self._pending_count[target] += 1
+            self._journal.write(line)
+            self._journal.flush()
+
+        blocked = 0.0
+        try:
+            target_queue.put_nowait(entry)
+        except queue.Full:
+            logger.warning(f'[WriteQueue] {target} queue full, {method} waits for the worker')
+            start = time.perf_counter()
+            target_queue.put(entry)
+            blocked = time.perf_counter() - start
+
+        with self._lock:
+            self.metrics['enqueued'] += 1
+            if blocked > 0:
+                self.metrics['blocked'] += 1
+                self.metrics['blocked_seconds'] += blocked
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], target_queue.qsize())
+        return True
+
+    # ==================== 执行 ====================
+
+    def _call(self, target: str, entry: Dict) -> bool:
+        store = self.targets.get(target)
+        if store is None:
+            return False
+        result = getattr(store, entry['method'])(*entry['args'])
+        return result is not False or entry['method'] in SKIPPABLE_METHODS
+
+    def _count(self, key: str, value=1):
+        """各目标的后台线程并发更新计数"""
+        with self._lock:
+            self.metrics[key] += value
+
+    def _execute(self, entry: Dict) -> bool:
+        """执行单个操作,失败按次数递增等待后重试,最后尝试 fallback 目标"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._call(entry['target'], entry):
+                    self._count('written')
+                    return True
+            except Exception as e:
+                logger.error(f'[WriteQueue] {entry["target"]}.{entry["method"]} failed: {e}')
+
+            if attempt < self.max_retries:
+                self._count('retried')
+                self._stop.wait(self.retry_delay * (attempt + 1))  # 关闭时不再等待
+
+        if entry.get('fallback'):
+            try:
+                if self._call(entry['fallback'], entry):
+                    self._count('written')
+                    return True
+            except Exception as e:
+                logger.error(f'[WriteQueue] fallback {entry["fallback"]}.{entry["method"]} failed: {e}')
+
+        self._count('failed')
+        try:
+            with open(self.path_failed, 'a', encoding='utf-8') as w:
+                w.write(self._dumps(entry))
+        except Exception as e:
+            logger.error(f'[WriteQueue] save failed write {entry["method"]} failed: {e}')
+        return False
+
+    @staticmethod
+    def _coalesce(batch: List[Dict]) -> List[Dict]:
+        """同一批中对同一个 key 的覆盖写只保留最后一个,其他操作保持原有顺序"""
+        last = {}
+        for i, entry in enumerate(batch):
+            if entry['method'] in OVERWRITE_METHODS:
+                code, account_id = entry['args'][0], entry['args'][1]
+                last[(entry['target'], entry['method'], code, account_id)] = i
+        keep = set(last.values())
+        return [
+            entry for i, entry in enumerate(batch)
+            if entry['method'] not in OVERWRITE_METHODS or i in keep
+        ]
+
+    def _run(self, target: str):
+        target_queue = self._queues[target]
+        while not self._stop.is_set():
+            entry = target_queue.get()
+            if entry is None:  # close() 唤醒后台线程
+                continue
+
+            batch = [entry]
+            while len(batch) < self.batch_size:
+                try:
+                    entry = target_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not None:
+                    batch.append(entry)
+
+            executed = self._coalesce(batch)
+            self._count('coalesced', len(batch) - len(executed))
+            for entry in executed:
+                self._execute(entry)
+            self._ack(batch)
+            self._count('batches')
+
+    # ==================== 状态与关闭 ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、未完成的操作数及各项计数"""
+        with self._lock:
+            result = dict(self.metrics)
+            result['pending'] = len(self._pending)
+            result['pending_by_target'] = dict(self._pending_count)
+        result['depth'] = sum(target_queue.qsize() for target_queue in self._queues.values())
+        return result
+
+    def flush(self, timeout: Optional[float] = None, target: Optional[str] = None) -> bool:
+        """
+        等待已入队的操作执行完成
+
+        Args:
+            timeout: 最长等待秒数, None 表示一直等待
+            target: 只等待这个目标的操作, None 表示全部目标
+
+        Returns:
+            True: 已全部完成; False: 超时或后台线程已退出
+        """
+        targets = list(self._queues) if target is None else [target]
+        deadline = None if timeout is None else time.time() + timeout
+        while any(self._pending_count.get(name, 0) > 0 for name in targets):
+            if not all(self._threads[name].is_alive() for name in targets if self._pending_count[name] > 0):
+                return False
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """等待队列清空后停止后台线程,超时未完成的操作保留在日志中,下次启动时重新执行"""
+        drained = self.flush(timeout)
+        self._stop.set()
+        for target_queue in self._queues.values():
+            try:
+                target_queue.put_nowait(None)
+            except queue.Full:
+                pass  # 后台线程正在执行,执行完当前批次后退出
+        for thread in self._threads.values():
+            thread.join(timeout=5)
+        with self._lock:
+            if not self._journal.closed:
+                self._compact()
+                self._journal.close()
+        if not drained:
+            logger.warning(f'[WriteQueue] close with {len(self._pending)} pending writes kept in journal')
+        return drained
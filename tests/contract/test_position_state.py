@@ -7,10 +7,13 @@ T009: Contract Test - Position State Methods
 - get_held_days()
 - update_held_days()
 - delete_held_days()
+- get_position_states()
 """
 
 import pytest
+import fakeredis
 from storage.file_store import FileStore
+from storage.redis_store import RedisStore
 import tempfile
 import os
 import shutil
@@ -128,6 +131,30 @@ class ContractTestPositionState:
         # 验证
         assert store.get_held_days(code, account1) == 5
 
+    def test_get_position_states(self, store):
+        """测试批量查询与逐只查询结果一致"""
+        account_id = 'test_account'
+        store.update_held_days('600000.SH', account_id, 5)
+        store.update_max_price('600000.SH', account_id, 18.5)
+        store.update_held_days('000001.SZ', account_id, 2)
+        store.update_min_price('000001.SZ', account_id, 9.8)
+
+        codes = ['600000.SH', '000001.SZ', '600519.SH']
+        states = store.get_position_states(account_id, codes)
+
+        assert list(states.keys()) == codes
+        for code in codes:
+            assert states[code] == {
+                'held_days': store.get_held_days(code, account_id),
+                'max_price': store.get_max_price(code, account_id),
+                'min_price': store.get_min_price(code, account_id),
+            }
+        assert states['600519.SH'] == {'held_days': None, 'max_price': None, 'min_price': None}
+
+    def test_get_position_states_empty(self, store):
+        """测试批量查询空列表"""
+        assert store.get_position_states('test_account', []) == {}
+
 
 # ==================== FileStore 实现测试 ====================
 
@@ -145,14 +172,36 @@ class TestFileStorePositionState(ContractTestPositionState):
             shutil.rmtree(temp_dir)
 
 
-# ==================== 其他存储后端测试将在实现后添加 ====================
+class TestFileStoreWALPositionState(ContractTestPositionState):
+    """FileStore 预写日志模式的契约测试"""
 
-# TODO: 当 RedisStore 实现后,添加以下测试类
-# class TestRedisStorePositionState(ContractTestPositionState):
-#     @pytest.fixture
-#     def store(self):
-#         """创建 RedisStore 实例 (使用 fakeredis 或 Docker fixture)"""
-#         pass
+    @pytest.fixture
+    def store(self):
+        """创建临时 FileStore 实例"""
+        temp_dir = tempfile.mkdtemp(prefix='test_contract_filestore_wal_')
+        store = FileStore(cache_path=temp_dir, wal=True)
+        yield store
+        store.close()
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
+
+# ==================== RedisStore 实现测试 ====================
+
+class TestRedisStorePositionState(ContractTestPositionState):
+    """RedisStore 实现的契约测试"""
+
+    @pytest.fixture
+    def store(self):
+        """创建 RedisStore 实例 (使用 fakeredis)"""
+        store = object.__new__(RedisStore)
+        store.client = fakeredis.FakeStrictRedis(server=fakeredis.FakeServer())
+        store._register_lua_scripts()
+        yield store
+        store.close()
+
+
+# ==================== 其他存储后端测试将在实现后添加 ====================
 
 # TODO: 当 HybridStore 实现后,添加以下测试类
 # class TestHybridStorePositionState(ContractTestPositionState):
@@ -8,13 +8,16 @@ T011: Contract Test - Price Tracking Methods
 - update_max_price()
 - get_min_price()
 - update_min_price()
+- update_price_extremes()
 """
 
 import pytest
 import tempfile
 import os
 import shutil
+import fakeredis
 from storage.file_store import FileStore
+from storage.redis_store import RedisStore
 
 
 class ContractTestPriceTracking:
@@ -102,6 +105,35 @@ class ContractTestPriceTracking:
             assert store.get_max_price(code, account_id) == prices['max']
             assert store.get_min_price(code, account_id) == prices['min']
 
+    def test_update_price_extremes(self, store):
+        """测试批量更新只写入更高的最高价和更低的最低价"""
+        account_id = 'test_account'
+        store.update_max_price('600000.SH', account_id, 18.5)
+        store.update_min_price('600000.SH', account_id, 10.2)
+        store.update_max_price('000001.SZ', account_id, 25.3)
+        store.update_min_price('000001.SZ', account_id, 20.1)
+
+        success = store.update_price_extremes(account_id, {
+            '600000.SH': (19.1234, 10.5),   # 新高,未创新低
+            '000001.SZ': (24.0, 19.9),      # 未创新高,新低
+            '600519.SH': (1680.0, 1500.5),  # 没有记录时直接写入
+            '300750.SZ': (None, 180.0),     # 只更新最低价
+        })
+        assert success is True
+
+        assert store.get_max_price('600000.SH', account_id) == 19.123
+        assert store.get_min_price('600000.SH', account_id) == 10.2
+        assert store.get_max_price('000001.SZ', account_id) == 25.3
+        assert store.get_min_price('000001.SZ', account_id) == 19.9
+        assert store.get_max_price('600519.SH', account_id) == 1680.0
+        assert store.get_min_price('600519.SH', account_id) == 1500.5
+        assert store.get_max_price('300750.SZ', account_id) is None
+        assert store.get_min_price('300750.SZ', account_id) == 180.0
+
+    def test_update_price_extremes_empty(self, store):
+        """测试批量更新空字典"""
+        assert store.update_price_extremes('test_account', {}) is True
+
 
 class TestFileStorePriceTracking(ContractTestPriceTracking):
     """FileStore 实现的契约测试"""
@@ -115,5 +147,30 @@ class TestFileStorePriceTracking(ContractTestPriceTracking):
             shutil.rmtree(temp_dir)
 
 
+class TestFileStoreWALPriceTracking(ContractTestPriceTracking):
+    """FileStore 预写日志模式的契约测试"""
+
+    @pytest.fixture
+    def store(self):
+        temp_dir = tempfile.mkdtemp(prefix='test_contract_filestore_wal_price_')
+        store = FileStore(cache_path=temp_dir, wal=True)
+        yield store
+        store.close()
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
+
+class TestRedisStorePriceTracking(ContractTestPriceTracking):
+    """RedisStore 实现的契约测试 (fakeredis 不执行 Lua 脚本,覆盖 pipeline 路径)"""
+
+    @pytest.fixture
+    def store(self):
+        store = object.__new__(RedisStore)
+        store.client = fakeredis.FakeStrictRedis(server=fakeredis.FakeServer())
+        store._register_lua_scripts()
+        yield store
+        store.close()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '-s'])
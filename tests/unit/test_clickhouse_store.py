@@ -21,6 +21,8 @@ ClickHouseStore单元测试
 执行: pytest tests/unit/test_clickhouse_store.py -v --cov=storage/clickhouse_store
 """
 
+import os
+import time
 import pytest
 from unittest.mock import MagicMock, patch, call
 from datetime import datetime, date
@@ -295,10 +297,10 @@ class TestKlineData:
         """测试基本K线查询"""
         store, mock_client = mock_clickhouse_store
 
-        # Mock K线数据 (8列: date, datetime, open, high, low, close, volume, amount)
+        # Mock K线数据 (列式结果, 8列: date, datetime, open, high, low, close, volume, amount)
         mock_client.execute.return_value = [
-            (date(2025, 1, 15), datetime(2025, 1, 15, 9, 30), 15.50, 16.00, 15.20, 15.80,
-             1000000, 15750000.0)
+            (date(2025, 1, 15),), (20250115,), (15.50,), (16.00,), (15.20,), (15.80,),
+            (1000000,), (15750000.0,)
         ]
 
         result = store.get_kline(
@@ -318,6 +320,13 @@ class TestKlineData:
         # 验证数据
         assert result.iloc[0]['open'] == 15.50
         assert result.iloc[0]['high'] == 16.00
+        assert result.iloc[0]['datetime'] == 20250115
+
+        # 与 batch_get_kline 相同的参数化列式查询
+        sql, params = mock_client.execute.call_args[0]
+        assert 'toYYYYMMDD(date) AS datetime' in sql
+        assert params['code'] == '000001.SZ'
+        assert mock_client.execute.call_args[1] == {'columnar': True}
 
     def test_get_kline_date_filter(self, mock_clickhouse_store):
         """测试K线日期过滤"""
@@ -358,10 +367,14 @@ class TestKlineData:
         """测试批量查询K线"""
         store, mock_client = mock_clickhouse_store
 
-        # Mock多个股票的K线数据 (9列: stock_code, date, datetime, open, high, low, close, volume, amount)
+        # Mock多个股票的K线数据 (列式结果, 9列: stock_code, date, datetime, open, high, low, close, volume, amount)
         mock_client.execute.return_value = [
-            ('000001.SZ', date(2025, 1, 15), datetime(2025, 1, 15, 9, 30), 15.50, 16.00, 15.20, 15.80, 1000000, 15750000.0),
-            ('600000.SH', date(2025, 1, 15), datetime(2025, 1, 15, 9, 30), 10.20, 10.50, 10.10, 10.40, 500000, 5200000.0)
+            ('000001.SZ', '600000.SH'),
+            (date(2025, 1, 15), date(2025, 1, 15)),
+            (20250115, 20250115),
+            (15.50, 10.20), (16.00, 10.50), (15.20, 10.10), (15.80, 10.40),
+            (1000000, 500000),
+            (15750000.0, 5200000.0),
         ]
 
         result = store.batch_get_kline(
@@ -379,6 +392,54 @@ class TestKlineData:
         assert isinstance(result['000001.SZ'], pd.DataFrame)
         assert len(result['000001.SZ']) == 1
 
+    def test_batch_get_kline_parameterized_chunks(self, mock_clickhouse_store):
+        """测试批量查询K线使用参数化查询, 按 chunk_size 分块, 以列式读取"""
+        store, mock_client = mock_clickhouse_store
+        mock_client.execute.return_value = []
+
+        store.batch_get_kline(
+            stock_codes=['000001.SZ', '600000.SH', "000002.SZ'"],
+            start_date='2025-01-01',
+            end_date='2025-01-31',
+            chunk_size=2
+        )
+
+        assert mock_client.execute.call_count == 2
+        sql, params = mock_client.execute.call_args_list[0][0]
+        assert '%(codes)s' in sql
+        assert "000001.SZ" not in sql
+        assert params['codes'] == ('000001.SZ', '600000.SH')
+        assert params['start_date'] == '2025-01-01'
+        assert mock_client.execute.call_args_list[1][0][1]['codes'] == ("000002.SZ'",)
+        assert mock_client.execute.call_args_list[1][1]['columnar'] is True
+
+    def test_batch_get_kline_split_by_code(self, mock_clickhouse_store):
+        """测试列式结果一次切分到每只股票, 类型转换正确, 缺失股票返回空DataFrame"""
+        store, mock_client = mock_clickhouse_store
+        mock_client.execute.return_value = [
+            ('000001.SZ', '000001.SZ', '600000.SH', '000001.SZ'),
+            (date(2025, 1, 14), date(2025, 1, 15), date(2025, 1, 15), date(2025, 1, 16)),
+            (20250114, 20250115, 20250115, 20250116),
+            (15.1, 15.5, 10.2, 15.9), (16.0, 16.0, 10.5, 16.2), (15.0, 15.2, 10.1, 15.7), (15.4, 15.8, 10.4, 16.1),
+            (100, 200, 300, 400),
+            (1000.0, 2000.0, 3000.0, 4000.0),
+        ]
+
+        result = store.batch_get_kline(
+            stock_codes=['000001.SZ', '600000.SH', '000002.SZ'],
+            start_date='2025-01-01',
+            end_date='2025-01-31'
+        )
+
+        df = result['000001.SZ']
+        assert list(df.columns) == ['date', 'datetime', 'open', 'high', 'low', 'close', 'volume', 'amount']
+        assert df['datetime'].tolist() == [20250114, 20250115, 20250116]
+        assert df['close'].tolist() == [15.4, 15.8, 16.1]
+        assert df['volume'].dtype == 'int64'
+        assert df['open'].dtype == 'float64'
+        assert result['600000.SH']['amount'].tolist() == [3000.0]
+        assert len(result['000002.SZ']) == 0
+
     def test_get_kline_error_handling(self, mock_clickhouse_store):
         """测试K线查询错误处理"""
         store, mock_client = mock_clickhouse_store
@@ -395,6 +456,181 @@ class TestKlineData:
         assert len(result) == 0
 
 
+class TestTradeBatching:
+    """测试交易记录批量写入"""
+
+    @pytest.fixture
+    def batch_store(self, tmp_path):
+        """创建开启批量写入的ClickHouseStore实例 (后台线程不会主动写入)"""
+        with patch('storage.clickhouse_store.Client') as MockClient:
+            mock_client = MagicMock()
+            MockClient.return_value = mock_client
+
+            store = ClickHouseStore(
+                database='test_db',
+                trade_batch_size=100,
+                trade_flush_interval=60,
+                trade_spill_path=str(tmp_path / 'trade_spill.jsonl')
+            )
+            yield store, mock_client
+            store.close()
+
+    def test_record_trade_buffered(self, batch_store, sample_trade_data):
+        """测试交易先放入缓冲, flush 时一次列式写入"""
+        store, mock_client = batch_store
+
+        for i in range(3):
+            assert store.record_trade(**{**sample_trade_data, 'volume': 100 * (i + 1)}) is True
+        mock_client.execute.assert_not_called()
+
+        store.flush()
+        assert mock_client.execute.call_count == 1
+        sql, columns = mock_client.execute.call_args[0]
+        assert 'INSERT INTO test_db.trade' in sql
+        assert mock_client.execute.call_args[1] == {'columnar': True}
+        assert columns[8] == [100, 200, 300]  # volume 列
+        assert columns[9] == [1550.0, 3100.0, 4650.0]  # amount 列
+        assert store.trade_buffer.rows == []
+
+    def test_flush_on_batch_size(self, batch_store, sample_trade_data):
+        """测试缓冲达到 batch_size 时后台线程写入"""
+        store, mock_client = batch_store
+        store.trade_buffer.batch_size = 2
+
+        store.record_trade(**sample_trade_data)
+        store.record_trade(**sample_trade_data)
+
+        for _ in range(100):  # 等待后台线程写入
+            if store.trade_buffer.flushed_rows == 2:
+                break
+            time.sleep(0.01)
+        assert store.trade_buffer.flushed_rows == 2
+
+    def test_failed_flush_keeps_rows(self, batch_store, sample_trade_data):
+        """测试写入失败时交易留在缓冲和 spill 文件中"""
+        store, mock_client = batch_store
+        mock_client.execute.side_effect = Exception('ClickHouse connection error')
+
+        store.record_trade(**sample_trade_data)
+        assert store.trade_buffer.flush() is False
+        assert len(store.trade_buffer.rows) == 1
+
+        mock_client.execute.side_effect = None
+        assert store.trade_buffer.flush() is True
+        assert store.trade_buffer.rows == []
+        assert open(store.trade_buffer.spill_path).read() == ''
+
+    def test_connection_error_keeps_rows(self, batch_store, sample_trade_data):
+        """测试断连时交易一直留在缓冲和 spill 文件中,不移到死信文件"""
+        from clickhouse_driver.errors import NetworkError
+        store, mock_client = batch_store
+        buffer = store.trade_buffer
+        mock_client.execute.side_effect = NetworkError('Connection refused')
+
+        store.record_trade(**sample_trade_data)
+        for _ in range(20):
+            assert buffer.flush() is False
+        assert len(buffer.rows) == 1
+        assert buffer.failures == 20
+        assert not os.path.exists(buffer.failed_path)
+        assert open(buffer.spill_path).read() != ''
+
+        mock_client.execute.side_effect = None
+        assert buffer.flush() is True
+        assert buffer.rows == []
+        assert buffer.failures == 0
+
+    def test_rejected_rows_bisected(self, batch_store, sample_trade_data):
+        """测试服务端拒绝时二分找出被拒绝的行移到死信文件,其余的行正常写入"""
+        import json
+        from clickhouse_driver.errors import ErrorCodes, ServerException
+        store, mock_client = batch_store
+        buffer = store.trade_buffer
+        inserted = []
+
+        def execute(sql, columns, columnar):
+            if 'BAD.SZ' in columns[3]:
+                raise ServerException('Cannot parse input', code=ErrorCodes.CANNOT_PARSE_TEXT)
+            inserted.extend(columns[3])
+
+        mock_client.execute.side_effect = execute
+        for code in ['000001.SZ', '000002.SZ', 'BAD.SZ', '000004.SZ', '000005.SZ']:
+            store.record_trade(**{**sample_trade_data, 'stock_code': code})
+
+        assert buffer.flush() is False
+        assert sorted(inserted) == ['000001.SZ', '000002.SZ', '000004.SZ', '000005.SZ']
+        assert buffer.rows == []
+        assert buffer.dead_rows == 1
+        assert open(buffer.spill_path).read() == ''
+        with open(buffer.failed_path) as r:
+            assert [json.loads(line)[2] for line in r] == ['BAD.SZ']
+
+    def test_dead_letter_replayed_on_restart(self, tmp_path, sample_trade_data):
+        """测试启动时死信文件中的交易重新放入缓冲和 spill 文件"""
+        import json
+        spill_path = str(tmp_path / 'trade_spill.jsonl')
+        failed_path = str(tmp_path / 'trade_spill.failed.jsonl')
+        args = [sample_trade_data[key] for key in ['account_id', 'timestamp', 'stock_code', 'stock_name',
+                                                   'order_type', 'remark', 'price', 'volume']] + [None]
+        with open(failed_path, 'w') as w:
+            w.write(json.dumps(args) + '\n')
+
+        with patch('storage.clickhouse_store.Client') as MockClient:
+            MockClient.return_value = MagicMock()
+            store = ClickHouseStore(database='test_db', trade_batch_size=100,
+                                    trade_flush_interval=60, trade_spill_path=spill_path)
+            try:
+                assert len(store.trade_buffer.rows) == 1
+                assert not os.path.exists(failed_path)
+                with open(spill_path) as r:
+                    assert json.loads(r.readline()) == args
+            finally:
+                store.close()
+
+    def test_buffer_full_rejects(self, batch_store, sample_trade_data):
+        """测试缓冲达到 max_rows 后拒绝新的交易"""
+        store, mock_client = batch_store
+        store.trade_buffer.max_rows = 2
+
+        assert store.record_trade(**sample_trade_data) is True
+        assert store.record_trade(**sample_trade_data) is True
+        assert store.record_trade(**sample_trade_data) is False
+        assert len(store.trade_buffer.rows) == 2
+        assert store.trade_buffer.rejected_rows == 1
+
+    def test_spill_replay(self, tmp_path, sample_trade_data):
+        """测试进程崩溃前没写入的交易在重启后重新写入"""
+        spill_path = str(tmp_path / 'trade_spill.jsonl')
+        with patch('storage.clickhouse_store.Client') as MockClient:
+            MockClient.return_value = MagicMock()
+            crashed = ClickHouseStore(database='test_db', trade_batch_size=100,
+                                      trade_flush_interval=60, trade_spill_path=spill_path)
+            crashed.record_trade(**sample_trade_data)
+            crashed.record_trade(**{**sample_trade_data, 'stock_code': '600000.SH'})
+            # 不调用 close,模拟进程崩溃
+
+            mock_client = MagicMock()
+            MockClient.return_value = mock_client
+            store = ClickHouseStore(database='test_db', trade_batch_size=100,
+                                    trade_flush_interval=60, trade_spill_path=spill_path)
+            assert len(store.trade_buffer.rows) == 2
+
+            store.close()
+            columns = mock_client.execute.call_args[0][1]
+            assert columns[3] == ['000001.SZ', '600000.SH']  # stock_code 列
+
+    def test_query_flushes_buffer(self, batch_store, sample_trade_data):
+        """测试查询前先写入缓冲中的交易"""
+        store, mock_client = batch_store
+        store.record_trade(**sample_trade_data)
+
+        mock_client.execute.return_value = []
+        store.query_trades(sample_trade_data['account_id'])
+
+        assert 'INSERT INTO' in mock_client.execute.call_args_list[0][0][0]
+        assert store.trade_buffer.rows == []
+
+
 class TestNotImplementedMethods:
     """测试未实现的方法"""
 
@@ -491,9 +727,9 @@ class TestDataConsistency:
         """测试K线DataFrame列顺序"""
         store, mock_client = mock_clickhouse_store
 
-        # Mock数据 (8列: date, datetime, open, high, low, close, volume, amount)
+        # Mock数据 (列式结果, 8列: date, datetime, open, high, low, close, volume, amount)
         mock_client.execute.return_value = [
-            (date(2025, 1, 15), datetime(2025, 1, 15, 9, 30), 15.50, 16.00, 15.20, 15.80, 1000000, 15750000.0)
+            (date(2025, 1, 15),), (20250115,), (15.50,), (16.00,), (15.20,), (15.80,), (1000000,), (15750000.0,)
         ]
 
         result = store.get_kline('000001.SZ', '2025-01-01', '2025-01-31')
@@ -10,6 +10,7 @@ import tempfile
 import datetime
 import pytest
 import pandas as pd
+from unittest.mock import patch
 
 from storage.file_store import FileStore
 
@@ -163,13 +164,109 @@ class TestFileStore:
     # ==================== K线数据测试 ====================
 
     def test_kline_operations(self, store):
-        """测试 K线操作 (文件存储不支持,应返回空)"""
+        """测试 K线操作 (没有数据时应返回空)"""
         df = store.get_kline('600000.SH', '2024-01-01', '2024-01-31')
         assert df.empty
 
         result = store.batch_get_kline(['600000.SH', '000001.SZ'], '2024-01-01', '2024-01-31')
         assert result == {}
 
+    @staticmethod
+    def _kline(dates, close):
+        return pd.DataFrame({
+            'datetime': dates,
+            'open': close, 'high': close, 'low': close, 'close': close,
+            'volume': [1000] * len(dates), 'amount': [10000.0] * len(dates),
+        })
+
+    def test_kline_append_and_query(self, store):
+        """测试批量追加日线后按代码和日期范围查询, 跨月分区"""
+        assert store.batch_append_kline({
+            '600000.SH': self._kline([20240130, 20240131, 20240201], [10.0, 10.5, 11.0]),
+            '000001.SZ': self._kline([20240131, 20240201], [12.0, 12.5]),
+        }) is True
+        assert sorted(os.listdir(store.kline.root_path)) == ['202401.parquet', '202402.parquet']
+
+        df = store.get_kline('600000.SH', '2024-01-31', '20240201')
+        assert list(df.columns) == ['datetime', 'open', 'high', 'low', 'close', 'volume', 'amount']
+        assert df['datetime'].tolist() == [20240131, 20240201]
+        assert df['close'].tolist() == [10.5, 11.0]
+
+        result = store.batch_get_kline(['000001.SZ', '600000.SH', '600519.SH'], '2024-02-01', '2024-02-29')
+        assert result['000001.SZ']['close'].tolist() == [12.5]
+        assert result['600000.SH']['close'].tolist() == [11.0]
+        assert result['600519.SH'].empty
+
+    def test_kline_append_overwrites(self, store):
+        """测试同一 (code, datetime) 的新行覆盖旧行, 文件内按 (code, datetime) 排序"""
+        store.batch_append_kline({'600000.SH': self._kline([20240102, 20240103], [10.0, 10.5])})
+        store.batch_append_kline({
+            '600000.SH': self._kline([20240103, 20240104], [9.9, 11.0]),
+            '000001.SZ': self._kline([20240104], [12.0]),
+        })
+
+        df = store.kline.read(['600000.SH', '000001.SZ'], '20240101', '20240131')
+        assert df['code'].tolist() == ['000001.SZ', '600000.SH', '600000.SH', '600000.SH']
+        assert df['close'].tolist() == [12.0, 10.0, 9.9, 11.0]
+
+    def test_kline_replace_and_delete(self, store):
+        """测试整只股票替换删除旧月份的行, 删除后月份文件为空时移除"""
+        store.batch_append_kline({
+            '600000.SH': self._kline([20231229, 20240102], [9.0, 9.5]),
+            '000001.SZ': self._kline([20240102], [12.0]),
+        })
+        assert store.batch_replace_kline({'600000.SH': self._kline([20240102, 20240103], [8.0, 8.1])}) is True
+
+        result = store.batch_get_kline(['600000.SH', '000001.SZ'], '2023-12-01', '2024-01-31')
+        assert result['600000.SH']['datetime'].tolist() == [20240102, 20240103]
+        assert result['600000.SH']['close'].tolist() == [8.0, 8.1]
+        assert result['000001.SZ']['close'].tolist() == [12.0]
+        assert store.kline.months() == [202401]
+
+        assert store.delete_kline(['600000.SH', '000001.SZ']) is True
+        assert store.kline.months() == []
+        assert store.batch_get_kline(['600000.SH'], '2023-12-01', '2024-01-31') == {}
+
+    def test_kline_append_closes_cached_handle(self, store):
+        """测试替换分区文件前关闭读取时缓存的句柄 (Windows 上打开的文件不能被替换)"""
+        store.batch_append_kline({'600000.SH': self._kline([20240102], [10.0])})
+        store.batch_get_kline(['600000.SH'], '2024-01-01', '2024-01-31')
+        path = store.kline._path(202401)
+        parquet_file = store.kline._files[path][1]
+
+        replace = os.replace
+        closed_before_replace = []
+
+        def spy_replace(src, dst):
+            closed_before_replace.append(parquet_file.closed)
+            replace(src, dst)
+
+        with patch('storage.kline_parquet.os.replace', spy_replace):
+            store.batch_append_kline({'600000.SH': self._kline([20240103], [10.5])})
+
+        assert closed_before_replace == [True]
+        df = store.batch_get_kline(['600000.SH'], '2024-01-01', '2024-01-31')['600000.SH']
+        assert df['close'].tolist() == [10.0, 10.5]
+
+    def test_kline_row_group_pruning(self, temp_cache_dir):
+        """测试按 row group 统计信息跳过不包含目标代码的 row group"""
+        from storage.kline_parquet import KlineParquet
+
+        kline = KlineParquet(temp_cache_dir, row_group_size=4)
+        kline.append({f'{i:06d}.SZ': self._kline([20240102, 20240103], [float(i)] * 2) for i in range(10)})
+
+        _, parquet_file, stats = kline._open(kline._path(202401))
+        assert len(stats) == 5
+
+        read_row_groups = parquet_file.read_row_groups
+        read = []
+        parquet_file.read_row_groups = lambda row_groups: read.append(row_groups) or read_row_groups(row_groups)
+
+        df = kline.read(['000004.SZ'], '2024-01-01', '2024-01-31')
+        assert df['close'].tolist() == [4.0, 4.0]
+        assert read == [[2]]
+        kline.close()
+
     # ==================== 账户管理测试 ====================
 
     def test_account_management(self, store):
@@ -258,6 +355,124 @@ class TestFileStore:
         """测试关闭连接 (无操作)"""
         store.close()  # 不应抛出异常
 
+    def test_write_behind(self, temp_cache_dir):
+        """测试写回模式: 读写只走内存, flush / close 后才落盘"""
+        import json
+        store = FileStore(cache_path=temp_cache_dir, write_behind=True)
+        try:
+            store.update_held_days('600000.SH', 'test_account', 3)
+            assert store.get_held_days('600000.SH', 'test_account') == 3
+
+            with open(store.path_held) as r:
+                assert '600000.SH' not in json.load(r)
+
+            store.flush()
+            with open(store.path_held) as r:
+                assert json.load(r)['600000.SH'] == 3
+        finally:
+            store.close()
+
+
+# ==================== 预写日志模式 ====================
+
+class TestFileStoreWAL:
+    """FileStore 预写日志模式测试"""
+
+    @pytest.fixture
+    def temp_cache_dir(self):
+        """创建临时缓存目录"""
+        temp_dir = tempfile.mkdtemp(prefix='test_filestore_wal_')
+        yield temp_dir
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
+    @pytest.fixture
+    def store(self, temp_cache_dir):
+        """创建预写日志模式的 FileStore 实例"""
+        store = FileStore(cache_path=temp_cache_dir, wal=True)
+        yield store
+        store.close()
+
+    def test_position_state(self, store):
+        """测试持仓状态的增删改查"""
+        account_id = 'test_account'
+        store.batch_new_held(account_id, ['600000.SH', '000001.SZ'])
+        assert store.all_held_inc(account_id) is True
+        assert store.all_held_inc(account_id) is False
+        assert store.get_held_days('600000.SH', account_id) == 1
+
+        store.update_held_days('600000.SH', account_id, 5)
+        store.delete_held_days('000001.SZ', account_id)
+        store.update_max_price('600000.SH', account_id, 12.3456)
+        store.update_min_price('600000.SH', account_id, 9.8765)
+
+        assert store.get_held_days('600000.SH', account_id) == 5
+        assert store.get_held_days('000001.SZ', account_id) is None
+        assert store.get_max_price('600000.SH', account_id) == 12.346
+        assert store.get_min_price('600000.SH', account_id) == 9.877
+
+    def test_recover_after_crash(self, temp_cache_dir):
+        """测试未关闭时从快照和日志恢复,丢弃写了一半的最后一行"""
+        store = FileStore(cache_path=temp_cache_dir, wal=True)
+        store.update_held_days('600000.SH', 'test_account', 3)
+        store.state_log.compact()
+        store.update_max_price('600000.SH', 'test_account', 11.0)
+        store.update_held_days('000001.SZ', 'test_account', 7)
+        store.state_log._wal.write('{"t":"held_days","s":{"600000.SH"')
+        store.state_log._wal.flush()
+
+        recovered = FileStore(cache_path=temp_cache_dir, wal=True)
+        try:
+            assert recovered.get_held_days('600000.SH', 'test_account') == 3
+            assert recovered.get_held_days('000001.SZ', 'test_account') == 7
+            assert recovered.get_max_price('600000.SH', 'test_account') == 11.0
+            assert recovered.state_log.wal_lines == 2
+        finally:
+            recovered.close()
+            store.state_log._wal.close()
+
+    def test_compact_exports_json(self, store):
+        """测试压缩后清空日志并导出 json 视图"""
+        import json
+        store.state_log.compact_every = 10
+        for i in range(25):
+            store.update_max_price('600000.SH', 'test_account', 10.0 + i)
+
+        assert store.state_log.wal_lines == 5
+        with open(store.path_max_prices) as r:
+            assert json.load(r)['600000.SH'] == 29.0
+
+        store.flush()
+        assert os.path.getsize(store.state_log.path_wal) == 0
+        with open(store.path_max_prices) as r:
+            assert json.load(r)['600000.SH'] == 34.0
+
+    def test_utils_cache_through_wal(self, store):
+        """测试 utils_cache 对同一 json 文件的读写经过预写日志,两边互相可见"""
+        import threading
+        from tools import utils_cache
+        lock = threading.Lock()
+
+        utils_cache.new_held(lock, store.path_held, ['600000.SH'])
+        assert store.all_held_inc('test_account') is True
+        assert store.get_held_days('600000.SH', 'test_account') == 1
+        assert utils_cache.load_json(store.path_held)['600000.SH'] == 1
+
+        store.update_max_price('000001.SZ', 'test_account', 11.0)
+        utils_cache.del_key(lock, store.path_max_prices, '000001.SZ')
+        assert store.get_max_price('000001.SZ', 'test_account') is None
+        assert store.state_log.wal_lines == 4
+
+    def test_migrate_from_json(self, temp_cache_dir):
+        """测试没有快照时从已有 json 文件初始化"""
+        FileStore(cache_path=temp_cache_dir).update_held_days('600000.SH', 'test_account', 4)
+
+        store = FileStore(cache_path=temp_cache_dir, wal=True)
+        try:
+            assert store.get_held_days('600000.SH', 'test_account') == 4
+        finally:
+            store.close()
+
 
 # ==================== 集成测试场景 ====================
 
@@ -305,5 +305,44 @@ class TestHybridStoreAccountOperations:
             assert account['current_capital'] == 95000.0
 
 
+class TestHybridStoreAsyncWrites:
+    """测试 HybridStore 异步写回模式"""
+
+    @pytest.fixture
+    def hybrid_store(self, tmp_path):
+        """创建只有 File 的异步写回混合存储实例"""
+        store = create_data_store('hybrid', {
+            'cache_path': str(tmp_path),
+            'enable_redis': False,
+            'enable_mysql': False,
+            'enable_clickhouse': False,
+            'async_writes': True
+        })
+        yield store
+        store.close()
+
+    def test_writes_go_through_queue(self, hybrid_store):
+        """测试 File 写入经过队列, 降级读取前等待队列完成"""
+        account_id = 'test_hybrid_async'
+        assert hybrid_store.batch_new_held(account_id, ['SH600000']) is True
+        assert hybrid_store.update_held_days('SH600000', account_id, 3) is True
+        assert hybrid_store.update_price_extremes(account_id, {'SH600000': (12.5, 9.8)}) is True
+
+        assert hybrid_store.get_held_days('SH600000', account_id) == 3
+        assert hybrid_store.get_max_price('SH600000', account_id) == 12.5
+        assert hybrid_store.write_queue.stats()['enqueued'] == 3
+
+    def test_close_flushes_queue(self, tmp_path):
+        """测试 close 前执行完队列中的写入"""
+        store = HybridStore(
+            cache_path=str(tmp_path), enable_redis=False, enable_mysql=False,
+            enable_clickhouse=False, async_writes=True
+        )
+        store.update_max_price('SH600000', 'test_hybrid_async', 15.5)
+        store.close()
+
+        assert FileStore(cache_path=str(tmp_path)).get_max_price('SH600000', 'test_hybrid_async') == 15.5
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+WriteQueue 单元测试
+
+测试范围:
+1. 异步执行: put 后由后台线程写入, flush / close 等待完成
+2. 批量: 同一批中的覆盖写合并
+3. 重试与 fallback: 失败重试, 重试后改写 fallback 目标, 最终失败写入 failed 文件
+4. 持久化: 未完成的操作在重启后重新执行
+5. 背压: 队列满时调用方阻塞并计数
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import pytest
+
+from storage.file_store import FileStore
+from storage.write_queue import WriteQueue
+
+
+class RecordingTarget:
+    """记录调用的存储实例, fail_times 次之前的调用抛出异常"""
+
+    def __init__(self, fail_times: int = 0, delay: float = 0.0):
+        self.calls = []
+        self.fail_times = fail_times
+        self.delay = delay
+
+    def update_held_days(self, code, account_id, days):
+        return self._record('update_held_days', code, account_id, days)
+
+    def record_trade(self, *args):
+        return self._record('record_trade', *args)
+
+    def all_held_inc(self, account_id):
+        self.calls.append(('all_held_inc', account_id))
+        return False  # 今日已递增
+
+    def _record(self, method, *args):
+        time.sleep(self.delay)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError('backend down')
+        self.calls.append((method, *args))
+        return True
+
+
+@pytest.fixture
+def temp_cache_dir():
+    """创建临时缓存目录"""
+    temp_dir = tempfile.mkdtemp(prefix='test_write_queue_')
+    yield temp_dir
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+
+
+class TestWriteQueue:
+    """WriteQueue 测试套件"""
+
+    def test_put_and_flush(self, temp_cache_dir):
+        """测试放入队列后由后台线程写入 FileStore"""
+        store = FileStore(cache_path=temp_cache_dir)
+        write_queue = WriteQueue({'file': store}, temp_cache_dir)
+        try:
+            assert write_queue.put('file', 'batch_new_held', 'test_account', ['600000.SH']) is True
+            assert write_queue.put('file', 'update_price_extremes', 'test_account', {'600000.SH': (10.5, 9.5)})
+            assert write_queue.flush(timeout=5) is True
+
+            assert store.get_held_days('600000.SH', 'test_account') == 0
+            assert store.get_max_price('600000.SH', 'test_account') == 10.5
+            assert store.get_min_price('600000.SH', 'test_account') == 9.5
+            assert write_queue.stats()['written'] == 2
+            assert os.path.getsize(write_queue.path_journal) == 0
+        finally:
+            write_queue.close()
+
+    def test_numpy_args_and_reject_unserializable(self, temp_cache_dir):
+        """测试 numpy 标量转为原生类型入队,不能序列化的参数被拒绝且不卡住 flush / close"""
+        import numpy as np
+        target = RecordingTarget()
+        write_queue = WriteQueue({'db': target}, temp_cache_dir)
+        try:
+            assert write_queue.put('db', 'update_held_days', '600000.SH', 'test_account', np.int64(3)) is True
+            assert write_queue.put('db', 'update_held_days', '000001.SZ', 'test_account', object()) is False
+            assert write_queue.flush(timeout=5) is True
+
+            assert target.calls == [('update_held_days', '600000.SH', 'test_account', 3)]
+            assert type(target.calls[0][3]) is int
+            assert write_queue.stats()['pending'] == 0
+        finally:
+            assert write_queue.close(timeout=5) is True
+
+    def test_coalesce_overwrites(self):
+        """测试同一批中对同一个 key 的覆盖写只保留最后一个"""
+        batch = [
+            {'target': 'file', 'method': 'update_held_days', 'args': ['600000.SH', 'a', 1]},
+            {'target': 'file', 'method': 'delete_held_days', 'args': ['000001.SZ', 'a']},
+            {'target': 'file', 'method': 'update_held_days', 'args': ['000001.SZ', 'a', 2]},
+            {'target': 'file', 'method': 'update_held_days', 'args': ['600000.SH', 'a', 3]},
+        ]
+        executed = WriteQueue._coalesce(batch)
+        assert executed == batch[1:]
+
+    def test_retry_then_success(self, temp_cache_dir):
+        """测试失败后重试成功"""
+        target = RecordingTarget(fail_times=2)
+        write_queue = WriteQueue({'db': target}, temp_cache_dir, retry_delay=0.01)
+        try:
+            write_queue.put('db', 'update_held_days', '600000.SH', 'a', 5)
+            assert write_queue.flush(timeout=5) is True
+            assert target.calls == [('update_held_days', '600000.SH', 'a', 5)]
+            assert write_queue.stats()['retried'] == 2
+        finally:
+            write_queue.close()
+
+    def test_fallback_and_failed_file(self, temp_cache_dir):
+        """测试重试后改写 fallback 目标, 都失败时写入 failed 文件"""
+        backup = RecordingTarget()
+        write_queue = WriteQueue(
+            {'db': RecordingTarget(fail_times=100), 'file': backup, 'down': RecordingTarget(fail_times=100)},
+            temp_cache_dir, max_retries=1, retry_delay=0.01
+        )
+        try:
+            write_queue.put('db', 'record_trade', 'a', '600000.SH', 10.0, fallback='file')
+            write_queue.put('db', 'record_trade', 'a', '000001.SZ', 11.0, fallback='down')
+            assert write_queue.flush(timeout=5) is True
+
+            assert backup.calls == [('record_trade', 'a', '600000.SH', 10.0)]
+            assert write_queue.stats()['failed'] == 1
+            with open(write_queue.path_failed) as r:
+                assert json.loads(r.readline())['args'] == ['a', '000001.SZ', 11.0]
+        finally:
+            write_queue.close()
+
+    def test_skippable_result_not_retried(self, temp_cache_dir):
+        """测试 all_held_inc 返回 False (今日已递增) 不算失败"""
+        target = RecordingTarget()
+        write_queue = WriteQueue({'file': target}, temp_cache_dir, retry_delay=0.01)
+        try:
+            write_queue.put('file', 'all_held_inc', 'a')
+            assert write_queue.flush(timeout=5) is True
+            assert target.calls == [('all_held_inc', 'a')]
+            assert write_queue.stats()['retried'] == 0
+        finally:
+            write_queue.close()
+
+    def test_recover_pending_writes(self, temp_cache_dir):
+        """测试重启后重新执行日志中未完成的操作, 丢弃写了一半的最后一行"""
+        with open(os.path.join(temp_cache_dir, WriteQueue.JOURNAL_NAME), 'w') as w:
+            w.write(json.dumps({'target': 'db', 'method': 'update_held_days', 'args': ['600000.SH', 'a', 7]}) + '\n')
+            w.write('{"target":"db","method":"upd')
+
+        target = RecordingTarget()
+        write_queue = WriteQueue({'db': target}, temp_cache_dir)
+        try:
+            assert write_queue.flush(timeout=5) is True
+            assert target.calls == [('update_held_days', '600000.SH', 'a', 7)]
+            assert write_queue.stats()['recovered'] == 1
+        finally:
+            write_queue.close()
+
+    def test_backpressure(self, temp_cache_dir):
+        """测试队列满时调用方阻塞等待, 所有写入按顺序完成"""
+        target = RecordingTarget(delay=0.02)
+        write_queue = WriteQueue({'db': target}, temp_cache_dir, maxsize=2, batch_size=1)
+        try:
+            for days in range(8):
+                write_queue.put('db', 'record_trade', days)
+            assert write_queue.close(timeout=5) is True
+
+            assert [call[1] for call in target.calls] == list(range(8))
+            stats = write_queue.stats()
+            assert stats['blocked'] > 0
+            assert stats['blocked_seconds'] > 0
+            assert stats['max_depth'] <= 2
+        finally:
+            write_queue.close()
+
+    def test_targets_run_independently(self, temp_cache_dir):
+        """测试一个目标重试时不挡住其他目标, flush(target=...) 只等待该目标"""
+        slow = RecordingTarget(fail_times=100)
+        fast = RecordingTarget()
+        write_queue = WriteQueue({'db': slow, 'file': fast}, temp_cache_dir, max_retries=3, retry_delay=0.5)
+        try:
+            write_queue.put('db', 'update_held_days', '600000.SH', 'a', 1)
+            write_queue.put('file', 'update_held_days', '600000.SH', 'a', 1)
+
+            start = time.time()
+            assert write_queue.flush(timeout=2, target='file') is True
+            assert time.time() - start < 1
+            assert fast.calls == [('update_held_days', '600000.SH', 'a', 1)]
+            assert write_queue.stats()['pending_by_target'] == {'db': 1, 'file': 0}
+        finally:
+            write_queue.close(timeout=5)
+
+    def test_concurrent_put(self, temp_cache_dir):
+        """测试多线程并发放入"""
+        target = RecordingTarget()
+        write_queue = WriteQueue({'db': target}, temp_cache_dir)
+        threads = [
+            threading.Thread(target=lambda i=i: [write_queue.put('db', 'record_trade', i, j) for j in range(50)])
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert write_queue.close(timeout=5) is True
+        assert len(target.calls) == 200
+        assert write_queue.stats()['enqueued'] == 200
@@ -0,0 +1,61 @@
+import time
+import numpy as np
+import pandas as pd
+
+from mytt import MyTT
+
+series_count = 5000     # 全市场股票数量
+series_length = 500     # 每只股票的日线长度
+old_sample = 100        # 旧实现太慢，只跑前 100 条再按比例折算
+window = 20
+
+
+# 旧版本的 rolling().apply 实现，作为对照
+def OLD_WMA(S, N):
+    return pd.Series(S).rolling(N).apply(lambda x: x[::-1].cumsum().sum() * 2 / N / (N + 1), raw=True).values
+
+
+def OLD_AVEDEV(S, N):
+    return pd.Series(S).rolling(N).apply(lambda x: (np.abs(x - x.mean())).mean()).values
+
+
+def OLD_SLOPE(S, N):
+    return pd.Series(S).rolling(N).apply(lambda x: np.polyfit(range(N), x, deg=1)[0], raw=True).values
+
+
+def OLD_FORCAST(S, N):
+    return pd.Series(S).rolling(N).apply(lambda x: np.polyval(np.polyfit(range(N), x, deg=1), N - 1), raw=True).values
+
+
+cases = [
+    ('WMA', OLD_WMA, MyTT.WMA),
+    ('AVEDEV', OLD_AVEDEV, MyTT.AVEDEV),
+    ('SLOPE', OLD_SLOPE, MyTT.SLOPE),
+    ('FORCAST', OLD_FORCAST, MyTT.FORCAST),
+]
+
+
+def make_series() -> list[np.ndarray]:
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.02, size=(series_count, series_length))
+    return list(20 * np.exp(np.cumsum(returns, axis=1)))
+
+
+def benchmark():
+    series = make_series()
+    for name, old_func, new_func in cases:
+        start = time.perf_counter()
+        old_results = [old_func(s, window) for s in series[:old_sample]]
+        old_cost = (time.perf_counter() - start) * series_count / old_sample
+
+        start = time.perf_counter()
+        new_results = [new_func(s, window) for s in series]
+        new_cost = time.perf_counter() - start
+
+        max_diff = max(np.nanmax(np.abs(a - b)) for a, b in zip(old_results, new_results))
+        print(f'{name:8s} old {old_cost:8.2f}s (estimated)  new {new_cost:6.3f}s  '
+              f'x{old_cost / new_cost:7.1f}  max diff {max_diff:.2e}')
+
+
+if __name__ == '__main__':
+    benchmark()
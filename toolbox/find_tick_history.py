@@ -1,44 +1,36 @@
-import json
 import datetime
 import pandas as pd
+
+from delegate.tick_journal import TickJournalReader
 from toolbox.draw_two_lines import draw_two
 
 stock_code = '301396.SZ'
+strategy_name = '进攻监控'
 root = './_cache/debug'
 today = datetime.datetime.now().date().strftime("%Y%m%d")
 
-source_path = f'{root}/tick_history.json'
+source_path = f'{root}/tick_journal/{strategy_name}'
 target_path = f'{root}/tick_{today}_{stock_code.split(".")[0]}.csv'
 visualization_path = f'{root}/tick_{today}_{stock_code.split(".")[0]}.html'
 
-headers = ['timestamp', 'price', 'volume', 'askPrice', 'askVol', 'bidPrice', 'bidVol']
-
 
 def locate_and_save():
-    with open(source_path, 'r') as file:
-        ticks = json.load(file)[stock_code]
+    # 只解压目标 code 的数据块，不需要加载全天全市场的 tick
+    with TickJournalReader(source_path, today) as reader:
+        ticks = reader.read(stock_code)
 
-    with open(target_path, 'w') as w:
-        w.write(',  \t'.join(headers))
-        w.write('\n')
-        for tick in ticks:
-            w.write(',   \t'.join([str(i) for i in tick]))
-            w.write('\n')
+    if ticks is None:
+        print(f'{stock_code} 在 {source_path}/{today} 中没有 tick 记录')
+        return
 
+    ticks.to_dataframe().to_csv(target_path, index=False)
 
-def visualization():
-    # with open(source_path, 'r') as file:
-    #     data = json.load(file)[stock_code]
-    #
-    # x_data = [str(row[0]) for row in data]
-    # y1_data = [row[1] for row in data]
-    # y2_data = [row[6] for row in data]
 
+def visualization():
     df = pd.read_csv(target_path)
-    df.columns = headers
-    x_data = list(df['timestamp'].astype(str).values)
+    x_data = list(df['time'].astype(str).values)
     y1_data = list(df['price'].astype(float).values)
-    y2_data = list(df['bidVol'].astype(float).values)
+    y2_data = list(df['bidVol1'].astype(float).values)
 
     print(x_data)
     print(y1_data)
@@ -6,11 +6,12 @@ import threading
 import datetime
 from typing import List, Dict, Set, Optional
 
-import numpy as np
 import pandas as pd
 import akshare as ak
 
 from tools.utils_basic import symbol_to_code
+from tools.utils_calendar import get_trading_calendar, date_int_to_str
+from tools.utils_state import attach_state_files, read_state_file, write_state_file
 
 trade_day_cache = {}
 trade_max_year_key = 'max_year'
@@ -175,7 +176,12 @@ def save_pickle(path: str, obj: object) -> None:
 
 
 # 读取json缓存，如果找不到文件则创建空json并返回
+# 挂载到 utils_state 的持仓状态文件直接读内存中的热副本
 def load_json(path: str) -> dict:
+    hot = read_state_file(path)
+    if hot is not None:
+        return hot
+
     if os.path.exists(path):
         with open(path, 'r') as r:
             ans = r.read()
@@ -187,7 +193,11 @@ def load_json(path: str) -> dict:
 
 
 # 存储json缓存，全覆盖写入
+# 挂载到 utils_state 的持仓状态文件只写内存，由后台线程合并后落盘
 def save_json(path: str, var: dict, ensure_ascii=True) -> None:
+    if write_state_file(path, var):
+        return
+
     with open(path, 'w') as w:
         w.write(json.dumps(var, ensure_ascii=ensure_ascii, indent=4))
 
@@ -253,7 +263,12 @@ def update_max_prices(
     path_min_prices: str,
     path_held_days: str,
     ignore_open_day: bool = True,  # 是否忽略开仓日，从次日开始计算最高价
+    write_behind: bool = False,    # 三个文件挂载为内存热副本，每个 tick 不再读写磁盘；由 runner 自行开启，
+                                   # 进程被强杀时会丢失最近 FLUSH_INTERVAL 秒的最高价，影响回撤止盈卖出
 ):
+    if write_behind:
+        attach_state_files(path_held_days, path_max_prices, path_min_prices)
+
     held_days = load_json(path_held_days)
 
     with lock:
@@ -356,27 +371,24 @@ def record_deal(
 
 # 获取磁盘缓存的交易日列表
 def get_disk_trade_day_list_and_update_max_year() -> list:
-    # 读磁盘，这里可以有内存缓存的速度优化
-    df = pd.read_csv(TRADE_DAY_CACHE_PATH)
-    trade_dates = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d').values
-    trade_day_cache[trade_max_year_key] = trade_dates[-1][:4]
-    return trade_dates
+    # 日历在进程内只加载一次，文件更新后自动重新加载
+    calendar = get_trading_calendar(TRADE_DAY_CACHE_PATH)
+    trade_day_cache[trade_max_year_key] = calendar.max_year()
+    return [date_int_to_str(d, basic_format=False) for d in calendar.dates]
 
 
 # 获取前n个交易日，返回格式 基本格式：%Y%m%d，扩展格式：%Y-%m-%d
 # 如果为非交易日，则取上一个交易日为前0天
 def get_prev_trading_date(now: datetime.datetime, count: int, basic_format: bool = True) -> str:
-    trading_day_list = get_disk_trade_day_list_and_update_max_year()
-    today = now.strftime('%Y-%m-%d')
-    try:
-        trading_index = list(trading_day_list).index(today)
-    except ValueError:
-        trading_index = np.searchsorted(trading_day_list, today) - 1
+    calendar = get_trading_calendar(TRADE_DAY_CACHE_PATH)
+    return date_int_to_str(calendar.prev(now, count), basic_format=basic_format)
 
-    if basic_format:
-        return trading_day_list[trading_index - count].replace('-', '')
-    else:
-        return trading_day_list[trading_index - count]
+
+# 获取后n个交易日，返回格式同上
+# 如果为非交易日，则取下一个交易日为后0天
+def get_next_trading_date(now: datetime.datetime, count: int, basic_format: bool = True) -> str:
+    calendar = get_trading_calendar(TRADE_DAY_CACHE_PATH)
+    return date_int_to_str(calendar.next(now, count), basic_format=basic_format)
 
 
 # 检查当日是否是交易日，使用sina数据源
@@ -392,10 +404,11 @@ def check_is_open_day_sina(curr_date: str) -> bool:
             return trade_day_cache[curr_date]
 
     # 文件缓存
-    if os.path.exists(TRADE_DAY_CACHE_PATH):  # 文件缓存存在
-        trade_day_list = get_disk_trade_day_list_and_update_max_year()
+    calendar = get_trading_calendar(TRADE_DAY_CACHE_PATH)
+    if calendar.available():  # 文件缓存存在
+        trade_day_cache[trade_max_year_key] = calendar.max_year()
         if curr_year <= trade_day_cache[trade_max_year_key]:  # 未过期
-            ans = curr_date in trade_day_list
+            ans = calendar.is_open(curr_date)
             trade_day_cache[curr_date] = ans
             print(f'[{curr_date} is {ans} trade day in memory]')
             return ans
@@ -405,9 +418,10 @@ def check_is_open_day_sina(curr_date: str) -> bool:
     df.to_csv(TRADE_DAY_CACHE_PATH)
     print(f'Cache trade day list {curr_year} - {int(curr_year) + 1} in {TRADE_DAY_CACHE_PATH}.')
 
-    trade_day_list = get_disk_trade_day_list_and_update_max_year()
+    calendar.reload()
+    trade_day_cache[trade_max_year_key] = calendar.max_year()
     if curr_year <= trade_day_cache[trade_max_year_key]:  # 未过期
-        ans = curr_date in trade_day_list
+        ans = calendar.is_open(curr_date)
         trade_day_cache[curr_date] = ans
         print(f'[{curr_date} is {ans} trade day in memory]')
         return ans
@@ -0,0 +1,145 @@
+"""
+进程内共享的交易日历
+
+交易日 CSV 只在第一次使用或文件被更新（mtime 变化）时读取一次，
+存成排好序的 int32 数组（YYYYMMDD），所有查询都是二分查找
+"""
+import os
+import datetime
+import threading
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_CALENDAR_PATH = './_cache/_open_day_list_sina.csv'
+
+DateLike = Union[int, str, datetime.date, datetime.datetime, np.integer]
+
+
+def to_date_int(date: DateLike) -> int:
+    """ 20240101 / '20240101' / '2024-01-01' / date / datetime -> 20240101 """
+    if isinstance(date, (int, np.integer)):
+        return int(date)
+    if isinstance(date, (datetime.date, datetime.datetime)):
+        return date.year * 10000 + date.month * 100 + date.day
+    return int(str(date)[:10].replace('-', ''))
+
+
+def date_int_to_str(date: int, basic_format: bool = True) -> str:
+    """ 基本格式：%Y%m%d，扩展格式：%Y-%m-%d """
+    date = int(date)
+    if basic_format:
+        return f'{date:08d}'
+    return f'{date // 10000:04d}-{date // 100 % 100:02d}-{date % 100:02d}'
+
+
+class TradingCalendar:
+    def __init__(self, path: str = DEFAULT_CALENDAR_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._dates = np.empty(0, dtype=np.int32)
+
+    # ==============
+    #  加载
+    # ==============
+
+    def _refresh(self) -> np.ndarray:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return self._dates
+
+        if mtime != self._mtime:
+            with self.lock:
+                if mtime != self._mtime:
+                    df = pd.read_csv(self.path)
+                    dates = pd.to_datetime(df['trade_date']).dt.strftime('%Y%m%d').astype(np.int32).values
+                    self._dates = np.unique(dates)  # 排序并去重
+                    self._mtime = mtime
+        return self._dates
+
+    def reload(self) -> None:
+        with self.lock:
+            self._mtime = None
+        self._refresh()
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._refresh()
+
+    def available(self) -> bool:
+        return len(self.dates) > 0
+
+    def max_year(self) -> str:
+        dates = self.dates
+        return str(int(dates[-1]) // 10000) if len(dates) > 0 else ''
+
+    # ==============
+    #  查询
+    # ==============
+
+    def is_open(self, date: DateLike) -> bool:
+        dates = self.dates
+        d = to_date_int(date)
+        i = np.searchsorted(dates, d)
+        return bool(i < len(dates) and dates[i] == d)
+
+    def _anchor_prev(self, dates: np.ndarray, d: int) -> int:
+        # 当天是交易日取当天，否则取之前最近的交易日
+        return int(np.searchsorted(dates, d, side='right')) - 1
+
+    def _anchor_next(self, dates: np.ndarray, d: int) -> int:
+        # 当天是交易日取当天，否则取之后最近的交易日
+        return int(np.searchsorted(dates, d, side='left'))
+
+    def prev(self, date: DateLike, n: int = 1) -> int:
+        """ 前 n 个交易日；如果 date 为非交易日，则之前最近的交易日为前 0 天 """
+        dates = self.dates
+        i = self._anchor_prev(dates, to_date_int(date)) - n
+        if i < 0 or i >= len(dates):
+            raise IndexError(f'{date} - {n} trading days is out of calendar range')
+        return int(dates[i])
+
+    def next(self, date: DateLike, n: int = 1) -> int:
+        """ 后 n 个交易日；如果 date 为非交易日，则之后最近的交易日为后 0 天 """
+        dates = self.dates
+        i = self._anchor_next(dates, to_date_int(date)) + n
+        if i < 0 or i >= len(dates):
+            raise IndexError(f'{date} + {n} trading days is out of calendar range')
+        return int(dates[i])
+
+    def count_between(self, start: DateLike, end: DateLike) -> int:
+        """ [start, end] 之间的交易日数（含首尾） """
+        dates = self.dates
+        lo = np.searchsorted(dates, to_date_int(start), side='left')
+        hi = np.searchsorted(dates, to_date_int(end), side='right')
+        return max(0, int(hi - lo))
+
+    def offset_from_today(self, date: DateLike, today: DateLike = None) -> int:
+        """ date 之后到今天的交易日数（不含 date，非交易日按之前最近的交易日计） """
+        dates = self.dates
+        today = datetime.date.today() if today is None else today
+        return max(0, self._anchor_prev(dates, to_date_int(today)) - self._anchor_prev(dates, to_date_int(date)))
+
+    def between(self, start: DateLike, end: DateLike) -> np.ndarray:
+        """ [start, end] 之间的交易日数组 """
+        dates = self.dates
+        lo = np.searchsorted(dates, to_date_int(start), side='left')
+        hi = np.searchsorted(dates, to_date_int(end), side='right')
+        return dates[lo:hi]
+
+
+_calendars: dict[str, TradingCalendar] = {}
+_calendars_lock = threading.Lock()
+
+
+def get_trading_calendar(path: str = DEFAULT_CALENDAR_PATH) -> TradingCalendar:
+    """ 同一个文件在进程内只有一个日历对象 """
+    key = os.path.abspath(path)
+    with _calendars_lock:
+        if key not in _calendars:
+            _calendars[key] = TradingCalendar(path)
+        return _calendars[key]
@@ -0,0 +1,203 @@
+"""
+并发下载引擎
+
+按数据源限速（令牌桶）的线程池下载，失败按指数退避重试，
+可选的进度日志支持中断后续传，结束后输出各数据源的吞吐统计
+"""
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from tools.utils_remote import DataSource
+
+
+# 各数据源的默认并发与限速：(线程数, 每秒请求数, 突发容量)
+DOWNLOAD_SOURCE_LIMITS: Dict[str, tuple[int, float, int]] = {
+    DataSource.MOOTDX: (4, 8.0, 8),     # 通达信行情服务器，每个线程一个独立连接
+    DataSource.AKSHARE: (2, 2.0, 2),    # 东财接口容易封 IP，保持和原来接近的频率
+    DataSource.TUSHARE: (4, 8.0, 8),    # 免费账户每分钟 500 次
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate                # 每秒补充的令牌数
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_source_buckets: Dict[str, TokenBucket] = {}
+_source_buckets_lock = threading.Lock()
+
+
+def get_source_bucket(data_source: str) -> TokenBucket:
+    """ 同一个数据源在进程内共用一个令牌桶，多个下载任务同时跑也不会超频 """
+    with _source_buckets_lock:
+        if data_source not in _source_buckets:
+            _, rate, capacity = DOWNLOAD_SOURCE_LIMITS.get(data_source, (1, 2.0, 1))
+            _source_buckets[data_source] = TokenBucket(rate, capacity)
+        return _source_buckets[data_source]
+
+
+class DownloadJournal:
+    """ 记录已完成的 code，首行为任务标识，标识不一致视为新任务 """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+        self.done: set[str] = set()
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                lines = [line.strip() for line in f.readlines()]
+            if len(lines) > 0 and lines[0] == f'# {key}':
+                self.done = set(line for line in lines[1:] if line)
+
+        if len(self.done) == 0:
+            with open(path, 'w') as f:
+                f.write(f'# {key}\n')
+
+    def mark(self, code: str) -> None:
+        with self.lock:
+            self.done.add(code)
+            with open(self.path, 'a') as f:
+                f.write(f'{code}\n')
+
+    def finish(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class DownloadReport:
+    def __init__(self, data_source: str, total: int):
+        self.data_source = data_source
+        self.total = total
+        self.skipped = 0        # 进度日志中已完成直接跳过的
+        self.succeed = 0
+        self.failed: list[str] = []
+        self.retries = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        done = self.succeed + len(self.failed)
+        return done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f'[{self.data_source}] {self.succeed}/{self.total} succeed, ' \
+               f'{len(self.failed)} failed, {self.skipped} resumed, {self.retries} retries, ' \
+               f'{self.elapsed:.1f}s, {self.throughput:.2f} codes/s'
+
+
+class DownloadEngine:
+    def __init__(
+        self,
+        data_source: str,
+        workers: int = None,        # 默认取 DOWNLOAD_SOURCE_LIMITS
+        retries: int = 2,           # 失败后的重试次数
+        backoff: float = 1.0,       # 首次重试等待秒数，之后翻倍
+    ):
+        self.data_source = data_source
+        self.workers = workers if workers is not None else DOWNLOAD_SOURCE_LIMITS.get(data_source, (1,))[0]
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = get_source_bucket(data_source)
+
+    def _fetch_with_retry(
+        self,
+        code: str,
+        fetch: Callable[[str], Optional[pd.DataFrame]],
+    ) -> tuple[Optional[pd.DataFrame], int]:
+        tries = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                df = fetch(code)
+            except Exception as e:
+                print(f' download {code} error: ', e)
+                df = None
+
+            if df is not None and len(df) > 0:
+                return df, tries
+            if tries >= self.retries:
+                return None, tries
+            tries += 1
+            time.sleep(self.backoff * (2 ** (tries - 1)) * (1 + random.random() * 0.2))
+
+    def run(
+        self,
+        codes: list[str],
+        fetch: Callable[[str], Optional[pd.DataFrame]],
+        on_success: Callable[[str, pd.DataFrame], None] = None,     # 在调用线程里执行，可以安全写字典或文件
+        journal_path: str = None,   # 需要断点续传时传入
+        journal_key: str = '',      # 任务标识，比如起止日期
+        progress_step: int = 100,
+    ) -> DownloadReport:
+        report = DownloadReport(self.data_source, len(codes))
+        journal = DownloadJournal(journal_path, journal_key) if journal_path is not None else None
+
+        if journal is not None:
+            pending = [code for code in codes if code not in journal.done]
+            report.skipped = len(codes) - len(pending)
+        else:
+            pending = list(codes)
+
+        finished = report.skipped
+        executor = ThreadPoolExecutor(max_workers=max(1, self.workers))
+        try:
+            futures = {executor.submit(self._fetch_with_retry, code, fetch): code for code in pending}
+            for future in as_completed(futures):
+                code = futures[future]
+                df, tries = future.result()
+                report.retries += tries
+
+                if df is None:
+                    report.failed.append(code)
+                else:
+                    try:
+                        if on_success is not None:
+                            on_success(code, df)
+                        report.succeed += 1
+                        if journal is not None:
+                            journal.mark(code)
+                    except Exception as e:
+                        print(f' handle {code} error: ', e)
+                        report.failed.append(code)
+
+                finished += 1
+                if progress_step > 0 and finished % progress_step == 0:
+                    elapsed = time.monotonic() - report.started
+                    print(f'[{report.succeed + report.skipped}/{finished}/{report.total}] '
+                          f'{(finished - report.skipped) / max(elapsed, 1e-6):.2f} codes/s')
+        finally:
+            # 中断时取消还没开始的任务，已完成的 code 都在进度日志里
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        report.elapsed = time.monotonic() - report.started
+        if journal is not None and len(report.failed) == 0:
+            journal.finish()
+        print(report)
+        return report
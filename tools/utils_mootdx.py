@@ -1,24 +1,29 @@
 import pandas as pd
 import datetime
+import threading
 
 from credentials import TDX_FOLDER
+from tools.utils_calendar import get_trading_calendar, to_date_int
 
 
 class MootdxClientInstance:
     _instance = None
-    client = None
+    _local = threading.local()  # mootdx 的 client 是单个 TCP 连接，每个线程各用一个
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(MootdxClientInstance, cls).__new__(cls)
-            cls.client = None  # Initialize data as None initially
         return cls._instance
 
-    def __init__(self):
-        if self.client is None:
+    @property
+    def client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
             from mootdx.quotes import Quotes
-            self.client = Quotes.factory(market='std', tdxdir=TDX_FOLDER)
+            client = Quotes.factory(market='std', tdxdir=TDX_FOLDER)
             pd.set_option('future.no_silent_downcasting', True)
+            self._local.client = client
+        return client
 
 
 def get_offset_start(csv_path: str, start_date_str: str, end_date_str: str) -> tuple[int, int]:
@@ -33,67 +38,31 @@ def get_offset_start(csv_path: str, start_date_str: str, end_date_str: str) -> t
     返回：
     tuple - (start到end的交易日数, end到今天的交易日数)
     """
-    # 1. 读取并预处理交易日数据（确保排序、去重）
-    df = pd.read_csv(csv_path)
-    df["trade_date"] = pd.to_datetime(df["trade_date"]).dt.date  # 仅保留日期部分（避免时间干扰）
-    trade_dates = df["trade_date"].drop_duplicates().sort_values().reset_index(drop=True)
-    if trade_dates.empty:
+    # 1. 交易日历在进程内只加载一次（已排序、去重）
+    calendar = get_trading_calendar(csv_path)
+    trade_dates = calendar.dates
+    if len(trade_dates) == 0:
         return 0, 0  # 无交易日数据时返回0
 
-    # 2. 工具函数：调整日期为目标方向的最近交易日
-    def adjust_date(target_date, direction):
-        """
-        direction: 'next'（start专用：取>=target的最近交易日）
-                  'prev'（end/今天专用：取<=target的最近交易日）
-        """
-        # 超出交易日范围时返回无效标记
-        if target_date < trade_dates.min():
-            return trade_dates.min() if direction == 'next' else None
-        if target_date > trade_dates.max():
-            return None if direction == 'next' else trade_dates.max()
-
-        # 二分查找快速定位索引
-        if direction == 'next':
-            idx = trade_dates.searchsorted(target_date, side="left")
-            return trade_dates.iloc[idx]
-        else:
-            idx = trade_dates.searchsorted(target_date, side="right") - 1
-            return trade_dates.iloc[idx] if idx >= 0 else None
-
-    # 3. 解析输入日期（转为date类型，与trade_dates格式统一）
+    # 2. 解析输入日期
     now = datetime.datetime.now()
-    curr_date = now.date()  # 今天的日期（仅日期部分）
+    today = to_date_int(now)
     try:
-        today_str = curr_date.strftime("%Y%m%d")
-        start_date = datetime.datetime.strptime(start_date_str, "%Y%m%d").date()
-        end_date = datetime.datetime.strptime(min(end_date_str, today_str), "%Y%m%d").date()
+        start_date = to_date_int(datetime.datetime.strptime(start_date_str, "%Y%m%d"))
+        end_date = to_date_int(datetime.datetime.strptime(min(end_date_str, str(today)), "%Y%m%d"))
     except ValueError:
         return 0, 0  # 日期格式错误返回0
 
-    # ---------------------- 4. 计算：start到end的交易日数（含首尾） ----------------------
-    adjusted_start = adjust_date(start_date, direction="next")  # start非交易日则取后一个
-    adjusted_end = adjust_date(end_date, direction="prev")      # end非交易日则取前一个
-
-    days_between = 0
-    if adjusted_start is not None and adjusted_end is not None and adjusted_start <= adjusted_end:
-        # 索引差 +1 = 含首尾的总天数（如16日索引0、17日1、18日2：2-0+1=3）
-        idx_start = trade_dates[trade_dates == adjusted_start].index[0]
-        idx_end = trade_dates[trade_dates == adjusted_end].index[0]
-        days_between = idx_end - idx_start + 1
-
-    # ---------------------- 5. 计算：end到今天的交易日数（不含end） ----------------------
-
-    adjusted_today = adjust_date(curr_date, direction="prev")  # 今天非交易日则取前一个
+    # 3. start到end的交易日数（含首尾），非交易日按区间内的交易日计
+    days_between = calendar.count_between(start_date, end_date)
 
+    # 4. end到今天的交易日数（不含end），end 早于日历范围时无效
     days_from_end_to_today = 0
-    if adjusted_end is not None and adjusted_today is not None and adjusted_end < adjusted_today:
-        # 索引差 = 不含end的天数（如18日索引2、19日3：3-2=1）
-        idx_adjusted_end = trade_dates[trade_dates == adjusted_end].index[0]
-        idx_today = trade_dates[trade_dates == adjusted_today].index[0]
-        days_from_end_to_today = idx_today - idx_adjusted_end
+    if end_date >= trade_dates[0]:
+        days_from_end_to_today = calendar.offset_from_today(end_date, today)
 
     # 早上有当日的daily的K线之前要少向前推一天
-    if trade_dates.isin([curr_date]).any() and now.time() < datetime.time(9, 30):
+    if calendar.is_open(today) and now.time() < datetime.time(9, 30):
         if days_from_end_to_today > 0:
             days_between += 1
             days_from_end_to_today -= 1
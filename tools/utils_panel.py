@@ -0,0 +1,50 @@
+"""
+把 { code: DataFrame } 的日线缓存拼成 (时间 x 股票) 的二维面板，给 MyTT 的面板模式按列一次性计算
+
+每只股票的最后一行对齐到面板的最后一行，历史较短的股票前面补 nan
+注意补的 nan 并不总是和直接计算较短序列一致：比较运算在 nan 上得到 False 而不是 nan，
+之后的 COUNT / SUM 等窗口会把它当作 0 算出结果，而较短序列在同一位置是 nan。
+历史短于公式所需K线数的股票应按单只股票计算（见 StockPool.filter_white_list_by_panel）
+"""
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+PANEL_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'amount']
+
+
+def build_history_panel(
+    cache_history: Dict[str, pd.DataFrame],
+    codes: Iterable[str],
+    columns: Optional[list[str]] = None,
+    days: Optional[int] = None,     # 只取最近 days 行，默认取最长的历史
+) -> tuple[list[str], Dict[str, np.ndarray]]:
+    """ 返回 (面板中的 codes, { column: ndarray[days, len(codes)] })，没有缓存的 code 不在面板里 """
+    columns = PANEL_COLUMNS if columns is None else columns
+    frames = [(code, cache_history[code]) for code in codes if code in cache_history]
+    frames = [(code, df) for code, df in frames if df is not None and len(df) > 0]
+
+    codes = [code for code, _ in frames]
+    if days is None:
+        days = max((len(df) for _, df in frames), default=0)
+
+    panel = {}
+    for column in columns:
+        arr = np.full((days, len(frames)), np.nan)
+        for j, (_, df) in enumerate(frames):
+            if column not in df.columns:
+                continue
+            values = df[column].values[-days:] if days > 0 else df[column].values[:0]
+            arr[days - len(values):, j] = values
+        panel[column] = arr
+    return codes, panel
+
+
+def get_panel_lengths(panel: Dict[str, np.ndarray], column: str = 'close') -> np.ndarray:
+    """ 每只股票在面板中的有效行数（不含前面补的 nan） """
+    arr = panel[column]
+    valid = ~np.isnan(arr)
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), len(arr))
+    return len(arr) - first
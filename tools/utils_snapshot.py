@@ -0,0 +1,79 @@
+"""
+盘后指标快照：收盘后用包含当天的日线，为下一个交易日预先算好每只股票盘中要用的指标状态
+（已播种的流式指标，以及开仓日最低价、成交量等要按持仓天数回看的日线列），按 code 存成一个 pickle 文件，
+盘中卖出策略通过 execute_sell 的 extra 直接读取，不再在每个 tick 里从原始日线取值
+
+快照内容：{ code: { 'close' / 'high' / 'low' / 'volume': ndarray, 流式指标名: 已播种的流式指标 } }
+"""
+import datetime
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from tools.utils_cache import load_pickle, save_pickle
+
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_COLUMNS = ['close', 'high', 'low', 'volume']
+
+
+def _snapshot_matches(entry: Dict[str, any], history: pd.DataFrame) -> bool:
+    # 盘前重新下载的日线与快照不一致（如隔夜除权后前复权价格整体变化）时需要重算
+    return 'close' in entry and np.array_equal(entry['close'], history['close'].values)
+
+
+def build_indicator_snapshot(
+    cache_history: Dict[str, pd.DataFrame],
+    factories: Dict[str, Callable[[pd.DataFrame], any]],    # { 指标名: history -> 已播种的流式指标 }
+    codes: Optional[Iterable[str]] = None,
+    snapshot: Optional[Dict[str, Dict]] = None,             # 已有的快照，与日线一致的条目直接复用
+) -> Dict[str, Dict[str, any]]:
+    codes = list(cache_history.keys()) if codes is None else codes
+    snapshot = {} if snapshot is None else snapshot
+
+    for code in codes:
+        history = cache_history.get(code)
+        if history is None or len(history) == 0:
+            continue
+
+        entry = snapshot.get(code)
+        if entry is None or not _snapshot_matches(entry, history):
+            entry = {}
+        try:
+            entry = dict(entry)
+            for column in SNAPSHOT_COLUMNS:
+                if column not in entry and column in history.columns:
+                    entry[column] = history[column].to_numpy(copy=True)
+            for name, factory in factories.items():
+                if name not in entry:
+                    entry[name] = factory(history)
+            snapshot[code] = entry
+        except Exception as e:
+            print(f'Snapshot {code} failed: ', e)
+    return snapshot
+
+
+def save_indicator_snapshot(path: str, snapshot: Dict[str, Dict], trade_date: str) -> None:
+    """ trade_date 是快照要用于的交易日 %Y-%m-%d，即盘后计算时的下一个交易日 """
+    save_pickle(path, {
+        'version': SNAPSHOT_VERSION,
+        'date': trade_date,
+        'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'codes': snapshot,
+    })
+
+
+def load_indicator_snapshot(path: str, trade_date: Optional[str] = None) -> Optional[Dict[str, Dict]]:
+    """ 没有快照、版本不符或不是 trade_date 的快照时返回 None """
+    try:
+        data = load_pickle(path)
+    except Exception as e:
+        print(f'Load snapshot {path} failed: ', e)
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        return None
+    if trade_date is not None and data.get('date') != trade_date:
+        return None
+    return data['codes']
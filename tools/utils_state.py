@@ -0,0 +1,190 @@
+"""
+持仓状态 json 文件（持仓天数、建仓后最高价 / 最低价）的内存热副本
+
+盘中每次扫描卖点都要读写这几个文件，挂载后 utils_cache.load_json / save_json 对它们只读写内存，
+内存中的副本是唯一的权威数据；后台线程每隔 flush_interval 秒把有改动的文件合并写一次，
+先写临时文件再原子替换，进程退出或策略停止时再写一次
+进程被强杀（QMT 崩溃、直接关闭控制台）时会丢失最近 flush_interval 秒内的改动，因此默认不挂载，
+由 runner 调用 update_max_prices(write_behind=True) 或 FileStore(write_behind=True) 显式开启
+
+FileStore(wal=True) 时这几个文件改为挂载到 storage.state_log.StateLog 的表上：
+utils_cache 的读写直接读写 StateLog（写入按差异追加日志），json 文件只是 StateLog 压缩时导出的视图
+"""
+import os
+import json
+import atexit
+import threading
+from typing import Dict, Optional, Set
+
+
+FLUSH_INTERVAL = 5.0    # 两次落盘的最短间隔，单位（秒）
+
+
+class StateFiles:
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.tables: Dict[str, dict] = {}   # { 绝对路径: 内存中的 json }
+        self.dirty: Set[str] = set()        # 改动后还没落盘的文件
+        self.logs: Dict[str, tuple] = {}    # { 绝对路径: (StateLog, 表名) }，由 StateLog 持久化
+        self.flush_count = 0                # 实际写盘的次数
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # 快照与写盘一起串行，后写入磁盘的一定是较新的版本
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ==============
+    #  挂载
+    # ==============
+
+    def attach(self, path: str) -> None:
+        key = os.path.abspath(path)
+        with self._lock:
+            if key in self.tables:
+                return
+            if os.path.exists(key):
+                with open(key, 'r') as r:
+                    self.tables[key] = json.loads(r.read())
+            else:
+                self.tables[key] = {}
+                self.dirty.add(key)
+        self.start()
+
+    def attach_log(self, path: str, state_log, name: str) -> None:
+        """ 读写 path 改为读写 state_log 的 name 表，已有的内存热副本先落盘再替换 """
+        key = os.path.abspath(path)
+        if key in self.tables:
+            self.detach(path)
+        with self._lock:
+            self.logs[key] = (state_log, name)
+
+    def detach(self, path: str) -> None:
+        key = os.path.abspath(path)
+        self.flush()
+        with self._lock:
+            self.tables.pop(key, None)
+            self.dirty.discard(key)
+            self.logs.pop(key, None)
+
+    def attached(self, path: str) -> bool:
+        key = os.path.abspath(path)
+        return key in self.tables or key in self.logs
+
+    # ==============
+    #  读写内存
+    # ==============
+
+    def read(self, path: str) -> Optional[dict]:
+        """ 没挂载返回 None；挂载的文件都是一层的 { code: 数值 }，浅拷贝即可 """
+        key = os.path.abspath(path)
+        with self._lock:
+            log = self.logs.get(key)
+            if log is not None:
+                return log[0].items(log[1])
+            table = self.tables.get(key)
+            return None if table is None else dict(table)
+
+    def write(self, path: str, data: dict) -> bool:
+        """ 没挂载返回 False """
+        key = os.path.abspath(path)
+        with self._lock:
+            log = self.logs.get(key)
+            if log is not None:
+                state_log, name = log
+                table = state_log.items(name)
+                sets = {k: v for k, v in data.items() if k not in table or table[k] != v}
+                deletes = [k for k in table if k not in data]
+                state_log.update(name, sets, deletes)
+                return True
+            if key not in self.tables:
+                return False
+            if self.tables[key] != data:
+                self.tables[key] = dict(data)
+                self.dirty.add(key)
+            return True
+
+    # ==============
+    #  落盘
+    # ==============
+
+    def flush(self) -> int:
+        """ 把有改动的文件写入磁盘，返回写入的文件数 """
+        with self._flush_lock:
+            with self._lock:
+                pending = {key: json.dumps(self.tables[key], indent=4) for key in self.dirty}
+                self.dirty.clear()
+
+            for key, text in pending.items():
+                temp_path = key + '.tmp'
+                try:
+                    with open(temp_path, 'w') as w:
+                        w.write(text)
+                    os.replace(temp_path, key)
+                    self.flush_count += 1
+                except Exception as e:
+                    print(f'Flush {key} failed: ', e)
+                    with self._lock:
+                        self.dirty.add(key)  # 下次再写
+            return len(pending)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='state-flush', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+
+_state_files: Dict[str, StateFiles] = {}
+_state_files_lock = threading.Lock()
+
+
+def get_state_files() -> StateFiles:
+    """ 进程内只有一份热副本，不同模块用同一个路径读写到的是同一份数据 """
+    with _state_files_lock:
+        if 'default' not in _state_files:
+            _state_files['default'] = StateFiles()
+        return _state_files['default']
+
+
+def attach_state_files(*paths: str) -> None:
+    state_files = get_state_files()
+    for path in paths:
+        if not state_files.attached(path):
+            state_files.attach(path)
+
+
+def attach_state_log(state_log) -> None:
+    """ 把 StateLog 导出的每个 json 文件挂载到对应的表上 """
+    state_files = get_state_files()
+    for name, path in state_log.exports.items():
+        state_files.attach_log(path, state_log, name)
+
+
+def read_state_file(path: str) -> Optional[dict]:
+    state_files = _state_files.get('default')
+    return None if state_files is None else state_files.read(path)
+
+
+def write_state_file(path: str, data: dict) -> bool:
+    state_files = _state_files.get('default')
+    return False if state_files is None else state_files.write(path, data)
+
+
+def flush_state_files() -> None:
+    state_files = _state_files.get('default')
+    if state_files is not None:
+        state_files.flush()
+
+
+atexit.register(flush_state_files)
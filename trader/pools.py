@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
-from typing import Set, Callable
+from typing import Set, Callable, Optional
 
 from tools.utils_basic import symbol_to_code
+from tools.utils_panel import build_history_panel, get_panel_lengths
 from tools.utils_cache import get_prefixes_stock_codes, get_index_constituent_codes
 from tools.utils_remote import get_wencai_codes, get_tdx_zxg_code
 
@@ -44,7 +46,16 @@ class StockPool:
         self.cache_whitelist.clear()
 
     # 删除不符合模式和没有缓存的票池
-    def filter_white_list_by_selector(self, filter_func: Callable, cache_history: dict[str, pd.DataFrame]):
+    # lookback: 选股公式最后一天结果需要的K线数（如 selector.LOOKBACK），只截取历史尾部用 tail_func（如 selector.select_tail，
+    # 默认 filter_func）计算，前 guard_count 支同时做全量计算对比，有不一致则打印提示并改回全量计算
+    def filter_white_list_by_selector(
+        self,
+        filter_func: Callable,
+        cache_history: dict[str, pd.DataFrame],
+        lookback: Optional[int] = None,
+        tail_func: Optional[Callable] = None,
+        guard_count: int = 20,
+    ):
         remove_list = []
         print('filtering...', end='')
 
@@ -55,7 +66,17 @@ class StockPool:
                 print(f'{i}.', end='')
             if code in cache_history:
                 try:
-                    df = filter_func(cache_history[code], code, None)  # 预筛公式默认不需要使用quote所以传None
+                    history = cache_history[code]
+                    if lookback is not None and len(history) > lookback:
+                        df = (tail_func or filter_func)(history.tail(lookback).copy(), code, None)
+                        if i <= guard_count:
+                            full_df = filter_func(history, code, None)
+                            if bool(full_df['PASS'].values[-1]) != bool(df['PASS'].values[-1]):
+                                print(f'\n{code} tail {lookback} bars differs from full history, fallback to full')
+                                lookback = None
+                                df = full_df
+                    else:
+                        df = filter_func(history, code, None)  # 预筛公式默认不需要使用quote所以传None
                     if (len(df) > 0) and (not df['PASS'].values[-1]):
                         remove_list.append(code)
                 except Exception as e:
@@ -72,6 +93,62 @@ class StockPool:
         if self.ding_messager is not None:
             self.ding_messager.send_text_as_md(f'[{self.account_id}]{self.strategy_name}:筛除{len(remove_list)}支\n')
 
+    # 同上，但整个白名单拼成 (时间 x 股票) 面板后只调用一次 panel_func(panel, codes) -> 每只股票最后一天是否通过
+    # 面板中历史短于 lookback（默认面板行数）的 code 前面补了 nan，比较运算后的 COUNT 等结果和单独计算不同，
+    # 这些 code 改用 fallback_func 逐个计算；没有缓存的 code 剔除，缓存为空的 code 保留，与 filter_white_list_by_selector 一致
+    def filter_white_list_by_panel(
+        self,
+        panel_func: Callable,
+        cache_history: dict[str, pd.DataFrame],
+        columns: Optional[list[str]] = None,
+        days: Optional[int] = None,
+        fallback_func: Optional[Callable] = None,   # 面板计算出错时退回逐个 code 筛选，也用于历史较短的 code
+        lookback: Optional[int] = None,
+    ):
+        print('filtering by panel...', end='')
+        codes, panel = build_history_panel(cache_history, self.cache_whitelist, columns, days)
+
+        try:
+            passed = np.asarray(panel_func(panel, codes), dtype=bool)
+            if len(passed) != len(codes):
+                raise ValueError(f'panel result length {len(passed)} != {len(codes)}')
+        except Exception as e:
+            print('Panel filtering failed: ', e)
+            if fallback_func is not None:
+                self.filter_white_list_by_selector(fallback_func, cache_history)
+                return
+            passed = np.zeros(len(codes), dtype=bool)
+
+        if len(codes) > 0 and fallback_func is not None:
+            rows = len(next(iter(panel.values())))
+            lengths = get_panel_lengths(panel, next(iter(panel)))
+            limit = rows if lookback is None else lookback
+            for j in np.flatnonzero(lengths < limit):
+                code = codes[j]
+                try:
+                    df = fallback_func(cache_history[code], code, None)
+                    passed[j] = len(df) == 0 or bool(df['PASS'].values[-1])
+                except Exception as e:
+                    print(f'Drop {code} when filtering: ', e)
+                    passed[j] = False
+
+        # 缓存为空的 code 不在面板里，和逐个筛选一样保留
+        empty_codes = [
+            code for code in self.cache_whitelist
+            if code in cache_history and cache_history[code] is not None and len(cache_history[code]) == 0
+        ]
+
+        keep = set(code for code, ok in zip(codes, passed) if ok)
+        keep.update(empty_codes)
+        remove_list = [code for code in self.cache_whitelist if code not in keep]
+        for code in remove_list:
+            self.cache_whitelist.discard(code)
+
+        print(f'{len(remove_list)} codes filter out.')
+
+        if self.ding_messager is not None:
+            self.ding_messager.send_text_as_md(f'[{self.account_id}]{self.strategy_name}:筛除{len(remove_list)}支\n')
+
 
 # -----------------------
 # Black Empty
@@ -1,12 +1,15 @@
 import math
 import datetime
 import logging
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 
 from xtquant.xttype import XtPosition
 
 from delegate.base_delegate import BaseDelegate
+from delegate.tick_history import TickBuffer
+from mytt.MyTT_stream import StreamCache
 from tools.utils_basic import get_limit_down_price
 from storage.base_store import BaseDataStore
 
@@ -17,6 +20,7 @@ class BaseSeller:
         self.delegate = delegate
         self.data_store = data_store  # 数据存储实例 (可选)
         self.order_premium = parameters.order_premium if hasattr(parameters, 'order_premium') else 0.03
+        self.indicator_snapshot: Dict[str, Dict[str, any]] = {}  # 盘后算好的指标快照，execute_sell 时作为 extra 传入
 
     def order_sell(self, code, quote, volume, remark, log=True) -> None:
         if volume > 0:
@@ -62,14 +66,14 @@ class BaseSeller:
         held_days: Dict[str, int],
         max_prices: Dict[str, float],
         cache_history: Dict[str, pd.DataFrame],
-        today_ticks: Dict[str, list] = None,
+        today_ticks: Dict[str, TickBuffer] = None,
         extra_datas: Dict[str, any] = None,
     ) -> None:
         if today_ticks is None:
             today_ticks = {}
 
         if extra_datas is None:
-            extra_datas = {}
+            extra_datas = self.indicator_snapshot
 
         for position in positions:
             code = position.stock_code
@@ -95,10 +99,34 @@ class BaseSeller:
     def check_sell(
         self, code: str, quote: Dict, curr_date: str, curr_time: str,
         position: XtPosition, held_day: int, max_price: Optional[float],
-        history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+        history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         return False  # False 表示没有卖过，不阻挡其他Seller卖出
 
+    def snapshot_factories(self) -> Dict[str, Callable[[pd.DataFrame], any]]:
+        # 盘后快照里要预先播种的流式指标，以 StreamCache 的属性名作为快照里的指标名
+        return {name: streams.factory for name, streams in vars(self).items() if isinstance(streams, StreamCache)}
+
+    def load_snapshot(self, snapshot: Dict[str, Dict[str, any]]) -> None:
+        self.indicator_snapshot = snapshot
+
+    def get_stream(self, name: str, code: str, history: Optional[pd.DataFrame], extra: any) -> any:
+        # 优先用快照里已播种的流式指标，没有快照时用日线缓存播种
+        if isinstance(extra, dict) and name in extra:
+            return extra[name]
+        if history is not None:
+            return getattr(self, name).get(code, history)
+        return None
+
+    @staticmethod
+    def get_daily(column: str, history: Optional[pd.DataFrame], extra: any) -> Optional[np.ndarray]:
+        # 优先用快照里的日线列，没有快照时用日线缓存
+        if isinstance(extra, dict) and column in extra:
+            return extra[column]
+        if history is not None:
+            return history[column].values
+        return None
+
 
 class LimitedSeller(BaseSeller):
     def __init__(self, strategy_name: str, delegate: BaseDelegate, parameters, data_store: Optional[BaseDataStore] = None):
@@ -2,12 +2,13 @@ import logging
 
 from mytt.MyTT_advance import *
 # from mytt.MyTT_custom import *
+from mytt.MyTT_stream import StreamCache, StreamMA, StreamCCI, StreamWR, StreamMACD
 from typing import Dict, Optional
 
 from xtquant.xttype import XtPosition
 from tools.utils_basic import get_limit_up_price
-from tools.utils_remote import concat_ak_quote_dict
 from trader.seller import BaseSeller
+from delegate.tick_history import TickBuffer
 from storage.base_store import BaseDataStore
 
 
@@ -26,7 +27,7 @@ class HardSeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         if (held_day > 0) and (self.hard_time_range[0] <= curr_time < self.hard_time_range[1]):
             curr_price = quote['lastPrice']
@@ -57,7 +58,7 @@ class SwitchSeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         if (held_day >= self.switch_hold_days) and (self.switch_time_range[0] <= curr_time < self.switch_time_range[1]):
             curr_price = quote['lastPrice']
@@ -84,7 +85,7 @@ class FallSeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         if max_price is not None:
             if (held_day > 0) and (self.fall_time_range[0] <= curr_time < self.fall_time_range[1]):
@@ -117,7 +118,7 @@ class ReturnSeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         if max_price is not None:
             if (held_day > 0) and (self.return_time_range[0] <= curr_time < self.return_time_range[1]):
@@ -176,13 +177,14 @@ class OpenDaySeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
-        if history is not None:
-            if 0 < held_day < len(history):
+        lows = self.get_daily('low', history, extra)
+        if lows is not None:
+            if 0 < held_day < len(lows):
                 sell_volume = position.can_use_volume
                 curr_price = quote['lastPrice']
-                open_day_low = history['low'].values[-held_day] * self.open_low_rate
+                open_day_low = lows[-held_day] * self.open_low_rate
 
                 # 建仓日新低破掉卖
                 if curr_price < open_day_low:
@@ -193,7 +195,7 @@ class OpenDaySeller(BaseSeller):
                 if curr_price < get_limit_up_price(code, quote['lastClose']):
                     if self.opening_time_range[0] <= curr_time < self.opening_time_range[1]:
                         curr_volume = quote['volume']
-                        open_day_volume = history['volume'].values[-held_day] * self.open_vol_rate
+                        open_day_volume = self.get_daily('volume', history, extra)[-held_day] * self.open_vol_rate
                         if curr_volume < open_day_volume:
                             self.order_sell(code, quote, sell_volume, '缩开仓日地量')
                             return True
@@ -209,22 +211,23 @@ class MASeller(BaseSeller):
         print(f'跌破{parameters.ma_above}日均线卖出策略', end=' ')
         self.ma_time_range = parameters.ma_time_range
         self.ma_above = parameters.ma_above
+        # 只用到最近 ma_above 天的收盘价
+        self.ma_streams = StreamCache(lambda history: StreamMA(self.ma_above).seed(
+            history['close'].values[-self.ma_above:]))
 
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
-        if history is not None:
+        stream = self.get_stream('ma_streams', code, history, extra)
+        if stream is not None:
             if (held_day > 0) and (self.ma_time_range[0] <= curr_time < self.ma_time_range[1]):
                 sell_volume = position.can_use_volume
 
                 curr_price = quote['lastPrice']
 
-                df = concat_ak_quote_dict(history, quote, curr_date)
-
-                ma_values = MA(df.close.tail(self.ma_above + 1), self.ma_above)
-                ma_value = ma_values[-1]
+                ma_value = stream.peek(curr_price)
 
                 if curr_price <= ma_value - 0.01:
                     self.order_sell(code, quote, sell_volume, f'破{self.ma_above}日均{ma_value:.2f}')
@@ -242,20 +245,20 @@ class CCISeller(BaseSeller):
         self.cci_time_range = parameters.cci_time_range
         self.cci_upper = parameters.cci_upper
         self.cci_lower = parameters.cci_lower
+        self.cci_streams = StreamCache(lambda history: StreamCCI(14).seed(
+            history['close'].values, history['high'].values, history['low'].values))
 
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
-        if (history is not None) and (self.cci_time_range[0] <= curr_time < self.cci_time_range[1]):
+        stream = self.get_stream('cci_streams', code, history, extra)
+        if (stream is not None) and (self.cci_time_range[0] <= curr_time < self.cci_time_range[1]):
             if (held_day > 0) and int(curr_time[-2:]) % 5 == 0:  # 每隔5分钟 CCI 卖出
                 sell_volume = position.can_use_volume
 
-                df = concat_ak_quote_dict(history, quote, curr_date)
-
-                df['CCI'] = CCI(df['close'], df['high'], df['low'], 14)
-                cci = df['CCI'].tail(2).values
+                cci = [stream.last, stream.peek(quote['lastPrice'], quote['high'], quote['low'])]
 
                 if cci[0] > self.cci_lower > cci[1]:  # CCI 下穿
                     self.order_sell(code, quote, sell_volume, f'CCI高于{self.cci_lower}')
@@ -276,20 +279,20 @@ class WRSeller(BaseSeller):
         print('WR上穿卖出策略', end=' ')
         self.wr_time_range = parameters.wr_time_range
         self.wr_cross = parameters.wr_cross
+        self.wr_streams = StreamCache(lambda history: StreamWR(14).seed(
+            history['close'].values, history['high'].values, history['low'].values))
 
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
-        if (history is not None) and (self.wr_time_range[0] <= curr_time < self.wr_time_range[1]):
+        stream = self.get_stream('wr_streams', code, history, extra)
+        if (stream is not None) and (self.wr_time_range[0] <= curr_time < self.wr_time_range[1]):
             if held_day > 0 and int(curr_time[-2:]) % 5 == 0:  # 每隔5分钟 WR 卖出
                 sell_volume = position.can_use_volume
 
-                df = concat_ak_quote_dict(history, quote, curr_date)
-
-                df['WR'] = WR(df['close'], df['high'], df['low'], 14)
-                wr = df['WR'].tail(2).values
+                wr = [stream.last, stream.peek(quote['lastPrice'], quote['high'], quote['low'])]
 
                 if wr[0] < self.wr_cross < wr[1]:  # WR 上穿
                     self.order_sell(code, quote, sell_volume, f'WR上穿{self.wr_cross}卖')
@@ -312,9 +315,10 @@ class VolumeDropSeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
-        if (history is not None) and (self.next_time_range[0] <= curr_time < self.next_time_range[1]):
+        volumes = self.get_daily('volume', history, extra)
+        if (volumes is not None) and (self.next_time_range[0] <= curr_time < self.next_time_range[1]):
             cost_price = position.open_price
             sell_volume = position.can_use_volume
 
@@ -324,7 +328,7 @@ class VolumeDropSeller(BaseSeller):
 
             # 次缩止盈：开盘至今成交量相比买入当日总成交量，缩量达标盈利则卖出，除非涨停
             if held_day > 0 and curr_time == self.next_volume_dec_minute:
-                open_vol = history['volume'].values[-held_day]
+                open_vol = volumes[-held_day]
                 if curr_vol < open_vol * self.next_volume_dec_threshold \
                         and cost_price < curr_price < prev_close * self.next_volume_dec_limit:
                     self.order_sell(code, quote, sell_volume, '次日缩量')
@@ -345,7 +349,7 @@ class DropSeller(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         if (held_day > 0) and (self.drop_time_range[0] <= curr_time < self.drop_time_range[1]):
             sell_volume = position.can_use_volume
@@ -382,7 +386,7 @@ class IncBlocker(BaseSeller):
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         if held_day > 0:
             if quote['lastPrice'] > quote['open'] \
@@ -399,25 +403,21 @@ class UppingBlocker(BaseSeller):
     def __init__(self, strategy_name, delegate, parameters, data_store: Optional[BaseDataStore] = None):
         BaseSeller.__init__(self, strategy_name, delegate, parameters, data_store)
         print('上行趋势禁卖', end=' ')
+        self.macd_streams = StreamCache(lambda history: StreamMACD().seed(history['close'].values))
 
     def check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
-        if history is not None:
+        stream = self.get_stream('macd_streams', code, history, extra)
+        if stream is not None:
             if held_day > 0:
-                df = concat_ak_quote_dict(history, quote, curr_date)
-
-                _, _, df['MACD'] = MACD(df['close'])
-                macd = df['MACD'].tail(2).values
-
-                close = df['close'].tail(2).values
-                high = df['high'].tail(2).values
-                low = df['low'].tail(2).values
+                macd = [stream.last[2], stream.peek(quote['lastPrice'])[2]]
 
-                yesterday_price = close[0] + high[0] + low[0]
-                today_price = close[1] + high[1] + low[1]
+                yesterday_price = self.get_daily('close', history, extra)[-1] \
+                    + self.get_daily('high', history, extra)[-1] + self.get_daily('low', history, extra)[-1]
+                today_price = quote['lastPrice'] + quote['high'] + quote['low']
 
                 if macd[0] < macd[1] and yesterday_price < today_price:  # macd上行 & 价格上行
                     # self.order_sell(code, quote, sell_volume, '上行不卖')
@@ -1,9 +1,14 @@
 from trader.seller_components import *
+from trader.seller_vector import execute_group_sell
 from storage.base_store import BaseDataStore
-from typing import Optional
+from delegate.tick_history import TickBuffer
+from typing import Dict, List, Optional
 
 
 class GroupSellers:
+    vector_min_positions = 32   # 持仓少于这个数量时逐只判断更快，numpy 的固定开销占大头
+    _sells: Optional[List[tuple[str, str]]] = None  # execute_sell 期间记录的 [(code, 委托备注)]
+
     def __init__(self):
         pass
 
@@ -13,10 +18,50 @@ class GroupSellers:
                 parent.__init__(self, strategy_name, delegate, parameters, data_store)
         print('>> 初始化完成')
 
+    def group_components(self) -> list:
+        return [parent for parent in self.__class__.__bases__ if parent.__name__ != 'GroupSellers']
+
+    def order_sell(self, code, quote, volume, remark, log=True) -> None:
+        BaseSeller.order_sell(self, code, quote, volume, remark, log)
+        if self._sells is not None and volume > 0:
+            self._sells.append((code, remark))
+
+    def execute_sell(
+        self,
+        quotes: Dict[str, Dict],
+        curr_date: str,
+        curr_time: str,
+        positions: List[XtPosition],
+        held_days: Dict[str, int],
+        max_prices: Dict[str, float],
+        cache_history: Dict[str, pd.DataFrame],
+        today_ticks: Dict[str, TickBuffer] = None,
+        extra_datas: Dict[str, any] = None,
+    ) -> List[tuple[str, str]]:
+        """ 返回本次委托卖出的 [(code, 委托备注)]，按委托顺序，逐只判断和向量化两条路径相同 """
+        self._sells = []
+        try:
+            # 阈值类卖出对所有持仓一次性向量化计算，判断顺序与 group_check_sell 相同
+            if len(positions) < self.vector_min_positions:
+                BaseSeller.execute_sell(
+                    self, quotes, curr_date, curr_time, positions,
+                    held_days, max_prices, cache_history, today_ticks, extra_datas)
+            else:
+                if extra_datas is None:
+                    extra_datas = self.indicator_snapshot
+
+                # 返回值只含向量化规则的卖出，这里用 order_sell 记录的完整列表（含逐只判断的策略）
+                execute_group_sell(
+                    self, self.group_components(), quotes, curr_date, curr_time, positions,
+                    held_days, max_prices, cache_history, today_ticks, extra_datas)
+            return self._sells
+        finally:
+            self._sells = None
+
     def group_check_sell(
             self, code: str, quote: Dict, curr_date: str, curr_time: str,
             position: XtPosition, held_day: int, max_price: Optional[float],
-            history: Optional[pd.DataFrame], ticks: Optional[list[list]], extra: any,
+            history: Optional[pd.DataFrame], ticks: Optional[TickBuffer], extra: any,
     ) -> bool:
         sold = False
         for parent in self.__class__.__bases__:
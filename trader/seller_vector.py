@@ -0,0 +1,254 @@
+# 组合卖出策略的向量化执行：每个 tick 把所有持仓的 成本 / 最高价 / 现价 / 持仓天数 收集成数组一次，
+# 只依赖这几个数值的阈值类卖出（硬止损止盈、换仓、回落、回撤、高开出货、上涨禁卖）用 numpy 广播一次算完，
+# 分级表 fall_from_top / return_of_profit / drop_out_limits 按 (持仓, 分级) 二维比较，每行取第一个满足的分级
+# 依赖日线或 tick 的卖出仍逐只调用 check_sell，按组合里父类的顺序与向量化的结果交错判断，
+# 先满足条件的卖出或阻断生效，与 GroupSellers.group_check_sell 逐只判断的结果和下单顺序完全一致
+
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from trader.seller_components import HardSeller, SwitchSeller, FallSeller, ReturnSeller, DropSeller, IncBlocker
+
+
+# ==============
+#  收集持仓
+# ==============
+
+GATHER_COLUMNS = ['held_day', 'has_max', 'max_price', 'cost', 'price', 'open', 'last_close']
+ROUNDED_COLUMNS = ['open_3', 'high_3', 'low_3', 'price_3']  # 与 check_sell 一样用 Python 的 round，numpy 的 round 舍入方式不同
+
+# 用到 ROUNDED_COLUMNS 的规则
+ROUNDED_RULES = set()
+
+
+def gather_positions(
+    positions: List,
+    quotes: Dict[str, Dict],
+    held_days: Dict[str, int],
+    max_prices: Dict[str, float],
+    rounded: bool = False,
+) -> Dict[str, any]:
+    """ 有行情、有持仓天数且未停牌的持仓，按 positions 的顺序一次收集成 { 列名: ndarray } """
+    columns = GATHER_COLUMNS + ROUNDED_COLUMNS if rounded else GATHER_COLUMNS
+    rows, values = [], []
+    for position in positions:
+        code = position.stock_code
+        if (code in quotes) and (code in held_days):
+            quote = quotes[code]
+            if quote['open'] > 0 and quote['volume'] > 0:  # 确认当前股票没有停牌
+                max_price = max_prices[code] if code in max_prices else None
+                rows.append((position, quote))
+                value = (
+                    held_days[code], max_price is not None, np.nan if max_price is None else max_price,
+                    position.open_price, quote['lastPrice'], quote['open'], quote['lastClose'],
+                )
+                if rounded:
+                    value += (round(quote['open'], 3), round(quote['high'], 3), round(quote['low'], 3),
+                              round(quote['lastPrice'], 3))
+                values.append(value)
+
+    table = np.array(values, dtype=np.float64).reshape(len(values), len(columns))
+    data = {name: table[:, j] for j, name in enumerate(columns)}
+    data['has_max'] = data['has_max'] > 0
+    data['rows'] = rows
+    return data
+
+
+# ==============
+#  向量化规则
+# ==============
+# 每条规则返回 (fired, remarks, messages)：
+#   fired    每只持仓是否满足条件（卖出或阻断）
+#   remarks  { 行号: 委托备注 }，阻断器为空
+#   messages { 行号: 下单前要打的日志 }
+
+def _in_range(time_range: list, curr_time: str) -> bool:
+    return time_range[0] <= curr_time < time_range[1]
+
+
+def _first_tier(matched: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # matched: (持仓, 分级)，返回 (是否有分级满足, 第一个满足的分级)
+    return matched.any(axis=1), matched.argmax(axis=1)
+
+
+def _none(data: Dict) -> tuple:
+    return np.zeros(len(data['rows']), bool), {}, {}
+
+
+def _hard_rule(seller, data: Dict, curr_time: str) -> tuple:
+    if not _in_range(seller.hard_time_range, curr_time):
+        return _none(data)
+
+    active = data['held_day'] > 0
+    cost, price = data['cost'], data['price']
+    loss = active & (price <= cost * (seller.risk_limit + data['held_day'] * seller.risk_tight))
+    earn = active & ~loss & (price >= cost * seller.earn_limit)
+    remarks = {i: f'跌{int((1 - seller.risk_limit) * 100)}%硬止损' for i in np.flatnonzero(loss).tolist()}
+    remarks.update({i: f'涨{int((seller.earn_limit - 1) * 100)}%硬止盈' for i in np.flatnonzero(earn).tolist()})
+    return loss | earn, remarks, {}
+
+
+def _switch_rule(seller, data: Dict, curr_time: str) -> tuple:
+    if not _in_range(seller.switch_time_range, curr_time):
+        return _none(data)
+
+    held_day = data['held_day']
+    fired = (held_day >= seller.switch_hold_days) \
+        & (data['price'] < data['cost'] * (1 + held_day * seller.switch_demand_daily_up))
+    return fired, {i: f'{seller.switch_hold_days}日换仓卖单' for i in np.flatnonzero(fired).tolist()}, {}
+
+
+def _profit_tiers(seller, data: Dict, curr_time: str, time_range: list, tiers: list,
+                  below: Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray], np.ndarray],
+                  remark: Callable[[float, float], str]) -> tuple:
+    # FallSeller / ReturnSeller：最高价落在 [cost * inc_min, cost * inc_max) 且现价跌破该分级的止盈线
+    if len(tiers) == 0 or not _in_range(time_range, curr_time):
+        return _none(data)
+
+    table = np.array(tiers, dtype=np.float64)
+    inc_min, inc_max, threshold = table[:, 0], table[:, 1], table[:, 2]
+    cost = data['cost'][:, None]
+    max_price = data['max_price'][:, None]
+
+    matched = (cost * inc_min <= max_price) & (max_price < cost * inc_max) \
+        & below(data['price'][:, None], max_price, cost, threshold)
+    fired, tier = _first_tier(matched)
+    fired &= (data['held_day'] > 0) & data['has_max']
+
+    remarks, messages = {}, {}
+    for i in np.flatnonzero(fired).tolist():
+        inc_min, inc_max, fall = tiers[tier[i]]
+        remarks[i] = remark(inc_min, fall)
+        messages[i] = f'[Sell]' \
+            f'cost_p:{data["rows"][i][0].open_price} max_p:{float(data["max_price"][i])} ' \
+            f'inc_min:{inc_min} inc_max:{inc_max}'
+    return fired, remarks, messages
+
+
+def _fall_rule(seller, data: Dict, curr_time: str) -> tuple:
+    return _profit_tiers(
+        seller, data, curr_time, seller.fall_time_range, seller.fall_from_top,
+        lambda price, max_price, cost, fall: price < max_price * (1 - fall),
+        lambda inc_min, fall: f'涨{int((inc_min - 1) * 100)}%回落{int(fall * 100)}%')
+
+
+def _return_rule(seller, data: Dict, curr_time: str) -> tuple:
+    return _profit_tiers(
+        seller, data, curr_time, seller.return_time_range, seller.return_of_profit,
+        lambda price, max_price, cost, fall: price < max_price - (max_price - cost) * fall,
+        lambda inc_min, fall: f'涨{int((inc_min - 1) * 100)}%回撤{int(fall * 100)}%')
+
+
+def _drop_rule(seller, data: Dict, curr_time: str) -> tuple:
+    tiers = seller.drop_out_limits
+    if len(tiers) == 0 or not _in_range(seller.drop_time_range, curr_time):
+        return _none(data)
+
+    opn, low, hgh, clz = data['open_3'], data['low_3'], data['high_3'], data['price_3']
+    # 下跌过程且实心大于上影线
+    active = (data['held_day'] > 0) & (data['price'] < data['open']) & (clz == low) & (hgh - opn < opn - clz)
+
+    table = np.array(tiers, dtype=np.float64)
+    last_close = data['last_close'][:, None]
+    matched = (last_close * table[:, 0] <= opn[:, None]) & (opn[:, None] < last_close * table[:, 1]) \
+        & ((opn - clz)[:, None] > last_close * table[:, 2])
+    fired, tier = _first_tier(matched)
+    fired &= active
+
+    remarks = {}
+    for i in np.flatnonzero(fired).tolist():
+        inc_min, _, drop_threshold = tiers[tier[i]]
+        remarks[i] = f'高开{int((inc_min - 1) * 100)}跌{int(drop_threshold * 100)}%'
+    return fired, remarks, {}
+
+
+def _inc_block_rule(seller, data: Dict, curr_time: str) -> tuple:
+    fired = (data['held_day'] > 0) & (data['price'] > data['open']) \
+        & (data['high_3'] == data['price_3']) & (data['open_3'] == data['low_3'])
+    return fired, {}, {}
+
+
+# 可以向量化的卖出策略 -> 规则，没有列出的策略逐只调用 check_sell
+VECTOR_RULES: Dict[type, Callable] = {
+    HardSeller: _hard_rule,
+    SwitchSeller: _switch_rule,
+    FallSeller: _fall_rule,
+    ReturnSeller: _return_rule,
+    DropSeller: _drop_rule,
+    IncBlocker: _inc_block_rule,
+}
+ROUNDED_RULES.update({DropSeller, IncBlocker})
+
+
+# ==============
+#  执行
+# ==============
+
+def evaluate_group_sell(
+    seller,
+    components: List[type],
+    data: Dict[str, any],
+    curr_time: str,
+) -> Dict[type, tuple]:
+    """ 计算组合里所有可以向量化的卖出策略，返回 { 策略类: (fired, remarks, messages) } """
+    return {
+        component: VECTOR_RULES[component](seller, data, curr_time)
+        for component in components if component in VECTOR_RULES
+    }
+
+
+def execute_group_sell(
+    seller,
+    components: List[type],
+    quotes: Dict[str, Dict],
+    curr_date: str,
+    curr_time: str,
+    positions: List,
+    held_days: Dict[str, int],
+    max_prices: Dict[str, float],
+    cache_history: Dict,
+    today_ticks: Optional[Dict] = None,
+    extra_datas: Optional[Dict] = None,
+) -> List[tuple[str, str]]:
+    """ 按 components 的先后顺序判断每只持仓，返回本次向量化规则卖出的 [(code, 委托备注)] """
+    today_ticks = {} if today_ticks is None else today_ticks
+    extra_datas = {} if extra_datas is None else extra_datas
+
+    rounded = any(component in ROUNDED_RULES for component in components)
+    data = gather_positions(positions, quotes, held_days, max_prices, rounded)
+    results = evaluate_group_sell(seller, components, data, curr_time)
+
+    # 每只持仓第一个满足条件的向量化规则，之前的逐只策略仍要依次判断
+    count = len(components)
+    decision = np.full(len(data['rows']), count)
+    for j in reversed(range(count)):
+        if components[j] in results:
+            decision[results[components[j]][0]] = j
+    first_scalar = next((j for j in range(count) if components[j] not in results), count)
+
+    sells = []
+    for i in np.flatnonzero(np.minimum(decision, first_scalar) < count).tolist():
+        position, quote = data['rows'][i]
+        code = position.stock_code
+        d = int(decision[i])
+        for component in components[:d]:
+            if component not in results and component.check_sell(
+                seller, code=code, quote=quote, curr_date=curr_date, curr_time=curr_time,
+                position=position, held_day=held_days[code],
+                max_price=max_prices[code] if code in max_prices else None,
+                history=cache_history[code] if code in cache_history else None,
+                ticks=today_ticks[code] if code in today_ticks else None,
+                extra=extra_datas[code] if code in extra_datas else None,
+            ):
+                break
+        else:
+            if d < count:
+                _, remarks, messages = results[components[d]]
+                if i in remarks:  # 阻断器满足时不卖，也不再判断后面的策略
+                    if i in messages:
+                        logging.warning(messages[i])
+                    seller.order_sell(code, quote, position.can_use_volume, remarks[i])
+                    sells.append((code, remarks[i]))
+    return sells